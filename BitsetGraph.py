@@ -0,0 +1,295 @@
+from time import time
+import random
+
+# BitsetGraph
+#
+# Undirected graph
+#
+# An alternative to OptimizedGraph for the "add an edge and check" search. Instead of caching the square adjacency
+#  matrix, every vertex stores its neighbourhood as a single Python int used as a bitset: bit x of
+#  self.neighbourhoods[v] is set iff there is an edge from v to x.
+#
+# Example for the path 0 - 1 - 2:
+#
+# self.neighbourhoods: [0b010,
+#                       0b101,
+#                       0b010]
+#
+# Python ints are arbitrary precision, so one neighbourhood is n/64 machine words and the set operations below are
+#  performed word-at-a-time by the interpreter.
+#
+# The point of this structure is the cycle test on edge insertion. If the graph contains no c3, c4, or c6 cycles,
+#  adding the edge (a, b) creates one exactly when there is a path of length 2, 3 or 5 from a to b. With
+#  W1(v) = N(v), W2(v) = the union of N(x) for x in N(v) and W3(v) = the union of N(y) for y in W2(v):
+#
+#  c3: N(a) & N(b) != 0
+#  c4: W2(a) & N(b) != 0
+#  c6: W2(a) & W3(b) != 0
+#
+# These are walk counts rather than path counts, but since a and b are not adjacent and the graph has no c3 or c4,
+#  any walk of length 3 or 5 from a to b is a path (removing a repeated section would leave a walk of length 1 or 3).
+#
+# Unlike OptimizedGraph, nothing is cached, so writes are O(1) and the check costs O(deg^2 * n/64).
+#
+# push_state() and pop_state() work as in OptimizedGraph so that searches can use either class; here the log only
+#  needs the edges that were written.
+class BitsetGraph:
+    # __init__()
+    #
+    # constructor
+    #
+    # performs initialization of graph structure
+    def __init__(self, size):
+        self.size = size
+        self.edge_count = 0
+        self.neighbourhoods = [0] * size
+        self.undo_log = None
+        self.undo_marks = []
+
+    # write_adjacency_matrix()
+    #
+    # Sets or clears the edge between row and col in both neighbourhoods.
+    #
+    # Same contract as OptimizedGraph.write_adjacency_matrix()
+    def write_adjacency_matrix(self, row, col, val):
+        # Since we assume a simple graph, no node connects to itself.
+        if row == col:
+            raise ValueError('The BitsetGraph data structure assumes a simple graph; thus writes that could create \
+            loops are not allowed. row cannot equal col.')
+
+        present = self.check_edge_present(row, col)
+        if val and not present:
+            self.neighbourhoods[row] |= 1 << col
+            self.neighbourhoods[col] |= 1 << row
+            self.edge_count += 1
+        elif present and not val:
+            self.neighbourhoods[row] &= ~(1 << col)
+            self.neighbourhoods[col] &= ~(1 << row)
+            self.edge_count -= 1
+        else:
+            return
+
+        if self.undo_log is not None:
+            self.undo_log.append((row, col, val))
+
+    # push_state()
+    #
+    # Marks the current state of the graph so that pop_state() can return to it. Calls can be nested.
+    #
+    # Same contract as OptimizedGraph.push_state()
+    def push_state(self):
+        if self.undo_log is None:
+            self.undo_log = []
+        self.undo_marks.append(len(self.undo_log))
+
+    # pop_state()
+    #
+    # Undoes every write since the matching push_state()
+    #
+    # Same contract as OptimizedGraph.pop_state()
+    def pop_state(self):
+        mark = self.undo_marks.pop()
+        undo_log = self.undo_log
+        # stop logging first so the undoing writes aren't logged
+        self.undo_log = None
+        while len(undo_log) > mark:
+            row, col, val = undo_log.pop()
+            self.write_adjacency_matrix(row, col, not val)
+        if self.undo_marks:
+            self.undo_log = undo_log
+
+    # add_edge()
+    #
+    # Adds an edge to the graph from vertex a to vertex b
+    #
+    # Equivalent to calling write_adjacency_matrix(a, b, True)
+    def add_edge(self, a, b):
+        return self.write_adjacency_matrix(a, b, True)
+
+    # remove_edge()
+    #
+    # Removes an edge from the graph from vertex a to vertex b
+    #
+    # Equivalent to calling write_adjacency_matrix(a, b, False)
+    def remove_edge(self, a, b):
+        return self.write_adjacency_matrix(a, b, False)
+
+    # check_edge_present()
+    #
+    # Returns True iff an edge is present from a to b in the graph represented by
+    #  this data structure.
+    def check_edge_present(self, a, b):
+        return (self.neighbourhoods[a] >> b) & 1 == 1
+
+    # read_adjacency_matrix()
+    #
+    # Returns 1 if there is an edge between row and col; 0 otherwise
+    def read_adjacency_matrix(self, row, col):
+        if self.check_edge_present(row, col):
+            return 1
+        return 0
+
+    # get_full_adjacency_matrix()
+    #
+    # converts the neighbourhoods into a full adjacency matrix and returns it
+    #
+    # NOT OPTIMIZED
+    #
+    # returns a 2D array
+    def get_full_adjacency_matrix(self):
+        matrix = []
+        for row_index in range(0, self.size):
+            row = []
+            for col_index in range(0, self.size):
+                row.append(self.read_adjacency_matrix(row_index, col_index))
+            matrix.append(row)
+        return matrix
+
+    # union_of_neighbourhoods()
+    #
+    # Returns the bitwise or of the neighbourhoods of every vertex in the bitset mask
+    #
+    # If mask is the set of vertices reachable from v by walks of length k, the result is the set reachable by walks
+    #  of length k + 1.
+    def union_of_neighbourhoods(self, mask):
+        neighbourhoods = self.neighbourhoods
+        result = 0
+        while mask:
+            # isolate the lowest set bit, look up its neighbourhood, then clear it
+            low = mask & -mask
+            result |= neighbourhoods[low.bit_length() - 1]
+            mask ^= low
+        return result
+
+    # edge_cycle_length()
+    #
+    # Returns the length of the forbidden cycle (3, 4 or 6) that adding the edge (a, b) would create, or 0 if adding
+    #  it keeps the graph free of c3, c4 and c6 cycles.
+    #
+    # Does not modify the graph.
+    #
+    # Assumes the graph currently follows the rules and that a and b are distinct and not adjacent. See class docs.
+    def edge_cycle_length(self, a, b):
+        neighbourhood_a = self.neighbourhoods[a]
+        neighbourhood_b = self.neighbourhoods[b]
+
+        # c3: a common neighbour
+        if neighbourhood_a & neighbourhood_b:
+            return 3
+
+        # c4: a path a - x - y - b
+        two_a = self.union_of_neighbourhoods(neighbourhood_a)
+        if two_a & neighbourhood_b:
+            return 4
+
+        # c6: a path a - x - y - z - w - b
+        three_b = self.union_of_neighbourhoods(self.union_of_neighbourhoods(neighbourhood_b))
+        if two_a & three_b:
+            return 6
+
+        return 0
+
+    # can_add_edge()
+    #
+    # Returns True iff adding an edge from a to b would keep the graph free of c3, c4, and c6 cycles.
+    #
+    # READ ONLY. Same contract as OptimizedGraph.can_add_edge()
+    def can_add_edge(self, a, b):
+        # loops and duplicate edges can't be added
+        if a == b or self.check_edge_present(a, b):
+            return False
+        return self.edge_cycle_length(a, b) == 0
+
+    # does_follow_rules()
+    #
+    # Returns true if the graph represented by this data structure follows the rules of this research
+    #
+    # A graph follows the rules if it contains no c3, c4, or c6 cycles.
+    #
+    # The edges are replayed one at a time into an empty BitsetGraph. The first edge that closes a forbidden cycle is
+    #  caught by edge_cycle_length() because the graph before it still followed the rules.
+    def does_follow_rules(self):
+        replay = BitsetGraph(self.size)
+        for a in range(0, self.size):
+            # only replay each edge once, from its larger endpoint
+            lower = self.neighbourhoods[a] & ((1 << a) - 1)
+            while lower:
+                low = lower & -lower
+                b = low.bit_length() - 1
+                if replay.edge_cycle_length(a, b):
+                    return False
+                replay.add_edge(a, b)
+                lower ^= low
+        return True
+
+
+# test()
+#
+# Uses assert keyword to test the functionality of BitsetGraph
+#
+# numpy is required
+def test():
+    import numpy
+
+    # reference check straight from the matrix powers; see does_follow_rules_optimized() in graph.py
+    def matrix_follows_rules(matrix):
+        squared = numpy.dot(matrix, matrix)
+        cubed = numpy.dot(squared, matrix)
+        if numpy.trace(cubed) > 0:
+            return False
+        off_diagonal = 1 - numpy.eye(len(matrix), dtype=int)
+        if numpy.any(squared * off_diagonal > 1):
+            return False
+        if numpy.any((cubed > 1) & (matrix == 0) & (off_diagonal == 1)):
+            return False
+        return True
+
+    print 'Testing random graphs up to 16x16 for correctness...'
+    rng = random.Random(0)
+    for size in range(2, 17):
+        for trial in range(0, 20):
+            g = BitsetGraph(size)
+            for step in range(0, size * 2):
+                a = rng.randrange(size)
+                b = rng.randrange(size)
+                if a == b or g.check_edge_present(a, b):
+                    continue
+
+                predicted = g.edge_cycle_length(a, b)
+                g.add_edge(a, b)
+
+                matrix = numpy.array(g.get_full_adjacency_matrix())
+                assert (predicted == 0) == matrix_follows_rules(matrix)
+                assert g.does_follow_rules() == matrix_follows_rules(matrix)
+
+                # keep the invariant edge_cycle_length() relies on
+                if predicted:
+                    g.remove_edge(a, b)
+        print 'Passed random graphs of size %s' % size
+    print 'Done testing correctness.'
+
+    print 'Testing up to a 41x41 for speed checking cycles...'
+    for size in range(2, 42):
+        g = BitsetGraph(size)
+
+        check_count = 0
+        start = time()
+
+        for i in range(0, size):
+            for j in range(0, size):
+                if i != j and not g.check_edge_present(i, j):
+                    if not g.edge_cycle_length(i, j):
+                        g.add_edge(i, j)
+                    check_count += 1
+        end = time()
+
+        duration = end - start
+        duration_per_check = duration / max(check_count, 1)
+
+        print 'Checked %s edges (size=%s, kept %s) in %s seconds (%s seconds per check)' % (check_count, size, g.edge_count, duration, duration_per_check)
+    print 'Done testing speed.'
+
+
+# If somebody ever runs this file, invoke test() to test BitsetGraph()
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,340 @@
+import numpy
+from OptimizedGraph import OptimizedGraph
+import OptimizedGraph as optimized_graph_module
+
+# Numba is optional. Without it the kernels below still run, as plain Python over numpy arrays, which is only useful
+#  for checking them; FastOptimizedGraph falls back to the pure Python OptimizedGraph instead.
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        def decorate(function):
+            return function
+        return decorate
+
+
+# adjacent()
+#
+# Returns True iff a and b are adjacent in a packed lower triangle (see OptimizedGraph class docs)
+@njit(cache=True)
+def adjacent(adjacency, a, b):
+    if a == b:
+        return False
+    if a < b:
+        a, b = b, a
+    index = a * (a - 1) // 2 + b
+    return (adjacency[index >> 3] >> (index & 7)) & 1 == 1
+
+
+# triangle_cell()
+#
+# Returns the index of cell (a, b) of a symmetric matrix stored as a lower triangle with the diagonal
+@njit(cache=True)
+def triangle_cell(a, b):
+    if a < b:
+        a, b = b, a
+    return a * (a + 1) // 2 + b
+
+
+# is_cube_violation()
+#
+# Same as OptimizedGraph.is_cube_violation() on typed arrays
+@njit(cache=True)
+def is_cube_violation(adjacency, cube, a, b):
+    if a != b and cube[triangle_cell(a, b)] > 1 and not adjacent(adjacency, a, b):
+        return 1
+    return 0
+
+
+# add_to_cube()
+#
+# Adds change to cell (a, b) of the cube and returns the change to (cube_trace, cube_violations) it causes
+#
+# The violation of a cell is taken out before the change and put back after it, so applying several changes to the
+#  same cell in any order leaves the count correct.
+@njit(cache=True)
+def add_to_cube(adjacency, cube, a, b, change):
+    cell = triangle_cell(a, b)
+    if a == b:
+        cube[cell] += change
+        return change, 0
+    before = is_cube_violation(adjacency, cube, a, b)
+    cube[cell] += change
+    return 0, is_cube_violation(adjacency, cube, a, b) - before
+
+
+# link()
+#
+# Appends b to the padded neighbour list of a: neighbour_lists[a, :degrees[a]] are the neighbours of a, in no order
+@njit(cache=True)
+def link(neighbour_lists, degrees, a, b):
+    neighbour_lists[a, degrees[a]] = b
+    degrees[a] += 1
+
+
+# unlink()
+#
+# Removes b from the padded neighbour list of a by moving the last neighbour into its place
+@njit(cache=True)
+def unlink(neighbour_lists, degrees, a, b):
+    last = degrees[a] - 1
+    for k in range(0, last + 1):
+        if neighbour_lists[a, k] == b:
+            neighbour_lists[a, k] = neighbour_lists[a, last]
+            break
+    degrees[a] = last
+
+
+# write_edge()
+#
+# The work of OptimizedGraph.write_adjacency_matrix() for a write that changes the graph: flips the edge (row, col)
+#  (row > col) to val and updates the square and cube with the same A^2 D + (A'^2 - A^2) A' rule. See OptimizedGraph
+#  class docs.
+#
+# neighbour_lists, degrees The padded neighbour lists (see link()), updated along with the edge
+# square_changes A scratch int array of length 2 * size
+#
+# Like OptimizedGraph, the rows and columns are recomputed by walking neighbourhoods, so a write costs
+#  O(n * max degree) rather than O(n^2).
+#
+# Returns the change to (cube_trace, square_violations, cube_violations)
+@njit(cache=True)
+def write_edge(adjacency, square, cube, size, row, col, val, neighbour_lists, degrees, square_changes):
+    trace_change = 0
+    square_violation_change = 0
+    cube_violation_change = 0
+    sign = 1 if val else -1
+
+    # cell (row, col) is the only cell whose violation depends on the adjacency cell being written
+    cube_violation_change -= is_cube_violation(adjacency, cube, row, col)
+
+    # A^2 D, from the square before this write; cell (row, col) is left out of the violation count until the end
+    for i in range(0, size):
+        if i >= col:
+            old_square = square[triangle_cell(i, row)]
+            if old_square != 0:
+                if i == row:
+                    cube[triangle_cell(i, col)] += sign * old_square
+                else:
+                    traced, violations = add_to_cube(adjacency, cube, i, col, sign * old_square)
+                    trace_change += traced
+                    cube_violation_change += violations
+        if i >= row:
+            old_square = square[triangle_cell(i, col)]
+            if old_square != 0:
+                traced, violations = add_to_cube(adjacency, cube, i, row, sign * old_square)
+                trace_change += traced
+                cube_violation_change += violations
+
+    # flip the edge
+    index = row * (row - 1) // 2 + col
+    if val:
+        adjacency[index >> 3] |= 1 << (index & 7)
+        link(neighbour_lists, degrees, row, col)
+        link(neighbour_lists, degrees, col, row)
+    else:
+        adjacency[index >> 3] &= ~(1 << (index & 7))
+        unlink(neighbour_lists, degrees, row, col)
+        unlink(neighbour_lists, degrees, col, row)
+
+    # recompute column col and row row of the square, remembering the change of each cell: square_changes[i] for
+    #  cell (i, col) and square_changes[size + i] for cell (i, row)
+    for k in range(0, 2 * size):
+        square_changes[k] = 0
+    for k in range(0, 2 * size):
+        i = k % size
+        vertex = col if k < size else row
+        # cell (row, col) is in both halves; recompute it once
+        if k >= size and i == col:
+            continue
+        total = 0
+        for k_x in range(0, degrees[vertex]):
+            if adjacent(adjacency, i, neighbour_lists[vertex, k_x]):
+                total += 1
+        cell = triangle_cell(i, vertex)
+        old = square[cell]
+        if old != total:
+            if i != vertex:
+                if old > 1:
+                    square_violation_change -= 1
+                if total > 1:
+                    square_violation_change += 1
+            square[cell] = total
+            square_changes[k] = total - old
+
+    # (A'^2 - A^2) A': every changed square cell (p, q), p >= q, adds its change to (p, j) for each neighbour j of q,
+    #  and by symmetry to (q, j) for each neighbour j of p
+    for k in range(0, 2 * size):
+        change = square_changes[k]
+        if change == 0:
+            continue
+        i = k % size
+        vertex = col if k < size else row
+        p = max(i, vertex)
+        q = min(i, vertex)
+        for k_j in range(0, degrees[q]):
+            j = neighbour_lists[q, k_j]
+            if p >= j:
+                if p == row and j == col:
+                    cube[triangle_cell(p, j)] += change
+                else:
+                    traced, violations = add_to_cube(adjacency, cube, p, j, change)
+                    trace_change += traced
+                    cube_violation_change += violations
+        if p == q:
+            continue
+        for k_j in range(0, degrees[p]):
+            j = neighbour_lists[p, k_j]
+            if q >= j:
+                if q == row and j == col:
+                    cube[triangle_cell(q, j)] += change
+                else:
+                    traced, violations = add_to_cube(adjacency, cube, q, j, change)
+                    trace_change += traced
+                    cube_violation_change += violations
+
+    cube_violation_change += is_cube_violation(adjacency, cube, row, col)
+    return trace_change, square_violation_change, cube_violation_change
+
+
+# can_add_edge()
+#
+# Same as OptimizedGraph.can_add_edge() on typed arrays: walks the padded neighbour lists of a and b, so the cost is
+#  O(deg(a) * deg(b)) like the Python version
+@njit(cache=True)
+def can_add_edge(adjacency, square, cube, neighbour_lists, degrees, a, b):
+    if a == b or adjacent(adjacency, a, b):
+        return False
+    if square[triangle_cell(a, b)] > 0:
+        return False
+    for k_x in range(0, degrees[a]):
+        if square[triangle_cell(neighbour_lists[a, k_x], b)] > 0:
+            return False
+    for k_x in range(0, degrees[a]):
+        x = neighbour_lists[a, k_x]
+        for k_y in range(0, degrees[b]):
+            if cube[triangle_cell(x, neighbour_lists[b, k_y])] > 0:
+                return False
+    return True
+
+
+# CompiledOptimizedGraph
+#
+# Undirected graph
+#
+# OptimizedGraph with the two hot paths, write_adjacency_matrix() and can_add_edge(), done by the compiled kernels
+#  above. The structures have the same packed lower-triangle layout as OptimizedGraph but are numpy arrays so that the
+#  kernels can work on them directly: adjacency_structure is uint8 bits, square_adjacency_structure is uint16 and
+#  cube_adjacency_structure is int32 (int rather than uint so that the kernel can apply a cell's changes in any order).
+#
+# The kernels can't use the neighbour sets, so the neighbourhoods are also kept as padded arrays they can walk:
+#  neighbour_lists[v, :degrees[v]] are the neighbours of v (see link()). The neighbour sets are still kept so that
+#  everything else OptimizedGraph offers (canonical labelling, the search's degree bookkeeping) works unchanged.
+#
+# push_state() and pop_state() keep an edge-only log, like BitsetGraph: undoing a write is another compiled write.
+#
+# Only worth using when Numba is installed; see FastOptimizedGraph.
+class CompiledOptimizedGraph(OptimizedGraph):
+    # __init__()
+    #
+    # constructor
+    def __init__(self, size):
+        OptimizedGraph.__init__(self, size)
+        self.adjacency_structure = numpy.zeros(len(self.adjacency_structure), dtype=numpy.uint8)
+        self.square_adjacency_structure = numpy.zeros(len(self.square_adjacency_structure), dtype=numpy.uint16)
+        self.cube_adjacency_structure = numpy.zeros(len(self.cube_adjacency_structure), dtype=numpy.int32)
+        self.square_changes = numpy.zeros(2 * size, dtype=numpy.int64)
+        self.neighbour_lists = numpy.zeros((size, max(size - 1, 1)), dtype=numpy.int32)
+        self.degrees = numpy.zeros(size, dtype=numpy.int32)
+
+    # write_adjacency_matrix()
+    #
+    # Same contract as OptimizedGraph.write_adjacency_matrix()
+    def write_adjacency_matrix(self, row, col, val):
+        if row == col:
+            raise ValueError('The OptimizedGraph data structure assumes a simple graph; thus writes that could create \
+            loops are not allowed. row cannot equal col.')
+        if col > row:
+            row, col = col, row
+        if self.read_adjacency_matrix_bool(row, col) == bool(val):
+            return
+
+        self.prepare_write(row, col)
+        trace_change, square_violation_change, cube_violation_change = write_edge(
+            self.adjacency_structure, self.square_adjacency_structure, self.cube_adjacency_structure, self.size,
+            row, col, bool(val), self.neighbour_lists, self.degrees, self.square_changes)
+        self.cube_trace += trace_change
+        self.square_violations += square_violation_change
+        self.cube_violations += cube_violation_change
+
+        if val:
+            self.neighbours[row].add(col)
+            self.neighbours[col].add(row)
+        else:
+            self.neighbours[row].discard(col)
+            self.neighbours[col].discard(row)
+
+        if self.undo_log is not None:
+            self.undo_log.append((row, col, val))
+
+    # can_add_edge()
+    #
+    # Same contract as OptimizedGraph.can_add_edge()
+    def can_add_edge(self, a, b):
+        return can_add_edge(self.adjacency_structure, self.square_adjacency_structure, self.cube_adjacency_structure,
+                            self.neighbour_lists, self.degrees, a, b)
+
+    # pop_state()
+    #
+    # Undoes every write since the matching push_state() by writing each edge back
+    def pop_state(self):
+        mark = self.undo_marks.pop()
+        undo_log = self.undo_log
+        # stop logging first so the undoing writes aren't logged
+        self.undo_log = None
+        while len(undo_log) > mark:
+            row, col, val = undo_log.pop()
+            self.write_adjacency_matrix(row, col, not val)
+        if self.undo_marks:
+            self.undo_log = undo_log
+
+    # unshare()
+    #
+    # Same as OptimizedGraph.unshare(); slicing a numpy array doesn't copy it, so copy() is used instead
+    def unshare(self):
+        self.adjacency_structure = self.adjacency_structure.copy()
+        self.square_adjacency_structure = self.square_adjacency_structure.copy()
+        self.cube_adjacency_structure = self.cube_adjacency_structure.copy()
+        self.square_changes = self.square_changes.copy()
+        self.neighbour_lists = self.neighbour_lists.copy()
+        self.degrees = self.degrees.copy()
+        self.neighbours = list(self.neighbours)
+        self.shared_neighbour_sets = set(range(0, self.size))
+        self.shared = False
+
+
+# The graph class searches should use: the compiled one when Numba is installed, the pure Python one otherwise
+if NUMBA_AVAILABLE:
+    FastOptimizedGraph = CompiledOptimizedGraph
+else:
+    FastOptimizedGraph = OptimizedGraph
+
+
+# test()
+#
+# Runs the OptimizedGraph tests against CompiledOptimizedGraph
+#
+# Without Numba the kernels run as plain Python over numpy arrays, which checks them but is far too slow for the
+#  speed tests, so those are skipped
+def test():
+    if not NUMBA_AVAILABLE:
+        print 'Numba is not installed; testing the kernels as plain Python'
+    optimized_graph_module.test(CompiledOptimizedGraph, speed=NUMBA_AVAILABLE)
+
+
+# If somebody ever runs this file, invoke test() to test CompiledOptimizedGraph()
+if __name__ == '__main__':
+    test()
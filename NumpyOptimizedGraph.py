@@ -0,0 +1,239 @@
+import numpy
+from OptimizedGraph import OptimizedGraph
+import OptimizedGraph as optimized_graph_module
+
+# NumpyOptimizedGraph
+#
+# Undirected graph
+#
+# OptimizedGraph with the adjacency, square and cube kept as full n x n numpy arrays and updated with whole-row
+#  vector operations instead of cell by cell.
+#
+# Writing the edge (a, b) changes the adjacency matrix by D = s(E_ab + E_ba), with s = +1 to add it and -1 to remove
+#  it. With A the adjacency matrix before the write, A' = A + D after it, and A[:, a] written c_a:
+#
+#  A'^2 - A^2 = AD + DA + D^2
+#
+#  AD adds s c_a to column b and s c_b to column a, DA adds the same to rows b and a, and D^2 adds 1 to cells (a, a)
+#  and (b, b). That's four O(n) vector additions and two cell increments: a rank-2 update of the square, instead of
+#  recomputing a row and a column of common neighbourhoods.
+#
+# The cube follows from the same terms (see the OptimizedGraph class docs for the identity):
+#
+#  A'^3 - A^3 = A^2 D + (A'^2 - A^2) A'
+#
+#  A^2 D adds s A^2[:, a] to column b and s A^2[:, b] to column a. Each term u v^T of A'^2 - A^2 above becomes
+#  u (A' v)^T, and every A' v needed is an O(n) update of a column of the old square or of A', e.g.
+#  A' c_b = A^2[:, b] + s A[a, b] e_b. The terms whose u is c_a or c_b touch only the rows of the neighbours of a and b.
+#
+# The rule counters are recounted over only the rows the write touched: a and b, and their neighbours.
+#
+# The neighbour sets are kept as in OptimizedGraph, so can_add_edge(), the canonical labelling and the search's
+#  degree bookkeeping work unchanged. push_state() and pop_state() keep an edge-only log, like CompiledOptimizedGraph:
+#  undoing a write is another write, which is as cheap as the logged alternative here.
+#
+# The full matrices take 4n^2 bytes each instead of packed triangles, which is nothing at the sizes the searches reach.
+#
+# Every write costs a few dozen numpy calls whatever the graph looks like, so this wins on big or dense graphs (about
+#  10x on the 50x50 speed test) but loses to OptimizedGraph, whose cost follows the neighbourhood sizes, on the small
+#  sparse graphs BranchAndBound works with.
+class NumpyOptimizedGraph(OptimizedGraph):
+    # __init__()
+    #
+    # constructor
+    def __init__(self, size):
+        OptimizedGraph.__init__(self, size)
+        self.adjacency_structure = numpy.zeros((size, size), dtype=numpy.int32)
+        self.square_adjacency_structure = numpy.zeros((size, size), dtype=numpy.int32)
+        self.cube_adjacency_structure = numpy.zeros((size, size), dtype=numpy.int32)
+
+    # read_adjacency_matrix_bool()
+    #
+    # Same contract as OptimizedGraph.read_adjacency_matrix_bool()
+    def read_adjacency_matrix_bool(self, row, col):
+        return bool(self.adjacency_structure[row, col])
+
+    # read_square_adjacency_matrix()
+    #
+    # Same contract as OptimizedGraph.read_square_adjacency_matrix()
+    def read_square_adjacency_matrix(self, row, col):
+        return int(self.square_adjacency_structure[row, col])
+
+    # read_cube_adjacency_matrix()
+    #
+    # Same contract as OptimizedGraph.read_cube_adjacency_matrix()
+    def read_cube_adjacency_matrix(self, row, col):
+        return int(self.cube_adjacency_structure[row, col])
+
+    # count_violations()
+    #
+    # Returns (cube trace, square violations, cube violations) counted over the cells in the rows and columns of
+    #  vertices; each unordered pair of vertices is counted once
+    def count_violations(self, vertices):
+        adjacency = self.adjacency_structure
+        square = self.square_adjacency_structure
+        cube = self.cube_adjacency_structure
+        rows = numpy.array(sorted(vertices), dtype=numpy.intp)
+        diagonal = (numpy.arange(len(rows)), rows)
+        count = numpy.count_nonzero
+
+        # a pair with both vertices in rows shows up twice in the rows and twice in the inner block, a pair with one
+        #  shows up once in the rows and not in the inner block
+        square_mask = square[rows] > 1
+        square_mask[diagonal] = False
+        square_violations = count(square_mask) - count(square_mask[:, rows]) // 2
+
+        cube_rows = cube[rows]
+        cube_mask = (cube_rows > 1) & (adjacency[rows] == 0)
+        cube_mask[diagonal] = False
+        cube_violations = count(cube_mask) - count(cube_mask[:, rows]) // 2
+
+        return int(cube_rows[diagonal].sum()), square_violations, cube_violations
+
+    # write_adjacency_matrix()
+    #
+    # Same contract as OptimizedGraph.write_adjacency_matrix(); see class docs for the update
+    def write_adjacency_matrix(self, row, col, val):
+        if row == col:
+            raise ValueError('The OptimizedGraph data structure assumes a simple graph; thus writes that could create \
+            loops are not allowed. row cannot equal col.')
+        if bool(self.adjacency_structure[row, col]) == bool(val):
+            return
+
+        self.prepare_write(row, col)
+        a, b = row, col
+        sign = 1 if val else -1
+        adjacency = self.adjacency_structure
+        square = self.square_adjacency_structure
+        cube = self.cube_adjacency_structure
+
+        # every cell that changes is in the row or column of a, b, or one of their neighbours
+        touched = set(self.neighbours[a]) | self.neighbours[b] | set([a, b])
+        trace, square_violations, cube_violations = self.count_violations(touched)
+
+        # the old columns of A and A^2 that the update is made of
+        column_a = adjacency[:, a].copy()
+        column_b = adjacency[:, b].copy()
+        square_a = square[:, a].copy()
+        square_b = square[:, b].copy()
+        was_adjacent = adjacency[a, b]
+
+        # A'
+        adjacency[a, b] = adjacency[b, a] = 1 if val else 0
+        if val:
+            self.neighbours[a].add(b)
+            self.neighbours[b].add(a)
+        else:
+            self.neighbours[a].discard(b)
+            self.neighbours[b].discard(a)
+
+        # A'^2 = A^2 + AD + DA + D^2
+        square[:, b] += sign * column_a
+        square[:, a] += sign * column_b
+        square[b, :] += sign * column_a
+        square[a, :] += sign * column_b
+        square[a, a] += 1
+        square[b, b] += 1
+
+        # A'^3 = A^3 + A^2 D + (A'^2 - A^2) A'
+        cube[:, b] += sign * square_a
+        cube[:, a] += sign * square_b
+        # u = e_a, e_b: rows a and b gain (A' v)^T for v = s c_b + e_a and s c_a + e_b, where
+        #  A' c_b = A^2[:, b] + s A[a, b] e_b
+        cube[a, :] += sign * square_b + adjacency[:, a]
+        cube[b, :] += sign * square_a + adjacency[:, b]
+        cube[a, b] += was_adjacent
+        cube[b, a] += was_adjacent
+        # u = c_a, c_b: the rows of the old neighbours of a gain s A'[:, b], and of b gain s A'[:, a]
+        neighbours_a = numpy.flatnonzero(column_a)
+        neighbours_b = numpy.flatnonzero(column_b)
+        if len(neighbours_a):
+            cube[neighbours_a, :] += sign * adjacency[:, b]
+        if len(neighbours_b):
+            cube[neighbours_b, :] += sign * adjacency[:, a]
+
+        new_trace, new_square_violations, new_cube_violations = self.count_violations(touched)
+        self.cube_trace += new_trace - trace
+        self.square_violations += new_square_violations - square_violations
+        self.cube_violations += new_cube_violations - cube_violations
+
+        if self.undo_log is not None:
+            self.undo_log.append((row, col, val))
+
+    # pop_state()
+    #
+    # Undoes every write since the matching push_state() by writing each edge back
+    def pop_state(self):
+        mark = self.undo_marks.pop()
+        undo_log = self.undo_log
+        # stop logging first so the undoing writes aren't logged
+        self.undo_log = None
+        while len(undo_log) > mark:
+            row, col, val = undo_log.pop()
+            self.write_adjacency_matrix(row, col, not val)
+        if self.undo_marks:
+            self.undo_log = undo_log
+
+    # unshare()
+    #
+    # Same as OptimizedGraph.unshare(); slicing a numpy array doesn't copy it, so copy() is used instead
+    def unshare(self):
+        self.adjacency_structure = self.adjacency_structure.copy()
+        self.square_adjacency_structure = self.square_adjacency_structure.copy()
+        self.cube_adjacency_structure = self.cube_adjacency_structure.copy()
+        self.neighbours = list(self.neighbours)
+        self.shared_neighbour_sets = set(range(0, self.size))
+        self.shared = False
+
+    # candidate_edges()
+    #
+    # Same contract as OptimizedGraph.candidate_edges(), with the pairs picked out of the full matrices at once
+    def candidate_edges(self, vertices=None, max_degree=None, ordered=True):
+        neighbours = self.neighbours
+        if vertices is None:
+            vertices = range(0, self.size)
+        if max_degree is not None:
+            vertices = [v for v in vertices if len(neighbours[v]) < max_degree]
+        vertices = numpy.array(sorted(vertices), dtype=numpy.intp)
+        if len(vertices) < 2:
+            return []
+
+        block = numpy.ix_(vertices, vertices)
+        free = (self.square_adjacency_structure[block] == 0) & (self.cube_adjacency_structure[block] == 0)
+        # b is the later vertex of each pair, as in OptimizedGraph
+        later, earlier = numpy.nonzero(numpy.tril(free, -1))
+        candidates = zip(vertices[earlier].tolist(), vertices[later].tolist())
+
+        if ordered:
+            candidates.sort(key=lambda pair: len(neighbours[pair[0]]) + len(neighbours[pair[1]]))
+        return candidates
+
+    # get_full_adjacency_matrix()
+    #
+    # Same contract as OptimizedGraph.get_full_adjacency_matrix()
+    def get_full_adjacency_matrix(self):
+        return self.adjacency_structure.tolist()
+
+    # get_full_square_adjacency_matrix()
+    #
+    # Same contract as OptimizedGraph.get_full_square_adjacency_matrix()
+    def get_full_square_adjacency_matrix(self):
+        return self.square_adjacency_structure.tolist()
+
+    # get_full_cube_adjacency_matrix()
+    #
+    # Same contract as OptimizedGraph.get_full_cube_adjacency_matrix()
+    def get_full_cube_adjacency_matrix(self):
+        return self.cube_adjacency_structure.tolist()
+
+
+# test()
+#
+# Runs the OptimizedGraph tests against NumpyOptimizedGraph
+def test():
+    optimized_graph_module.test(NumpyOptimizedGraph)
+
+
+# If somebody ever runs this file, invoke test() to test NumpyOptimizedGraph()
+if __name__ == '__main__':
+    test()
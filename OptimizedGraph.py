@@ -1,5 +1,8 @@
 from time import time
-import numpy # todo remove and move into test() once we don't need numpy in the class (after we update to the new checking)
+from array import array
+from copy import copy
+import random
+from canonical import CanonicalLabelling, neighbourhoods_from_sets
 
 # OptimizedGraph
 #
@@ -23,16 +26,16 @@ import numpy # todo remove and move into test() once we don't need numpy in the
 #
 # Since we are working with simple undirected graphs, we can assume no node has an edge linking with itself and that
 #  the adj matrix is symmetric over the diagonal. Thus, we can reduce the information stored to only the lower left.
-#  The matrix values can also be stored as booleans instead of integers.
+#  The matrix values can also be stored as single bits instead of integers.
 #
 # Typical Adj Matrix: [[a, b, c],
 #                      [d, e, f],
 #                      [g, h, i]]
 #
-# We know a, e, and i are false. We know b=d, c=g, h=f. Thus we need only store the following:
+# We know a, e, and i are false. We know b=d, c=g, h=f. Thus we need only store d, g and h. They are stored row by row
+#  as the bits of a bytearray; cell (row, col) with row > col is bit row * (row - 1) / 2 + col:
 #
-# self.adjacency_structure: [[d],
-#                           [g, h]]
+# self.adjacency_structure: bytearray with bits [d, g, h]
 #
 # Since we're optimizing for cycle checking we will need to use the squared adjacency matrix. However, since we're
 #  only adding/removing one edge at a time, we can reduce computational overhead by caching the square matrix and
@@ -41,11 +44,66 @@ import numpy # todo remove and move into test() once we don't need numpy in the
 #  can still be discarded. Additionally, the square_adjacency_structure must be stored as numeric/integer values
 #  instead of booleans.
 #
-# self.square_adjacency_structure: [[p],
-#                                   [q, w],
-#                                   [x, y, z]]
+# The lower left (with the diagonal) is stored row by row in a flat array of unsigned 16 bit ints; cell (row, col)
+#  with row >= col is at row * (row + 1) / 2 + col. No square cell can exceed n - 1.
+#
+# self.square_adjacency_structure: array('H', [p,
+#                                              q, w,
+#                                              x, y, z])
 #
 # This matrix is updated upon calls to write_adjacency_matrix.
+#
+# The rule check also needs the cubed adjacency matrix. It is cached in the same lower-left shape (diagonal included)
+#  as the square. Adding or removing the edge (a, b) changes the adjacency matrix by D = +/-(E_ab + E_ba), so
+#
+#  (A + D)^3 = A^2 (A + D) + (A'^2 - A^2) (A + D) = A^3 + A^2 D + (A'^2 - A^2) A'
+#
+#  A^2 D only touches columns a and b, and A'^2 - A^2 is zero outside the rows/columns of a and b that were just
+#  recomputed for the square. Thus the cube can be updated from the square cells that changed without ever
+#  multiplying full matrices.
+#
+# self.cube_adjacency_structure: array('I', [p,
+#                                            q, w,
+#                                            x, y, z])
+#
+# Its cells are bounded by n^2 rather than n, so they are stored as unsigned 32 bit ints.
+#
+# Both index formulas are written out wherever a cell is read or written rather than called, since a Python call per
+#  cell costs more than the arithmetic.
+#
+# Compared with the lists of lists of Python bools and ints this replaced (sys.getsizeof, n = 16 to 100), the bit
+#  triangle takes 40-80 times less memory, but the square only 5-8 times and the cube 3-5 times less, since their
+#  cells are whole counters of 2 and 4 bytes where a list cell was an 8 byte pointer. All together that's well short of
+#  a 30 times reduction; only the bit triangle reaches it.
+#
+# Alongside the cube, three counters are maintained so that does_follow_rules() is a lookup:
+#
+# self.cube_trace:           the sum of the cube's diagonal (six times the number of triangles)
+# self.square_violations:    the number of off-diagonal square cells greater than 1
+# self.cube_violations:      the number of off-diagonal cube cells greater than 1 whose vertices are not adjacent
+#
+# These are updated upon calls to write_adjacency_matrix.
+#
+# Finally, the neighbours of each vertex are cached as sets so that questions about a single candidate edge can be
+#  answered by walking the local neighbourhood instead of whole rows:
+#
+# self.neighbours: [{1}, {0, 2}, {1}]
+#
+# This list is also updated upon calls to write_adjacency_matrix.
+#
+# The canonical labelling of the graph (see canonical.py) is memoized in self.canonical_labelling_cache. It is only
+#  computed when canonical_form() or canonical_labelling() is called, and write_adjacency_matrix() throws it away
+#  whenever the graph changes.
+#
+# fork() copies a graph in O(n) by sharing all of the structures above with the original. Both graphs are then marked
+#  self.shared, and the first write to either one copies the three packed arrays (a few flat memory copies) and the
+#  list of neighbour sets. The neighbour sets themselves are only copied as each one is changed; the vertices whose
+#  sets are still shared are kept in self.shared_neighbour_sets. The square and cube are copied whole because a
+#  single write updates a row and a column of each, which touches every row of the triangle.
+#
+# For backtracking, push_state() starts logging the cells every write changes and pop_state() subtracts them again,
+#  which is cheaper than letting remove_edge() recompute the row and column of the square. The log is self.undo_log
+#  and the positions in it that push_state() marked are self.undo_marks.
 class OptimizedGraph:
     # __init__()
     #
@@ -55,27 +113,36 @@ class OptimizedGraph:
     def __init__(self, size):
         # Store size and define an array to hold adjacency structures
         self.size = size
-        self.adjacency_structure = []
-        self.square_adjacency_structure = []
-
-        # Generate an empty adjacency structure for the given size
+        self.neighbours = []
+        self.cube_trace = 0
+        self.square_violations = 0
+        self.cube_violations = 0
+        self.canonical_labelling_cache = None
+        self.shared = False
+        self.shared_neighbour_sets = set()
+        self.undo_log = None
+        self.undo_marks = []
+
+        # Generate an empty adjacency structure for the given size: one bit per cell below the diagonal
         #  See class docs for details on adjacency structure
-        for row in range(0, size - 1):
-            self.adjacency_structure.append([])
-            for column in range(0, row + 1):
-                self.adjacency_structure[row].append(False)
+        self.adjacency_structure = bytearray((size * (size - 1) // 2 + 7) // 8)
 
         # Generate an empty square structure for the given size
         #  See class docs for details on square adjacency structure
         #  square needs to include a diagonal that adjacency_structure does not
-        for row in range(0, size):
-            self.square_adjacency_structure.append([])
-            for column in range(0, row + 1):
-                self.square_adjacency_structure[row].append(0)
+        self.square_adjacency_structure = array('H', [0]) * (size * (size + 1) // 2)
+
+        # Generate an empty cube structure for the given size
+        #  it has the same shape as the square structure
+        self.cube_adjacency_structure = array('I', [0]) * (size * (size + 1) // 2)
+
+        # Generate an empty neighbour set for each vertex
+        for vertex in range(0, size):
+            self.neighbours.append(set())
 
     # read_adjacency_matrix_bool()
     #
-    # Returns BOOLEAN because boolean is the underlying data type
+    # Returns BOOLEAN; the stored bit is converted
     #
     # Accesses the theoretical adjacency matrix of this graph; we only store a much smaller adjacencyStructure
     #  since the graph is assumed to be simple and undirected. See class docs for more.
@@ -88,16 +155,14 @@ class OptimizedGraph:
         #  We deleted this area in order to compress the adj. structure. However, it's a mirror image
         #  over the diagonal of the lower left. Thus, swap the row and column to read from the lower left
         #  which we did store.
-        # Row access is shifted down one due to the location of the stored region (col variable is used but
-        #  row access is shifted down)
         if col > row:
-            return self.adjacency_structure[col - 1][row]
-
-        # col < row
-        # We now know col is less than row. This means we're in the lower left. This is the area we stored, so
-        #  just read from the stored adjacency structure.
-        # Row access is shifted down one due to the location of the stored region
-        return self.adjacency_structure[row - 1][col]
+            index = col * (col - 1) // 2 + row
+        else:
+            # col < row
+            # We now know col is less than row. This means we're in the lower left. This is the area we stored, so
+            #  just read from the stored adjacency structure.
+            index = row * (row - 1) // 2 + col
+        return (self.adjacency_structure[index >> 3] >> (index & 7)) & 1 == 1
 
     # read_adjacency_matrix()
     #
@@ -130,24 +195,66 @@ class OptimizedGraph:
         #  over the diagonal of the lower left. Thus, swap the row and column to read from the lower left
         #  which we did store.
         if col > row:
-            return self.square_adjacency_structure[col][row]
+            return self.square_adjacency_structure[col * (col + 1) // 2 + row]
 
         # col < row
         # We now know col is less than row. This means we're in the lower left. This is the area we stored, so
         #  just read from the stored adjacency structure.
-        return self.square_adjacency_structure[row][col]
+        return self.square_adjacency_structure[row * (row + 1) // 2 + col]
+
+    # read_cube_adjacency_matrix()
+    #
+    # Returns int; it's the underlying data type
+    #
+    # Accesses the theoretical cubed adjacency matrix of this graph. Stored exactly like the square; see
+    #  read_square_adjacency_matrix()
+    #
+    # the cube_adjacency_matrix is cached and updated by calls to write_adjacency_matrix
+    def read_cube_adjacency_matrix(self, row, col):
+        if col > row:
+            return self.cube_adjacency_structure[col * (col + 1) // 2 + row]
+        return self.cube_adjacency_structure[row * (row + 1) // 2 + col]
+
+    # write_square_cell()
+    #
+    # Stores a recomputed value in cell (row, col) (row >= col) of square_adjacency_structure and keeps
+    #  square_violations up to date.
+    #
+    # Returns the change in value so write_adjacency_matrix() can update the cube from it.
+    def write_square_cell(self, row, col, total):
+        index = row * (row + 1) // 2 + col
+        old = self.square_adjacency_structure[index]
+        if old == total:
+            return 0
+        if row != col:
+            if old > 1:
+                self.square_violations -= 1
+            if total > 1:
+                self.square_violations += 1
+        self.square_adjacency_structure[index] = total
+        return total - old
+
+    # is_cube_violation()
+    #
+    # Returns 1 if cell (row, col) (row > col) of the cube is greater than 1 while row and col are not adjacent; 0
+    #  otherwise. See does_follow_rules().
+    def is_cube_violation(self, row, col):
+        if self.cube_adjacency_structure[row * (row + 1) // 2 + col] > 1 and not self.read_adjacency_matrix_bool(row, col):
+            return 1
+        return 0
 
     # write_adjacency_matrix()
     #
     # Accesses the theoretical adjacency matrix of this graph; we only store a much smaller adjacencyStructure
     #  since the graph is assumed to be simple and undirected. See class docs for more.
     #
-    # Updates square_adjacency_structure
+    # Updates square_adjacency_structure, cube_adjacency_structure and the rule counters
     #
     # Thus, write operations are slowed by optimized matrix calculations.
     #
     # Before the write operation, a read operation is performed to check if the write operation is making a change.
     #  The square_adjacency_structure is only updated if a change is made, and only the affected row/col are updated.
+    #  The cube_adjacency_structure is then updated from the square cells that changed. See class docs.
     def write_adjacency_matrix(self, row, col, val):
         # Since we assume a simple graph, no node connects to itself. Thus, if row=col, the answer is false.
         if row == col:
@@ -174,30 +281,213 @@ class OptimizedGraph:
         #  just write to the stored adjacency structure.
 
         # Store whether or not we changed the adjacency_structure
-        adjacency_structure_modified = self.adjacency_structure[row - 1][col] != val
+        index = row * (row - 1) // 2 + col
+        mask = 1 << (index & 7)
+        adjacency_structure_modified = bool(self.adjacency_structure[index >> 3] & mask) != bool(val)
+
+        # Nothing cached depends on this write if it didn't change anything
+        if not adjacency_structure_modified:
+            return
+
+        self.prepare_write(row, col)
+
+        # remember the counters so that pop_state() can put them back
+        if self.undo_log is not None:
+            counters = (self.cube_trace, self.square_violations, self.cube_violations)
+
+        # cell (row, col) of the cube is the only one whose violation depends on this adjacency cell; take it out of
+        #  the count now and put it back once everything is updated
+        self.cube_violations -= self.is_cube_violation(row, col)
 
         # perform the update
-        self.adjacency_structure[row - 1][col] = val
-
-        # Recalculate the row and column in the squared_adjacency_structure if we changed something
-        if adjacency_structure_modified:
-            for i in range(0, self.size):
-                # recalculate cell (i, col)
-                total = 0
-                for x in range(0, self.size):
-                    total += self.read_adjacency_matrix(i, x) * self.read_adjacency_matrix(x, col)
-                # swap the row/col if we go over the border
-                if col > i:
-                    self.square_adjacency_structure[col][i] = total
-                else:
-                    self.square_adjacency_structure[i][col] = total
-            for i in range(0, len(self.adjacency_structure[row-1])+1):
-                # recalculate cell (row, i)
-                # row, col would get covered once in each loop, so ignore it in this loop and do it in the other
-                total = 0
-                for x in range(0, self.size):
-                    total += self.read_adjacency_matrix(row, x) * self.read_adjacency_matrix(x, i)
-                self.square_adjacency_structure[row][i] = total
+        if val:
+            self.adjacency_structure[index >> 3] |= mask
+        else:
+            self.adjacency_structure[index >> 3] &= ~mask
+
+        # keep the neighbour sets in step with the adjacency structure
+        if val:
+            self.neighbours[row].add(col)
+            self.neighbours[col].add(row)
+        else:
+            self.neighbours[row].discard(col)
+            self.neighbours[col].discard(row)
+
+        # Recalculate the row and column in the squared_adjacency_structure, remembering which cells changed
+        #  square_changes maps a stored (lower-left) cell to the amount it changed by
+        #  cell (i, j) of the square counts the common neighbours of i and j
+        neighbours = self.neighbours
+        square_changes = {}
+        for i in range(0, self.size):
+            # recalculate cell (i, col)
+            total = len(neighbours[i] & neighbours[col])
+            # swap the row/col if we go over the border
+            if col > i:
+                cell = (col, i)
+            else:
+                cell = (i, col)
+            change = self.write_square_cell(cell[0], cell[1], total)
+            if change:
+                square_changes[cell] = change
+        for i in range(0, self.size):
+            # recalculate cell (row, i)
+            # cells with i > row live in later rows of the structure, so they need the same swap as above
+            total = len(neighbours[row] & neighbours[i])
+            if row > i:
+                cell = (row, i)
+            else:
+                cell = (i, row)
+            change = self.write_square_cell(cell[0], cell[1], total)
+            if change:
+                square_changes[cell] = change
+
+        # Accumulate the change to the lower left of the cube: A'^3 - A^3 = A^2 D + (A'^2 - A^2) A'
+        cube_changes = {}
+        sign = 1 if val else -1
+
+        # A^2 D: column col gains sign * A^2[i][row] and column row gains sign * A^2[i][col], using the square from
+        #  before this write
+        for i in range(0, self.size):
+            if i >= col:
+                old_square = self.read_square_adjacency_matrix(i, row) - square_changes.get((max(i, row), min(i, row)), 0)
+                if old_square:
+                    cube_changes[(i, col)] = cube_changes.get((i, col), 0) + sign * old_square
+            if i >= row:
+                old_square = self.read_square_adjacency_matrix(i, col) - square_changes.get((max(i, col), min(i, col)), 0)
+                if old_square:
+                    cube_changes[(i, row)] = cube_changes.get((i, row), 0) + sign * old_square
+
+        # (A'^2 - A^2) A': every changed square cell (p, q) adds its change to (p, j) for each neighbour j of q, and
+        #  by symmetry to (q, j) for each neighbour j of p
+        for (p, q), change in square_changes.items():
+            for j in self.neighbours[q]:
+                if p >= j:
+                    cube_changes[(p, j)] = cube_changes.get((p, j), 0) + change
+            if p != q:
+                for j in self.neighbours[p]:
+                    if q >= j:
+                        cube_changes[(q, j)] = cube_changes.get((q, j), 0) + change
+
+        # Apply the changes, keeping the trace and violation count in step
+        for (i, j), change in cube_changes.items():
+            if not change:
+                continue
+            cell = i * (i + 1) // 2 + j
+            if i == j:
+                self.cube_trace += change
+                self.cube_adjacency_structure[cell] += change
+            elif (i, j) == (row, col):
+                self.cube_adjacency_structure[cell] += change
+            else:
+                self.cube_violations -= self.is_cube_violation(i, j)
+                self.cube_adjacency_structure[cell] += change
+                self.cube_violations += self.is_cube_violation(i, j)
+
+        self.cube_violations += self.is_cube_violation(row, col)
+
+        if self.undo_log is not None:
+            self.undo_log.append((row, col, val, square_changes, cube_changes, counters))
+
+    # prepare_write()
+    #
+    # Gets the graph ready for a change to the edge (row, col): throws away the memoized canonical labelling and stops
+    #  sharing the structures that are about to change with forks. See fork().
+    def prepare_write(self, row, col):
+        # the graph is changing, so the memoized canonical labelling no longer applies
+        self.canonical_labelling_cache = None
+
+        # stop sharing structures with forks before changing them
+        if self.shared:
+            self.unshare()
+        if self.shared_neighbour_sets:
+            for vertex in (row, col):
+                if vertex in self.shared_neighbour_sets:
+                    self.neighbours[vertex] = set(self.neighbours[vertex])
+                    self.shared_neighbour_sets.discard(vertex)
+
+    # push_state()
+    #
+    # Marks the current state of the graph so that pop_state() can return to it
+    #
+    # While at least one state is pushed, write_adjacency_matrix() logs the square and cube cells each write changed,
+    #  along with the counters from before it. Calls can be nested.
+    def push_state(self):
+        if self.undo_log is None:
+            self.undo_log = []
+        self.undo_marks.append(len(self.undo_log))
+
+    # pop_state()
+    #
+    # Undoes every write since the matching push_state()
+    #
+    # The logged changes are subtracted from the cells they were added to, so nothing is recomputed; the cost is the
+    #  number of cells the writes touched. In a depth first search this replaces remove_edge() for backtracking.
+    def pop_state(self):
+        mark = self.undo_marks.pop()
+        undo_log = self.undo_log
+
+        while len(undo_log) > mark:
+            row, col, val, square_changes, cube_changes, counters = undo_log.pop()
+            self.prepare_write(row, col)
+
+            index = row * (row - 1) // 2 + col
+            if val:
+                self.adjacency_structure[index >> 3] &= ~(1 << (index & 7))
+                self.neighbours[row].discard(col)
+                self.neighbours[col].discard(row)
+            else:
+                self.adjacency_structure[index >> 3] |= 1 << (index & 7)
+                self.neighbours[row].add(col)
+                self.neighbours[col].add(row)
+
+            # read the arrays after prepare_write(), which may have swapped in copies
+            square = self.square_adjacency_structure
+            cube = self.cube_adjacency_structure
+            for (i, j), change in square_changes.items():
+                square[i * (i + 1) // 2 + j] -= change
+            for (i, j), change in cube_changes.items():
+                cube[i * (i + 1) // 2 + j] -= change
+            self.cube_trace, self.square_violations, self.cube_violations = counters
+
+        # stop logging once the outermost state is popped
+        if not self.undo_marks:
+            self.undo_log = None
+
+    # fork()
+    #
+    # Returns a copy of this graph that can be changed independently of it
+    #
+    # O(n): the copy shares every structure with this graph until one of them is written to. See class docs.
+    def fork(self):
+        self.shared = True
+        child = copy(self)
+        child.shared_neighbour_sets = set(self.shared_neighbour_sets)
+        # the fork starts with no pushed states of its own
+        child.undo_log = None
+        child.undo_marks = []
+        return child
+
+    # snapshot()
+    #
+    # Returns a copy of the graph as it is now, to be kept while this graph carries on changing
+    #
+    # Same as fork(); see class docs
+    def snapshot(self):
+        return self.fork()
+
+    # unshare()
+    #
+    # Gives this graph its own copies of the structures it shares with forks. Called by write_adjacency_matrix()
+    #  before the first change after fork().
+    #
+    # The neighbour sets are left shared and copied one at a time as they change.
+    def unshare(self):
+        self.adjacency_structure = self.adjacency_structure[:]
+        self.square_adjacency_structure = self.square_adjacency_structure[:]
+        self.cube_adjacency_structure = self.cube_adjacency_structure[:]
+        self.neighbours = list(self.neighbours)
+        self.shared_neighbour_sets = set(range(0, self.size))
+        self.shared = False
 
     # add_edge()
     #
@@ -237,6 +527,94 @@ class OptimizedGraph:
     def check_edge_present(self, a, b):
         return self.read_adjacency_matrix_bool(a, b)
 
+    # can_add_edge()
+    #
+    # Returns True iff adding an edge from a to b would keep the graph free of c3, c4, and c6 cycles.
+    #
+    # READ ONLY: nothing is written, so rejecting a candidate costs no square_adjacency_structure updates.
+    #
+    # Assumes the graph currently follows the rules; see edge_cycle_length() for the checks.
+    def can_add_edge(self, a, b):
+        # loops and duplicate edges can't be added
+        if a == b or self.read_adjacency_matrix_bool(a, b):
+            return False
+        return self.edge_cycle_length(a, b) == 0
+
+    # edge_cycle_length()
+    #
+    # Returns the length of the forbidden cycle (3, 4 or 6) that adding the edge (a, b) would create, or 0 if adding
+    #  it keeps the graph free of c3, c4 and c6 cycles. Same contract as BitsetGraph.edge_cycle_length()
+    #
+    # READ ONLY. Assumes the graph currently follows the rules and that a and b are distinct and not adjacent. In that
+    #  case the new edge closes a forbidden cycle exactly when there is already a path of length 2, 3 or 5 from a to b,
+    #  and each of those is answered from the cached square and cube:
+    #
+    # c3: a - y - b                  square[a][b] > 0
+    # c4: a - x - y - b              square[x][b] > 0 for some neighbour x of a
+    # c6: a - x - ? - ? - y - b      cube[x][y] > 0 for some neighbour x of a and neighbour y of b
+    #
+    # The cost is proportional to the size of the neighbourhoods of a and b, not to the size of the graph.
+    def edge_cycle_length(self, a, b):
+        # c3
+        if self.read_square_adjacency_matrix(a, b) > 0:
+            return 3
+
+        # c4
+        for x in self.neighbours[a]:
+            if self.read_square_adjacency_matrix(x, b) > 0:
+                return 4
+
+        # c6
+        for x in self.neighbours[a]:
+            for y in self.neighbours[b]:
+                if self.read_cube_adjacency_matrix(x, y) > 0:
+                    return 6
+
+        return 0
+
+    # candidate_edges()
+    #
+    # Returns a list of the edges that might still be added to the graph, each unordered pair once as (a, b) with
+    #  a < b
+    #
+    # Pairs that would certainly close a forbidden cycle are skipped straight from the cached matrices, without a rule
+    #  check:
+    #
+    # adjacent pairs
+    # pairs at distance 2 (square[a][b] > 0): the new edge closes a c3
+    # pairs at distance 3 (cube[a][b] > 0 with no common neighbour): the walk of length 3 is a path, so the new edge
+    #  closes a c4
+    #
+    # The pairs that are left can only close a c6, which can_add_edge() still has to rule out.
+    #
+    # vertices Only pairs of these vertices are considered; defaults to every vertex
+    # max_degree If given, vertices that already have this degree are left out before any pair is looked at
+    # ordered If True, pairs are sorted lowest total degree first, which fills in the sparse parts of the graph first.
+    #  Otherwise they're in increasing order.
+    def candidate_edges(self, vertices=None, max_degree=None, ordered=True):
+        neighbours = self.neighbours
+        if vertices is None:
+            vertices = range(0, self.size)
+        if max_degree is not None:
+            vertices = [v for v in vertices if len(neighbours[v]) < max_degree]
+        vertices = sorted(vertices)
+        square = self.square_adjacency_structure
+        cube = self.cube_adjacency_structure
+
+        candidates = []
+        for position in range(1, len(vertices)):
+            b = vertices[position]
+            row = b * (b + 1) // 2
+            for a in vertices[:position]:
+                # adjacent pairs have square[a][b] == 0 but cube[a][b] > 0 (the walk a - b - a - b), so they're
+                #  skipped too
+                if square[row + a] == 0 and cube[row + a] == 0:
+                    candidates.append((a, b))
+
+        if ordered:
+            candidates.sort(key=lambda pair: len(neighbours[pair[0]]) + len(neighbours[pair[1]]))
+        return candidates
+
     # get_full_adjacency_matrix()
     #
     # converts the adjacency structure into a full adjacency matrix and returns it
@@ -269,53 +647,78 @@ class OptimizedGraph:
             matrix.append(row)
         return matrix
 
-    # does_follow_rules()
+    # get_full_cube_adjacency_matrix()
+    #
+    # converts the cube adjacency structure into a full cubed adjacency matrix and returns it
+    #
+    # NOT OPTIMIZED
+    #
+    # returns a 2D array
+    def get_full_cube_adjacency_matrix(self):
+        matrix = []
+        for row_index in range(0, self.size):
+            row = []
+            for col_index in range(self.size):
+                row.append(self.read_cube_adjacency_matrix(row_index, col_index))
+            matrix.append(row)
+        return matrix
+
+    # canonical_labelling()
+    #
+    # Returns the CanonicalLabelling of this graph (see canonical.py)
+    #
+    # Memoized until the next write that changes the graph
+    def canonical_labelling(self):
+        if self.canonical_labelling_cache is None:
+            self.canonical_labelling_cache = CanonicalLabelling(neighbourhoods_from_sets(self.neighbours))
+        return self.canonical_labelling_cache
+
+    # canonical_form()
+    #
+    # Returns a hashable certificate of this graph: its size and the lower triangle of its adjacency matrix, packed
+    #  into an int, under the canonical vertex ordering.
     #
-    # NOT COMPLETE: This function works; however, it is not fully optimized. It should not be using a numpy cubed
-    #  matrix. More updates are soon to come.
+    # Two OptimizedGraphs have equal certificates exactly when they are isomorphic, so certificates can be used as
+    #  dictionary keys in place of nx.is_isomorphic() calls.
+    #
+    # Memoized until the next write that changes the graph
+    def canonical_form(self):
+        return self.canonical_labelling().certificate
+
+    # does_follow_rules()
     #
     # Returns true if the graph represented by this data structure follows the rules of this research
     #
     # A graph follows the rules if it contains no c3, c4, or c6 cycles.
-    # This function is far less reader-friendly; however it is equivalent to
-    # does_follow_rules() and should run more quickly due to linearly decreased
-    # number of loops and matrix operations.
     #
-    # matrix An adjacency matrix in the form of a 2D array that represents a networkx (or any other) graph
-    # see nx.to_numpy_matrix() to convert networkx graphs to adjacency matrices.
+    # This is the same test as does_follow_rules_optimized() in graph.py, but every quantity it needs is kept up to
+    #  date by write_adjacency_matrix(), so the check itself is O(1):
+    #
+    # c3: the cube has a non-zero diagonal
+    # c4: two vertices share more than one neighbour (an off-diagonal square cell greater than 1)
+    # c6: two non-adjacent vertices are joined by more than one path of length 3 (once c3 and c4 are ruled out, the
+    #  walks counted by the cube are paths, and two of them form a 6-cycle)
     #
     # see check() in Huntington's dissertation
     # see does_follow_rules() in graph.py for a more-readable but less efficient version
     def does_follow_rules(self):
-        # todo don't use numpy here
-        cubed = numpy.dot(numpy.matrix(self.get_full_square_adjacency_matrix()), numpy.matrix(self.get_full_adjacency_matrix()))
-
-        # todo don't use numpy here
-        # Test for tries and return false if they exist
-        cubed_diagonal_sum = numpy.sum(numpy.diagonal(cubed))
-        if cubed_diagonal_sum > 0:
-            return False
-
-        # Test for quads and return false if they exist
-        for i in range(1, self.size - 1):
-            for j in (i + 1, self.size - 1):
-                if self.read_square_adjacency_matrix(i, j) > 1:
-                    return False
-                if cubed[i, j] > 1 and self.read_adjacency_matrix(i, j) == 0:
-                    return False
-
-        return True
+        return self.cube_trace == 0 and self.square_violations == 0 and self.cube_violations == 0
 
 
 # test()
 #
 # Uses assert keyword to test the functionality of OptimizedGraph
 #
+# graph_class OptimizedGraph or a subclass with the same behaviour, such as CompiledOptimizedGraph
+# speed Whether to run the speed tests after the correctness tests
+#
 # numpy is required
-def test():
+def test(graph_class=OptimizedGraph, speed=True):
+    import numpy
+
     print 'Testing up to a 20x20 for correctness...'
     for size in range(1, 21):
-        g = OptimizedGraph(size)
+        g = graph_class(size)
 
         adjmat_manual = numpy.zeros((size, size), dtype=numpy.int)
 
@@ -336,9 +739,169 @@ def test():
         print 'Passed <%s tests for matrix of size %s' % (size*size, size)
     print 'Done testing correctness.'
 
+    print 'Testing random edge orders and can_add_edge() up to a 16x16 for correctness...'
+    rng = random.Random(0)
+    for size in range(2, 17):
+        for trial in range(0, 10):
+            g = graph_class(size)
+            adjmat_manual = numpy.zeros((size, size), dtype=numpy.int)
+
+            for step in range(0, size * 2):
+                a = rng.randrange(size)
+                b = rng.randrange(size)
+                if a == b or g.check_edge_present(a, b):
+                    continue
+
+                allowed = g.can_add_edge(a, b)
+                cycle_length = g.edge_cycle_length(a, b)
+                assert allowed == (cycle_length == 0)
+
+                g.add_edge(a, b)
+                adjmat_manual[a][b] = 1
+                adjmat_manual[b][a] = 1
+
+                adjmat2_manual = numpy.dot(adjmat_manual, adjmat_manual)
+                adjmat3_manual = numpy.dot(adjmat2_manual, adjmat_manual)
+                assert numpy.array_equal(adjmat2_manual, numpy.matrix(g.get_full_square_adjacency_matrix()))
+                assert numpy.array_equal(adjmat3_manual, numpy.matrix(g.get_full_cube_adjacency_matrix()))
+
+                # reference rule check straight from the matrix powers
+                off_diagonal = 1 - numpy.eye(size, dtype=numpy.int)
+                follows_rules = numpy.trace(adjmat3_manual) == 0 \
+                    and not numpy.any(adjmat2_manual * off_diagonal > 1) \
+                    and not numpy.any((adjmat3_manual > 1) & (adjmat_manual == 0) & (off_diagonal == 1))
+                assert allowed == follows_rules
+                assert g.does_follow_rules() == follows_rules
+
+                # the shortest cycle through the new edge is the one edge_cycle_length() reported
+                if not allowed:
+                    edgeless = adjmat_manual.copy()
+                    edgeless[a][b] = edgeless[b][a] = 0
+                    walks = numpy.eye(size, dtype=numpy.int)
+                    for length in range(1, 6):
+                        walks = numpy.dot(walks, edgeless)
+                        if walks[a][b] and length in (2, 3, 5):
+                            break
+                    assert cycle_length == length + 1
+
+                # can_add_edge() assumes the graph follows the rules, so undo rejected edges
+                if not allowed:
+                    g.remove_edge(a, b)
+                    adjmat_manual[a][b] = 0
+                    adjmat_manual[b][a] = 0
+                    adjmat2_manual = numpy.dot(adjmat_manual, adjmat_manual)
+                    assert numpy.array_equal(adjmat2_manual, numpy.matrix(g.get_full_square_adjacency_matrix()))
+                    assert numpy.array_equal(numpy.dot(adjmat2_manual, adjmat_manual),
+                                             numpy.matrix(g.get_full_cube_adjacency_matrix()))
+                    assert g.does_follow_rules()
+
+                # candidate_edges() may only drop pairs that can_add_edge() rejects
+                candidates = g.candidate_edges()
+                assert len(set(candidates)) == len(candidates)
+                for x in range(0, size):
+                    for y in range(x + 1, size):
+                        if g.can_add_edge(x, y):
+                            assert (x, y) in candidates
+        print 'Passed random graphs of size %s' % size
+    print 'Done testing correctness.'
+
+    print 'Testing canonical_form() up to a 12x12 for correctness...'
+    for size in range(1, 13):
+        for trial in range(0, 10):
+            edges = [(a, b) for a in range(0, size) for b in range(0, a) if rng.random() < 0.3]
+            permutation = range(0, size)
+            rng.shuffle(permutation)
+
+            g = graph_class(size)
+            relabelled = graph_class(size)
+            for a, b in edges:
+                g.add_edge(a, b)
+                relabelled.add_edge(permutation[a], permutation[b])
+            assert g.canonical_form() == relabelled.canonical_form()
+
+            # writes must invalidate the memoized certificate
+            if size > 1:
+                a, b = rng.sample(range(0, size), 2)
+                if g.check_edge_present(a, b):
+                    g.remove_edge(a, b)
+                else:
+                    g.add_edge(a, b)
+                assert g.canonical_form() != relabelled.canonical_form()
+    print 'Done testing correctness.'
+
+    print 'Testing fork() up to a 16x16 for correctness...'
+    for size in range(2, 17):
+        for trial in range(0, 5):
+            # a family of graphs forked from each other, each with the edges it should have
+            graphs = [graph_class(size)]
+            edge_sets = [set()]
+            for step in range(0, size * 3):
+                index = rng.randrange(len(graphs))
+                if rng.random() < 0.2:
+                    graphs.append(graphs[index].fork())
+                    edge_sets.append(set(edge_sets[index]))
+                    continue
+                a, b = rng.sample(range(0, size), 2)
+                pair = (min(a, b), max(a, b))
+                if pair in edge_sets[index]:
+                    graphs[index].remove_edge(a, b)
+                    edge_sets[index].discard(pair)
+                else:
+                    graphs[index].add_edge(a, b)
+                    edge_sets[index].add(pair)
+
+            for g, edges in zip(graphs, edge_sets):
+                replayed = graph_class(size)
+                for a, b in edges:
+                    replayed.add_edge(a, b)
+                assert g.get_full_adjacency_matrix() == replayed.get_full_adjacency_matrix()
+                assert g.get_full_square_adjacency_matrix() == replayed.get_full_square_adjacency_matrix()
+                assert g.get_full_cube_adjacency_matrix() == replayed.get_full_cube_adjacency_matrix()
+                assert g.neighbours == replayed.neighbours
+                assert g.does_follow_rules() == replayed.does_follow_rules()
+    print 'Done testing correctness.'
+
+    print 'Testing push_state() and pop_state() up to a 16x16 for correctness...'
+    for size in range(2, 17):
+        for trial in range(0, 5):
+            g = graph_class(size)
+            saved = []
+            for step in range(0, size * 4):
+                if saved and rng.random() < 0.3:
+                    g.pop_state()
+                    adjacency, square, cube, counters = saved.pop()
+                    assert g.get_full_adjacency_matrix() == adjacency
+                    assert g.get_full_square_adjacency_matrix() == square
+                    assert g.get_full_cube_adjacency_matrix() == cube
+                    assert (g.cube_trace, g.square_violations, g.cube_violations) == counters
+                    continue
+                if rng.random() < 0.3:
+                    saved.append((g.get_full_adjacency_matrix(), g.get_full_square_adjacency_matrix(),
+                                  g.get_full_cube_adjacency_matrix(),
+                                  (g.cube_trace, g.square_violations, g.cube_violations)))
+                    g.push_state()
+                a, b = rng.sample(range(0, size), 2)
+                if g.check_edge_present(a, b):
+                    g.remove_edge(a, b)
+                else:
+                    g.add_edge(a, b)
+
+                # a fork must not be affected by states popped from its parent
+                if rng.random() < 0.1:
+                    forked = g.fork()
+                    matrix = forked.get_full_cube_adjacency_matrix()
+                    while saved:
+                        g.pop_state()
+                        saved.pop()
+                    assert forked.get_full_cube_adjacency_matrix() == matrix
+    print 'Done testing correctness.'
+
+    if not speed:
+        return
+
     print 'Testing up to a 50x50 for speed...'
     for size in range(2, 51):
-        g = OptimizedGraph(size)
+        g = graph_class(size)
 
         edge_count = 0
         start = time()
@@ -358,7 +921,7 @@ def test():
 
     print 'Testing up to a 41x41 for speed checking cycles...'
     for size in range(2, 42):
-        g = OptimizedGraph(size)
+        g = graph_class(size)
 
         graph_count = 0
         start = time()
@@ -0,0 +1,458 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import timeit
+import numpy
+import networkx as nx
+import graph
+from OptimizedGraph import OptimizedGraph
+
+# Benchmark harness for the rule checks, OptimizedGraph and isomorphism filtering
+#
+# Every benchmark runs warmup untimed calls and then repeats timed ones, and reports the median with the 10th and
+#  90th percentiles. Setup (building the graph, converting it to a matrix) is done before each call and isn't timed.
+#
+# Each run writes, to the output directory:
+#  does_follow_rules_optimization_benchmarking.csv and isomorphic_vs_optimized_check_benchmarking.csv, with the
+#   columns of the hand-made files of the same names in data/ (times are the medians, as plain numbers)
+#  optimized_graph_benchmarking.csv, for the benchmarks those files have no columns for
+#  <commit>.json, every statistic of every benchmark along with the commit, date and system
+#
+# Comparing the JSON of two commits (--compare) lists every benchmark whose median got slower by more than the
+#  tolerance, which is what makes a regression in the hot path visible.
+#
+# --test runs test() instead of the benchmarks.
+#
+# The old benchmarking_*.py scripts are unchanged: each times its checks once on one treex() graph with an edge that
+#  breaks the rules, including graph.does_follow_rules_sparse(), and prints the times. This harness times the same
+#  checks, the sparse one too, over a sweep of depths with repeats.
+
+SUITES = ('rule_checks', 'isomorphism', 'optimized_graph', 'dedup')
+
+RULE_CHECK_COLUMNS = ['Tree Depth', 'Tree Width', 'Network Size', 'Optimized Time to Complete (s)',
+                      'Normal Time to Complete (s)', 'System']
+ISOMORPHISM_COLUMNS = ['Tree Width', 'Tree Depth', 'Network Size', 'Time to Complete Optimized Check (sec)',
+                       'Time to Complete Unoptimized Check (sec)',
+                       'Time to Complete Isomorphic Check (Isomorphic) (sec)',
+                       'Time to Complete Isomorphic Check (Non-Isomorphic) (sec)',
+                       'Optimized/Unoptimized Check Functions', 'Optimized Check Function/Isomorphic Check True',
+                       'Optimized Check Function/Isomorphic Check False']
+OPTIMIZED_GRAPH_COLUMNS = ['Network Size', 'Operation', 'Median Time (s)', '10th Percentile Time (s)',
+                           '90th Percentile Time (s)', 'Repeats', 'System']
+
+
+# measure()
+#
+# Times function(setup()) repeats times after warmup untimed calls
+#
+# setup Called before every call, untimed; its result is passed to function. Defaults to passing None.
+#
+# Returns the list of times in seconds
+def measure(function, setup=None, repeats=7, warmup=1):
+    times = []
+    for i in range(0, warmup + repeats):
+        argument = setup() if setup is not None else None
+        start = timeit.default_timer()
+        function(argument)
+        end = timeit.default_timer()
+        if i >= warmup:
+            times.append(end - start)
+    return times
+
+
+# summarize()
+#
+# Returns a dictionary of statistics of a list of times
+def summarize(times):
+    return {
+        'median': float(numpy.median(times)),
+        'p10': float(numpy.percentile(times, 10)),
+        'p90': float(numpy.percentile(times, 90)),
+        'min': min(times),
+        'max': max(times),
+        'repeats': len(times),
+    }
+
+
+# result()
+#
+# Returns the record of one benchmark: its name, the parameters it ran with and the statistics of its times
+def result(name, parameters, times):
+    return {'benchmark': name, 'parameters': parameters, 'stats': summarize(times)}
+
+
+# system_description()
+#
+# Returns a short description of the machine, for the System column
+def system_description():
+    return '%s %s' % (platform.processor() or platform.machine(), platform.platform())
+
+
+# current_commit()
+#
+# Returns the hash of the checked out git commit of this repository, or None outside a git checkout
+def current_commit():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=devnull,
+                                           cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# benchmark_rule_checks()
+#
+# Times graph.does_follow_rules() and graph.does_follow_rules_optimized() on the adjacency matrix of
+#  graph.treex(width, depth) for every depth, and graph.does_follow_rules_sparse() on the tree itself
+def benchmark_rule_checks(width, depths, repeats=7, warmup=1):
+    results = []
+    for depth in depths:
+        tree = graph.treex(width, depth)
+        matrix = nx.to_numpy_matrix(tree)
+        parameters = {'width': width, 'depth': depth, 'size': len(matrix)}
+        results.append(result('does_follow_rules_optimized', parameters,
+                              measure(lambda m: graph.does_follow_rules_optimized(m), lambda: matrix, repeats, warmup)))
+        results.append(result('does_follow_rules', parameters,
+                              measure(lambda m: graph.does_follow_rules(m), lambda: matrix, repeats, warmup)))
+        results.append(result('does_follow_rules_sparse', parameters,
+                              measure(graph.does_follow_rules_sparse, lambda: tree, repeats, warmup)))
+    return results
+
+
+# benchmark_isomorphism()
+#
+# Times nx.is_isomorphic() between graph.treex(width, depth) and a copy of itself, and between it and the same tree
+#  with one more edge, for every depth
+def benchmark_isomorphism(width, depths, repeats=7, warmup=1):
+    results = []
+    for depth in depths:
+        tree = graph.treex(width, depth)
+        different = graph.treex(width, depth)
+        different.add_edge(2, 3)
+        parameters = {'width': width, 'depth': depth, 'size': tree.number_of_nodes()}
+        results.append(result('is_isomorphic_true', parameters,
+                              measure(lambda g: nx.is_isomorphic(tree, g), tree.copy, repeats, warmup)))
+        results.append(result('is_isomorphic_false', parameters,
+                              measure(lambda g: nx.is_isomorphic(tree, g), different.copy, repeats, warmup)))
+    return results
+
+
+# tree_edges()
+#
+# Returns the edges of a tree on n vertices in which vertex i hangs off vertex (i - 1) // width
+def tree_edges(n, width=3):
+    return [((i - 1) // width, i) for i in range(1, n)]
+
+
+# benchmark_optimized_graph()
+#
+# Times building a tree on each number of vertices in an empty OptimizedGraph with add_edge(), and
+#  OptimizedGraph.does_follow_rules() on the result. The add_edge() statistics are per edge.
+def benchmark_optimized_graph(sizes, repeats=7, warmup=1, graph_class=OptimizedGraph):
+    results = []
+    for n in sizes:
+        edges = tree_edges(n)
+        parameters = {'size': n}
+
+        def build(optimized):
+            for a, b in edges:
+                optimized.add_edge(a, b)
+        times = measure(build, lambda: graph_class(n), repeats, warmup)
+        results.append(result('OptimizedGraph.add_edge', parameters, [t / max(len(edges), 1) for t in times]))
+
+        built = graph_class(n)
+        build(built)
+        results.append(result('OptimizedGraph.does_follow_rules', parameters,
+                              measure(lambda optimized: optimized.does_follow_rules(), lambda: built, repeats, warmup)))
+    return results
+
+
+# dedup_graphs()
+#
+# Returns count random relabellings each of classes random trees on n vertices, shuffled, from a fixed seed
+def dedup_graphs(n, classes=10, count=5):
+    generator = random.Random(n)
+    graphs = []
+    for i in range(0, classes):
+        edges = [(generator.randrange(0, v), v) for v in range(1, n)]
+        for j in range(0, count):
+            labels = range(0, n)
+            generator.shuffle(labels)
+            relabelled = nx.Graph()
+            relabelled.add_nodes_from(range(0, n))
+            relabelled.add_edges_from((labels[a], labels[b]) for a, b in edges)
+            graphs.append(relabelled)
+    generator.shuffle(graphs)
+    return graphs
+
+
+# benchmark_dedup()
+#
+# Times graph.filter_by_isomorphic() and graph.filter_by_canonical_form() on the graphs from dedup_graphs() for each
+#  number of vertices
+def benchmark_dedup(sizes, repeats=7, warmup=1):
+    results = []
+    for n in sizes:
+        graphs = dedup_graphs(n)
+        parameters = {'size': n, 'graphs': len(graphs)}
+        results.append(result('filter_by_isomorphic', parameters,
+                              measure(graph.filter_by_isomorphic, lambda: graphs, repeats, warmup)))
+        results.append(result('filter_by_canonical_form', parameters,
+                              measure(graph.filter_by_canonical_form, lambda: graphs, repeats, warmup)))
+    return results
+
+
+# find_median()
+#
+# Returns the median time of the benchmark with the given name and parameters in a list of results
+def find_median(results, name, parameters):
+    for entry in results:
+        if entry['benchmark'] == name and entry['parameters'] == parameters:
+            return entry['stats']['median']
+    return None
+
+
+# rule_check_rows()
+#
+# Returns the rows of does_follow_rules_optimization_benchmarking.csv for the results of benchmark_rule_checks()
+def rule_check_rows(results, system):
+    rows = []
+    for entry in results:
+        if entry['benchmark'] == 'does_follow_rules_optimized':
+            parameters = entry['parameters']
+            rows.append([parameters['depth'], parameters['width'], parameters['size'], entry['stats']['median'],
+                         find_median(results, 'does_follow_rules', parameters), system])
+    return rows
+
+
+# isomorphism_rows()
+#
+# Returns the rows of isomorphic_vs_optimized_check_benchmarking.csv for the results of benchmark_rule_checks() and
+#  benchmark_isomorphism() over the same trees; the last three columns are percentages
+def isomorphism_rows(results):
+    rows = []
+    for entry in results:
+        if entry['benchmark'] == 'is_isomorphic_true':
+            parameters = entry['parameters']
+            optimized = find_median(results, 'does_follow_rules_optimized', parameters)
+            normal = find_median(results, 'does_follow_rules', parameters)
+            true = entry['stats']['median']
+            false = find_median(results, 'is_isomorphic_false', parameters)
+            if optimized is None or normal is None:
+                continue
+            rows.append([parameters['width'], parameters['depth'], parameters['size'], optimized, normal, true, false,
+                         100.0 * optimized / normal, 100.0 * true / optimized, 100.0 * false / optimized])
+    return rows
+
+
+# optimized_graph_rows()
+#
+# Returns the rows of optimized_graph_benchmarking.csv for the results of benchmark_optimized_graph() and
+#  benchmark_dedup()
+def optimized_graph_rows(results, system):
+    rows = []
+    for entry in results:
+        if entry['benchmark'].startswith('OptimizedGraph.') or entry['benchmark'].startswith('filter_by_'):
+            stats = entry['stats']
+            rows.append([entry['parameters']['size'], entry['benchmark'], stats['median'], stats['p10'], stats['p90'],
+                         stats['repeats'], system])
+    return rows
+
+
+# write_csv()
+#
+# Writes a header line and rows to a CSV file; does nothing if there are no rows
+def write_csv(path, columns, rows):
+    if not rows:
+        return
+    with open(path, 'wb') as output:
+        writer = csv.writer(output)
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+# compare()
+#
+# Returns the benchmarks whose median is more than tolerance (a fraction) slower in current than in baseline, as a
+#  list of (benchmark, parameters, baseline median, current median)
+#
+# baseline, current Dictionaries in the format of the JSON files main() writes
+def compare(baseline, current, tolerance=0.2):
+    regressions = []
+    for entry in current['results']:
+        old = find_median(baseline['results'], entry['benchmark'], entry['parameters'])
+        new = entry['stats']['median']
+        if old is not None and new > old * (1 + tolerance):
+            regressions.append((entry['benchmark'], entry['parameters'], old, new))
+    return regressions
+
+
+# print_results()
+#
+# Prints a table of the results
+def print_results(results):
+    print '%-36s %-40s %12s %12s %12s' % ('Benchmark', 'Parameters', 'Median (s)', 'p10 (s)', 'p90 (s)')
+    for entry in results:
+        parameters = ', '.join('%s=%s' % item for item in sorted(entry['parameters'].items()))
+        stats = entry['stats']
+        print '%-36s %-40s %12.6g %12.6g %12.6g' % (entry['benchmark'], parameters, stats['median'], stats['p10'],
+                                                   stats['p90'])
+
+
+# main()
+#
+# Runs the benchmarks chosen on the command line (see --help) and writes the results to the output directory
+#
+# Returns the exit status: 1 if --compare found a regression, otherwise 0
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the rule checks, OptimizedGraph and isomorphism '
+                                                 'filtering.')
+    parser.add_argument('--suites', default=','.join(SUITES),
+                        help='comma separated suites to run, from %s' % ', '.join(SUITES))
+    parser.add_argument('--width', type=int, default=3, help='tree width for rule_checks and isomorphism')
+    parser.add_argument('--max-depth', type=int, default=6, help='largest tree depth for rule_checks and isomorphism')
+    parser.add_argument('--sizes', default='10,20,40,80', help='comma separated vertex counts for optimized_graph '
+                                                               'and dedup')
+    parser.add_argument('--repeats', type=int, default=7, help='timed calls per benchmark')
+    parser.add_argument('--warmup', type=int, default=1, help='untimed calls before the timed ones')
+    parser.add_argument('--quick', action='store_true', help='small trees and graphs only, for a fast check')
+    parser.add_argument('--output', default=os.path.join('data', 'benchmarks'), help='directory to write results to')
+    parser.add_argument('--compare', metavar='BASELINE', help='JSON results of an earlier run to check against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='slowdown counted as a regression by --compare')
+    parser.add_argument('--test', action='store_true', help="run this module's tests instead of the benchmarks")
+    options = parser.parse_args(arguments)
+    if options.test:
+        test()
+        return 0
+
+    suites = options.suites.split(',')
+    depths = range(1, (4 if options.quick else options.max_depth) + 1)
+    sizes = [int(n) for n in options.sizes.split(',')]
+    if options.quick:
+        sizes = [n for n in sizes if n <= 40]
+    system = system_description()
+
+    results = []
+    if 'rule_checks' in suites or 'isomorphism' in suites:
+        results += benchmark_rule_checks(options.width, depths, options.repeats, options.warmup)
+    if 'isomorphism' in suites:
+        results += benchmark_isomorphism(options.width, depths, options.repeats, options.warmup)
+    if 'optimized_graph' in suites:
+        results += benchmark_optimized_graph(sizes, options.repeats, options.warmup)
+    if 'dedup' in suites:
+        results += benchmark_dedup(sizes, options.repeats, options.warmup)
+    print_results(results)
+
+    if not os.path.isdir(options.output):
+        os.makedirs(options.output)
+    if 'rule_checks' in suites:
+        write_csv(os.path.join(options.output, 'does_follow_rules_optimization_benchmarking.csv'),
+                  RULE_CHECK_COLUMNS, rule_check_rows(results, system))
+    if 'isomorphism' in suites:
+        write_csv(os.path.join(options.output, 'isomorphic_vs_optimized_check_benchmarking.csv'),
+                  ISOMORPHISM_COLUMNS, isomorphism_rows(results))
+    write_csv(os.path.join(options.output, 'optimized_graph_benchmarking.csv'), OPTIMIZED_GRAPH_COLUMNS,
+              optimized_graph_rows(results, system))
+
+    commit = current_commit()
+    report = {
+        'commit': commit,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'system': system,
+        'python': platform.python_version(),
+        'repeats': options.repeats,
+        'warmup': options.warmup,
+        'results': results,
+    }
+    report_path = os.path.join(options.output, '%s.json' % (commit or 'results'))
+    with open(report_path, 'w') as output:
+        json.dump(report, output, indent=1, sort_keys=True)
+    print 'Wrote', report_path
+
+    if options.compare:
+        with open(options.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(baseline, report, options.tolerance)
+        for name, parameters, old, new in regressions:
+            print 'REGRESSION %s %s: %.6g s -> %.6g s (%+.0f%%)' % (name, parameters, old, new, 100.0 * (new / old - 1))
+        if regressions:
+            return 1
+        print 'No regressions against', options.compare, 'from commit', baseline.get('commit')
+    return 0
+
+
+# test()
+#
+# Checks the statistics, the CSV and JSON output and --compare on small synthetic runs
+def test():
+    import shutil
+    import tempfile
+
+    print 'Testing measure() and summarize()'
+    calls = []
+    times = measure(calls.append, lambda: len(calls), repeats=5, warmup=2)
+    assert len(times) == 5 and calls == range(0, 7)
+    stats = summarize([5.0, 1.0, 4.0, 2.0, 3.0])
+    assert stats['median'] == 3.0 and stats['min'] == 1.0 and stats['max'] == 5.0 and stats['repeats'] == 5
+    # numpy interpolates linearly between the sorted times
+    assert abs(stats['p10'] - 1.4) < 1e-9 and abs(stats['p90'] - 4.6) < 1e-9
+    assert summarize([2.0, 1.0])['median'] == 1.5
+    print 'Passed.'
+
+    print 'Testing compare()'
+    parameters = {'size': 10}
+    baseline = {'results': [result('fast', parameters, [1.0]), result('slow', parameters, [1.0]),
+                            result('gone', parameters, [1.0])]}
+    current = {'results': [result('fast', parameters, [1.1]), result('slow', parameters, [1.5]),
+                           result('new', parameters, [9.0]), result('slow', {'size': 20}, [9.0])]}
+    # only benchmarks in both runs with the same parameters are compared
+    assert compare(baseline, current, 0.2) == [('slow', parameters, 1.0, 1.5)]
+    assert compare(baseline, current, 0.6) == []
+    print 'Passed.'
+
+    print 'Testing the CSV and JSON output and --compare'
+    directory = tempfile.mkdtemp()
+    try:
+        arguments = ['--suites', 'rule_checks,optimized_graph', '--quick', '--sizes', '10,20', '--repeats', '2',
+                     '--warmup', '0', '--output', directory]
+        assert main(arguments) == 0
+        with open(os.path.join(directory, 'does_follow_rules_optimization_benchmarking.csv')) as rule_checks:
+            rows = list(csv.reader(rule_checks))
+        assert rows[0] == RULE_CHECK_COLUMNS
+        assert [int(row[0]) for row in rows[1:]] == range(1, 5)
+        with open(os.path.join(directory, 'optimized_graph_benchmarking.csv')) as optimized:
+            rows = list(csv.reader(optimized))
+        assert rows[0] == OPTIMIZED_GRAPH_COLUMNS and len(rows) == 1 + 2 * 2
+        assert not os.path.exists(os.path.join(directory, 'isomorphic_vs_optimized_check_benchmarking.csv'))
+
+        report_path = os.path.join(directory, '%s.json' % (current_commit() or 'results'))
+        with open(report_path) as report_file:
+            report = json.load(report_file)
+        assert len(report['results']) == 3 * 4 + 2 * 2
+        for entry in report['results']:
+            assert entry['stats']['repeats'] == 2
+            assert entry['stats']['p10'] <= entry['stats']['median'] <= entry['stats']['p90']
+
+        # a baseline far faster than anything can run is a regression; one far slower isn't
+        for scale, status in ((1e-9, 1), (1e9, 0)):
+            for entry in report['results']:
+                for key in ('median', 'p10', 'p90', 'min', 'max'):
+                    entry['stats'][key] = 1.0 * scale
+            baseline_path = os.path.join(directory, 'baseline.json')
+            with open(baseline_path, 'w') as baseline_file:
+                json.dump(report, baseline_file)
+            assert main(arguments + ['--compare', baseline_path]) == status
+    finally:
+        shutil.rmtree(directory)
+    print 'Passed.'
+
+
+# If somebody ever runs this file, run the benchmarks, or test() with --test
+if __name__ == '__main__':
+    sys.exit(main())
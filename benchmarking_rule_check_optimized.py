@@ -13,18 +13,25 @@ if __name__ == "__main__":
     follows_rules_optimized = graph.does_follow_rules_optimized(nx.to_numpy_matrix(G))
     end_optimized = time()
 
+    start_sparse = time()
+    follows_rules_sparse = graph.does_follow_rules_sparse(G)
+    end_sparse = time()
+
     start_normal = time()
     follows_rules = graph.does_follow_rules(nx.to_numpy_matrix(G))
     end_normal = time()
 
     optimized_duration = end_optimized - start_optimized
     normal_duration = end_normal - start_normal
+    sparse_duration = end_sparse - start_sparse
 
     if follows_rules != follows_rules_optimized:
         print "The functions disagree. This is a huge problem."
 
     print "Follows rules: ", follows_rules
+    print "Follows rules (sparse): ", follows_rules_sparse
     print "Time optimized: ", optimized_duration, "seconds"
     print "Time slow: ", normal_duration, "seconds"
+    print "Time sparse: ", sparse_duration, "seconds"
 
     print "The optimized algorithm ran in ", optimized_duration/normal_duration*100, "% of the time as the normal algorithm."
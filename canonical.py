@@ -0,0 +1,432 @@
+import random
+
+# Canonical labelling of small simple graphs
+#
+# Two graphs are isomorphic exactly when their canonical labellings produce the same adjacency matrix. Comparing
+#  that matrix (packed into an int) replaces an nx.is_isomorphic() call with an equality test, and the automorphisms
+#  found on the way tell us which vertices and edges of a graph are interchangeable.
+#
+# Graphs are given as a list of neighbourhood bitsets like BitsetGraph.neighbourhoods: bit x of neighbourhoods[v] is
+#  set iff there is an edge from v to x. See neighbourhoods_from_sets() and neighbourhoods_from_networkx().
+#
+# The algorithm is the individualisation-refinement scheme behind McKay's nauty, kept as simple as possible:
+#
+# 1. Split the vertices into ordered cells by how many neighbours they have in each cell until nothing changes
+#     (refine()). This only uses information that an isomorphism preserves.
+# 2. If a cell still holds several vertices, try each of them in turn as a cell of its own ("individualise") and
+#     repeat from 1. Each branch ends in an ordering of all the vertices.
+# 3. Of all the orderings reached, keep the one whose relabelled adjacency matrix is largest.
+#
+# Two orderings giving the same matrix differ by an automorphism. Those automorphisms are used to skip branches that
+#  are images of branches already explored, which keeps graphs with many symmetries (like the empty graph) cheap.
+
+
+# popcount()
+#
+# Returns the number of set bits in a whole number
+def popcount(mask):
+    return bin(mask).count('1')
+
+
+# neighbourhoods_from_sets()
+#
+# Converts a list of neighbour sets (see OptimizedGraph.neighbours) to a list of neighbourhood bitsets
+def neighbourhoods_from_sets(neighbour_sets):
+    neighbourhoods = []
+    for neighbours in neighbour_sets:
+        mask = 0
+        for x in neighbours:
+            mask |= 1 << x
+        neighbourhoods.append(mask)
+    return neighbourhoods
+
+
+# neighbourhoods_from_edges()
+#
+# Builds the neighbourhood bitsets of a graph on n vertices from a list of (a, b) pairs
+def neighbourhoods_from_edges(n, edges):
+    neighbourhoods = [0] * n
+    for a, b in edges:
+        neighbourhoods[a] |= 1 << b
+        neighbourhoods[b] |= 1 << a
+    return neighbourhoods
+
+
+# neighbourhoods_from_networkx()
+#
+# Builds the neighbourhood bitsets of a networkx graph. Vertices are numbered in the order of graph.nodes().
+def neighbourhoods_from_networkx(graph):
+    index = {}
+    for node in graph.nodes():
+        index[node] = len(index)
+    return neighbourhoods_from_edges(len(index), [(index[a], index[b]) for a, b in graph.edges() if a != b])
+
+
+# refine()
+#
+# Returns the coarsest equitable refinement of an ordered partition of the vertices.
+#
+# cells A list of lists of vertices
+# splitters The cells of cells to start the queue with (see below); defaults to all of them. A partition that was
+#  equitable before one of its cells was split only needs the pieces of that cell, less the largest.
+#
+# A cell is split whenever its vertices have different numbers of neighbours in some cell (the splitter). The pieces
+#  replace it in order of that number, so the result only depends on the graph up to isomorphism.
+#
+# Cells wait in a queue to be used as splitters, starting with all of them. When a cell splits, its pieces join the
+#  queue in its place if it was still waiting; otherwise every piece but the first largest one joins, since the
+#  partition is already equitable with respect to the whole cell and so to the last piece once it is to the others
+#  (Hopcroft's trick, as in nauty). Each splitter is used once instead of rescanning every cell after every split.
+def refine(neighbourhoods, cells, splitters=None):
+    cells = list(cells)
+    queue = list(cells if splitters is None else splitters)
+    waiting = set(id(cell) for cell in queue)
+    cell_index = [0] * len(neighbourhoods)
+    for index, cell in enumerate(cells):
+        for v in cell:
+            cell_index[v] = index
+
+    while queue:
+        splitter_cell = queue.pop(0)
+        waiting.discard(id(splitter_cell))
+
+        # how many neighbours each vertex has in the splitter; vertices with none can only split a cell alongside
+        #  vertices with some, so only the cells of the vertices counted are looked at
+        counts = {}
+        for v in splitter_cell:
+            mask = neighbourhoods[v]
+            while mask:
+                low = mask & -mask
+                x = low.bit_length() - 1
+                counts[x] = counts.get(x, 0) + 1
+                mask ^= low
+
+        # in cell order, so that the queue, and with it the result, doesn't depend on how the vertices are numbered
+        split = {}
+        for index in sorted(set(cell_index[x] for x in counts)):
+            cell = cells[index]
+            if len(cell) == 1:
+                continue
+            groups = {}
+            for v in cell:
+                groups.setdefault(counts.get(v, 0), []).append(v)
+            if len(groups) == 1:
+                continue
+            pieces = [groups[count] for count in sorted(groups)]
+            split[index] = pieces
+
+            if id(cell) in waiting:
+                waiting.discard(id(cell))
+                position = next(i for i in range(0, len(queue)) if queue[i] is cell)
+                queue[position:position + 1] = pieces
+                new_waiting = pieces
+            else:
+                largest = max(range(0, len(pieces)), key=lambda i: (len(pieces[i]), -i))
+                new_waiting = pieces[:largest] + pieces[largest + 1:]
+                queue.extend(new_waiting)
+            for piece in new_waiting:
+                waiting.add(id(piece))
+
+        if split:
+            split_cells = []
+            for index, cell in enumerate(cells):
+                split_cells.extend(split.get(index, [cell]))
+            cells = split_cells
+            for index, cell in enumerate(cells):
+                for v in cell:
+                    cell_index[v] = index
+    return cells
+
+
+# CanonicalLabelling
+#
+# Computes the canonical labelling of a graph; see module docs.
+#
+# neighbourhoods A list of neighbourhood bitsets
+# colours An optional list giving each vertex a colour (any sortable value); isomorphisms must preserve colours
+#
+# After construction:
+#
+# self.labelling:       self.labelling[i] is the vertex that gets label i
+# self.certificate:     a hashable value equal for two graphs iff they are isomorphic (colours included)
+# self.automorphisms:   a list of permutations (lists) that generate the automorphism group
+class CanonicalLabelling:
+    # __init__()
+    #
+    # constructor
+    #
+    # runs the search
+    def __init__(self, neighbourhoods, colours=None):
+        self.neighbourhoods = neighbourhoods
+        self.size = len(neighbourhoods)
+        self.automorphisms = []
+
+        self.first_path = None
+        self.first_labelling = None
+        self.first_bits = None
+        self.best_labelling = None
+        self.best_bits = None
+
+        # the starting partition groups vertices by colour, in order of colour
+        if colours is None:
+            cells = [range(0, self.size)]
+            colour_key = ()
+        else:
+            by_colour = {}
+            for v in range(0, self.size):
+                by_colour.setdefault(colours[v], []).append(v)
+            cells = [by_colour[colour] for colour in sorted(by_colour)]
+            colour_key = tuple([(colour, len(by_colour[colour])) for colour in sorted(by_colour)])
+
+        if self.size > 0:
+            self.search(cells, [])
+        else:
+            self.best_labelling = []
+            self.best_bits = 0
+
+        self.labelling = self.best_labelling
+        self.certificate = (self.size, colour_key, self.best_bits)
+
+    # relabelled_bits()
+    #
+    # Packs the lower triangle of the adjacency matrix under a labelling into an int, row by row
+    def relabelled_bits(self, labelling):
+        bits = 0
+        for i in range(1, self.size):
+            row_mask = self.neighbourhoods[labelling[i]]
+            for j in range(0, i):
+                bits = (bits << 1) | ((row_mask >> labelling[j]) & 1)
+        return bits
+
+    # is_orbit_minimum()
+    #
+    # Returns True iff v is the smallest vertex in its orbit under the automorphisms found so far that fix every
+    #  vertex of path. Branches for other vertices of the orbit would only repeat the branch for the minimum.
+    def is_orbit_minimum(self, v, path):
+        parent = range(0, self.size)
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for automorphism in self.automorphisms:
+            fixes_path = True
+            for p in path:
+                if automorphism[p] != p:
+                    fixes_path = False
+                    break
+            if fixes_path:
+                for x in range(0, self.size):
+                    root_a = find(x)
+                    root_b = find(automorphism[x])
+                    if root_a != root_b:
+                        parent[max(root_a, root_b)] = min(root_a, root_b)
+
+        # roots are always the smallest member of their set
+        return find(v) == v
+
+    # search()
+    #
+    # Explores the search tree below the partition cells reached by individualising the vertices in path.
+    #
+    # Returns the depth of the node the search should continue from. Normally that's the parent, but after finding an
+    #  automorphism back to the first leaf, the search jumps straight back to where it left the first path.
+    def search(self, cells, path, splitters=None):
+        cells = refine(self.neighbourhoods, cells, splitters)
+        level = len(path)
+
+        target = None
+        for index in range(0, len(cells)):
+            if len(cells[index]) > 1:
+                target = index
+                break
+        if target is None:
+            return self.leaf(cells, path)
+
+        for v in sorted(cells[target]):
+            if not self.is_orbit_minimum(v, path):
+                continue
+            rest = [w for w in cells[target] if w != v]
+            individual = [v]
+            child = cells[:target] + [individual, rest] + cells[target + 1:]
+            # cells was equitable, so only the individualised vertex needs to split the rest
+            resume = self.search(child, path + [v], [individual])
+            if resume < level:
+                return resume
+        return level - 1
+
+    # leaf()
+    #
+    # Handles a discrete partition: compares its labelling with the first and best ones so far
+    def leaf(self, cells, path):
+        labelling = [cell[0] for cell in cells]
+        bits = self.relabelled_bits(labelling)
+
+        if self.first_labelling is None:
+            self.first_path = path
+            self.first_labelling = labelling
+            self.first_bits = bits
+            self.best_labelling = labelling
+            self.best_bits = bits
+            return len(path) - 1
+
+        if bits == self.first_bits:
+            self.automorphisms.append(self.mapping(self.first_labelling, labelling))
+            common = 0
+            while common < len(path) and common < len(self.first_path) and path[common] == self.first_path[common]:
+                common += 1
+            return common
+
+        if bits == self.best_bits:
+            self.automorphisms.append(self.mapping(self.best_labelling, labelling))
+        elif bits > self.best_bits:
+            self.best_labelling = labelling
+            self.best_bits = bits
+        return len(path) - 1
+
+    # mapping()
+    #
+    # Returns the permutation taking each vertex of labelling_a to the vertex with the same label in labelling_b
+    def mapping(self, labelling_a, labelling_b):
+        permutation = [0] * self.size
+        for i in range(0, self.size):
+            permutation[labelling_a[i]] = labelling_b[i]
+        return permutation
+
+    # canonical_edge()
+    #
+    # Returns the edge of the graph whose endpoints get the largest pair of canonical labels, or None if there are no
+    #  edges. It only depends on the graph up to isomorphism, so it can be used as the canonical edge to delete in
+    #  canonical augmentation.
+    def canonical_edge(self):
+        for i in range(self.size - 1, 0, -1):
+            for j in range(i - 1, -1, -1):
+                a = self.labelling[i]
+                b = self.labelling[j]
+                if (self.neighbourhoods[a] >> b) & 1:
+                    return (min(a, b), max(a, b))
+        return None
+
+    # pair_orbits()
+    #
+    # Returns a dictionary mapping each pair in pairs to the smallest pair in its orbit under the automorphism group.
+    #
+    # pairs A list of (a, b) pairs with a < b that the automorphism group maps onto itself, for example the edges or
+    #  the non-edges of the graph
+    def pair_orbits(self, pairs):
+        parent = {}
+        for pair in pairs:
+            parent[pair] = pair
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for automorphism in self.automorphisms:
+            for a, b in pairs:
+                image = (min(automorphism[a], automorphism[b]), max(automorphism[a], automorphism[b]))
+                root_a = find((a, b))
+                root_b = find(image)
+                if root_a != root_b:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+
+        orbits = {}
+        for pair in pairs:
+            orbits[pair] = find(pair)
+        return orbits
+
+
+# canonical_form()
+#
+# Returns the certificate of a graph given as neighbourhood bitsets; equal certificates mean isomorphic graphs.
+#
+# See CanonicalLabelling
+def canonical_form(neighbourhoods, colours=None):
+    return CanonicalLabelling(neighbourhoods, colours).certificate
+
+
+# test()
+#
+# Uses assert keyword to test canonical labelling against nx.is_isomorphic
+#
+# networkx is required
+def test():
+    import networkx as nx
+
+    rng = random.Random(0)
+
+    print 'Testing relabelled random graphs get equal certificates...'
+    for size in range(0, 16):
+        for trial in range(0, 20):
+            edges = [(a, b) for a in range(0, size) for b in range(0, a) if rng.random() < 0.3]
+            permutation = range(0, size)
+            rng.shuffle(permutation)
+            relabelled = [(permutation[a], permutation[b]) for a, b in edges]
+
+            labelling = CanonicalLabelling(neighbourhoods_from_edges(size, edges))
+            assert labelling.certificate == canonical_form(neighbourhoods_from_edges(size, relabelled))
+
+            # every automorphism found must really be one
+            for automorphism in labelling.automorphisms:
+                mapped = set([(min(automorphism[a], automorphism[b]), max(automorphism[a], automorphism[b]))
+                              for a, b in edges])
+                assert mapped == set([(min(a, b), max(a, b)) for a, b in edges])
+    print 'Passed.'
+
+    print 'Testing relabelled regular and vertex-transitive graphs get equal certificates...'
+    # refine() leaves their cells big, so these are the graphs where the order cells are split in matters
+    graphs = [nx.petersen_graph(), nx.heawood_graph(), nx.desargues_graph(), nx.dodecahedral_graph(),
+              nx.circulant_graph(20, [1, 5]), nx.convert_node_labels_to_integers(nx.hypercube_graph(4))]
+    graphs += [nx.random_regular_graph(degree, size, seed=seed) for degree, size, seed in
+               ((3, 20, 1), (3, 30, 2), (4, 39, 39), (4, 30, 4), (5, 24, 5))]
+    for graph in graphs:
+        size = graph.number_of_nodes()
+        certificates = set()
+        for trial in range(0, 10):
+            permutation = range(0, size)
+            rng.shuffle(permutation)
+            certificates.add(canonical_form(neighbourhoods_from_edges(size, [(permutation[a], permutation[b])
+                                                                             for a, b in graph.edges()])))
+        assert len(certificates) == 1
+    print 'Passed.'
+
+    print 'Testing certificates agree with nx.is_isomorphic()...'
+    for size in range(1, 9):
+        graphs = []
+        for trial in range(0, 60):
+            graph = nx.Graph()
+            graph.add_nodes_from(range(0, size))
+            graph.add_edges_from([(a, b) for a in range(0, size) for b in range(0, a) if rng.random() < 0.4])
+            graphs.append(graph)
+        certificates = [canonical_form(neighbourhoods_from_networkx(graph)) for graph in graphs]
+        for i in range(0, len(graphs)):
+            for j in range(0, i):
+                assert (certificates[i] == certificates[j]) == nx.is_isomorphic(graphs[i], graphs[j])
+    print 'Passed.'
+
+    print 'Testing automorphism group orders...'
+    # (graph, |Aut|): empty, cycle, petersen
+    cases = [(nx.empty_graph(8), 40320), (nx.cycle_graph(9), 18), (nx.petersen_graph(), 120)]
+    for graph, order in cases:
+        labelling = CanonicalLabelling(neighbourhoods_from_networkx(graph))
+        # the orbit of every point under the generated group, closed under composition
+        group = set([tuple(range(0, graph.number_of_nodes()))])
+        frontier = list(group)
+        while frontier:
+            element = frontier.pop()
+            for generator in labelling.automorphisms:
+                product = tuple([generator[x] for x in element])
+                if product not in group:
+                    group.add(product)
+                    frontier.append(product)
+        assert len(group) == order
+    print 'Passed.'
+
+
+# If somebody ever runs this file, invoke test()
+if __name__ == '__main__':
+    test()
@@ -1,5 +1,8 @@
-# This is a work-in-progress psuedocode file for the final extremal graph finding algorithm
+# This is a work-in-progress file for the final extremal graph finding algorithm
 from math import pow, sqrt, floor
+from time import time
+import json
+import os
 from OptimizedGraph import OptimizedGraph
 
 
@@ -15,6 +18,631 @@ def upper_bound(n):
      + (n / 3.0))
 
 
+# non_increasing_sequences()
+#
+# Generates every non-increasing sequence of length whole numbers, each at most cap, whose sum is at most total.
+#
+# Used to enumerate seed trees; see seed_trees()
+def non_increasing_sequences(total, length, cap):
+    if length == 0:
+        yield ()
+        return
+    for first in range(min(cap, total), -1, -1):
+        for rest in non_increasing_sequences(total - first, length - 1, first):
+            yield (first,) + rest
+
+
+# seed_trees()
+#
+# Generates every "tree type" the search starts from as (max_degree, child_counts) pairs.
+#
+# Every graph that follows the rules can be labelled so that vertex 0 has the maximum degree and its neighbours are
+#  1..max_degree. No two of those neighbours are adjacent (c3) or share a neighbour other than 0 (c4), so the
+#  vertices at distance 2 from vertex 0 each hang off exactly one of them. Label those children consecutively,
+#  most children first, and the first two levels of the graph are exactly the tree
+#
+#              0
+#        /     |     \
+#       1      2      3          max_degree = 3
+#      / \     |                 child_counts = (2, 1, 0)
+#     4   5    6
+#
+# Vertices 0..max_degree then have their final degree and every remaining edge is between vertices > max_degree.
+#
+# Seeds with the most edges are generated first since they're the most likely to lead to large graphs.
+def seed_trees(n):
+    seeds = []
+    for max_degree in range(n - 1, 0, -1):
+        for child_counts in non_increasing_sequences(n - 1 - max_degree, max_degree, max_degree - 1):
+            seeds.append((max_degree, child_counts))
+    seeds.sort(key=lambda seed: -(seed[0] + sum(seed[1])))
+    return seeds
+
+
+# plant_seed_tree()
+#
+# Adds the edges of a seed tree (see seed_trees()) to an empty graph and returns them as a list of pairs
+def plant_seed_tree(graph, max_degree, child_counts):
+    edges = []
+    for i in range(1, max_degree + 1):
+        edges.append((0, i))
+    next_vertex = max_degree + 1
+    for i in range(0, len(child_counts)):
+        for child in range(0, child_counts[i]):
+            edges.append((i + 1, next_vertex))
+            next_vertex += 1
+    for a, b in edges:
+        graph.add_edge(a, b)
+    return edges
+
+
+# violates_deletion_bound()
+#
+# Returns True if no graph with at least target edges can have these (upper bounds on) final degrees.
+#
+# Deleting any k vertices from a graph with e edges that follows the rules leaves a graph on n - k vertices that
+#  follows the rules, so it has at most s(n - k) edges. The deleted vertices covered every removed edge, so the k
+#  smallest degrees must sum to at least e - s(n - k).
+#
+# final_degrees A list of upper bounds on the final degree of each vertex
+# known_sizes A dictionary mapping vertex counts m to s(m)
+def violates_deletion_bound(final_degrees, target, known_sizes):
+    n = len(final_degrees)
+    final_degrees = sorted(final_degrees)
+    total = 0
+    for k in range(1, n):
+        total += final_degrees[k - 1]
+        if (n - k) in known_sizes and total < target - known_sizes[n - k]:
+            return True
+    return False
+
+
+# BranchAndBound
+#
+# Exhaustive search for the size of an extremal graph on n vertices that follows the rules of this research.
+#
+# For every seed tree (see seed_trees()) the remaining edges are decided by a depth first search. Each node of the
+#  search tree picks a candidate edge and first explores the branch that includes it, then the branch that excludes
+#  it. Including an edge is undone with the graph's pop_state() when the search backtracks.
+#
+# A branch is pruned as soon as it provably can't beat the best graph found so far. With target = best + 1:
+#
+# 1. Capacity: no vertex may exceed the seed's max degree, so the branch can add at most
+#     sum(min(legal candidates at v, max_degree - degree(v))) / 2 more edges.
+# 2. Vertex deletion: deleting any k vertices from a graph with e edges leaves at most s(n - k) edges, so the k
+#     smallest final degrees must sum to at least target - s(n - k). Uses the sizes already known for smaller n.
+# 3. Symmetry: vertex 0 is the maximum degree vertex with the most vertices at distance 2, so any other vertex that
+#     reaches max_degree must not beat it.
+#
+# Additionally, whenever an edge (a, b) is excluded, so are the edges (a, u) for every vertex u that is
+#  interchangeable with b (same neighbours, nothing excluded) and vice versa; those branches would only repeat the
+#  one that included (a, b) up to isomorphism.
+#
+# The candidate edge at each node is taken at the vertex with the least room to grow, joined to the candidate
+#  neighbour with the highest degree, so that hopeless branches fail early and the rest fill in dense regions first.
+#
+# known_sizes A dictionary mapping smaller vertex counts m to s(m); see find_extremal_graph_size()
+class BranchAndBound:
+    INCLUDED = 0
+    EXCLUDED = 1
+    CHECKPOINT_VERSION = 1
+
+    # __init__()
+    #
+    # constructor
+    #
+    # shared_best An optional multiprocessing.Value holding the best edge count found by any process; see
+    #  parallel_search.py. Branches that can't beat it are pruned and improvements are written back to it.
+    # checkpoint_path If given, run() writes a checkpoint to this file every checkpoint_interval seconds and once more
+    #  when it finishes. See write_checkpoint() and load_checkpoint().
+    # checkpoint_check_nodes How many nodes to visit between reading the clock to see if a checkpoint is due
+    # instrumentation An optional Instrumentation to count nodes and prunes and time the phases of each node in; see
+    #  instrumentation.py
+    def __init__(self, n, known_sizes=None, graph_class=OptimizedGraph, shared_best=None, checkpoint_path=None,
+                 checkpoint_interval=60, instrumentation=None, checkpoint_check_nodes=1024):
+        self.n = n
+        self.known_sizes = known_sizes if known_sizes is not None else {}
+        self.graph_class = graph_class
+        self.shared_best = shared_best
+        self.instrumentation = instrumentation
+
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        # the clock is only read every checkpoint_check_nodes nodes so that checkpointing costs next to nothing
+        self.checkpoint_check_nodes = checkpoint_check_nodes
+        self.next_checkpoint_check = checkpoint_check_nodes
+        self.last_checkpoint = time()
+
+        # where run() starts: the index of a seed tree in seed_trees(n) and the decisions to replay in it
+        self.seed_index = 0
+        self.resume_decisions = []
+
+        # upper_bound() only holds once there is room for a cycle
+        if n > 2:
+            self.bound = int(upper_bound(n))
+        else:
+            self.bound = n * (n - 1) // 2
+
+        # every edge survives in exactly n - 2 of the n vertex deleted subgraphs
+        if n > 2 and (n - 1) in self.known_sizes:
+            self.bound = min(self.bound, n * self.known_sizes[n - 1] // (n - 2))
+
+        self.best_edge_count = 0
+        self.best_edges = []
+        self.nodes = 0
+
+    # run()
+    #
+    # Searches every seed tree and returns the size of the extremal graph. The graph itself is left in best_edges.
+    #
+    # After load_checkpoint(), carries on from where the checkpoint was written.
+    def run(self):
+        seeds = seed_trees(self.n)
+        for seed_index in range(self.seed_index, len(seeds)):
+            max_degree, child_counts = seeds[seed_index]
+            decisions = self.resume_decisions if seed_index == self.seed_index else ()
+            # a seed tree that was started before the checkpoint is finished as it would have been
+            if not decisions:
+                if self.best_edge_count >= self.bound:
+                    break
+                # a graph with max degree max_degree can't have more than n * max_degree / 2 edges
+                if self.n * max_degree // 2 <= self.best_edge_count:
+                    continue
+            self.seed_index = seed_index
+            self.search_seed(max_degree, child_counts, decisions, resume=True)
+
+        # a finished search resumes straight to its result
+        self.seed_index = len(seeds)
+        self.resume_decisions = []
+        if self.checkpoint_path is not None:
+            self.write_checkpoint([])
+        return self.best_edge_count
+
+    # split()
+    #
+    # Splits the search into independent subproblems instead of running it.
+    #
+    # Returns a list of (max_degree, child_counts, decisions) tuples, one for every node split_depth decisions below
+    #  the root of each seed tree, where decisions is the list of (pair, INCLUDED or EXCLUDED) leading to it. Running
+    #  search_seed() on each of them covers the same graphs as run(). Nodes above split_depth are visited (and may
+    #  update best_edges) as usual.
+    def split(self, split_depth):
+        subproblems = []
+        for max_degree, child_counts in seed_trees(self.n):
+            if self.n * max_degree // 2 <= self.best_edge_count:
+                continue
+            for decisions in self.search_seed(max_degree, child_counts, split_depth=split_depth):
+                subproblems.append((max_degree, child_counts, decisions))
+        return subproblems
+
+    # start_seed()
+    #
+    # Resets the search state to a freshly planted seed tree
+    def start_seed(self, max_degree, child_counts):
+        self.max_degree = max_degree
+        self.child_counts = child_counts
+        self.graph = self.graph_class(self.n)
+        self.seed_edges = plant_seed_tree(self.graph, max_degree, child_counts)
+        self.edge_count = len(self.seed_edges)
+
+        self.degrees = [len(self.graph.neighbours[v]) for v in range(0, self.n)]
+        self.free_vertices = range(max_degree + 1, self.n)
+        self.candidate_pairs = [(a, b) for a in self.free_vertices for b in self.free_vertices if a < b]
+        self.excluded = set()
+        self.exclusion_counts = [0] * self.n
+
+    # search_seed()
+    #
+    # Depth first search of all graphs that grow from one seed tree
+    #
+    # decisions An optional list of (pair, INCLUDED or EXCLUDED) to replay first; only the subtree below them is
+    #  searched. See split().
+    # split_depth If given, nodes this many decisions below the replayed ones aren't searched but returned as a list
+    #  of decision lists. See split().
+    # resume If True, the replayed decisions are backtracked through like any others, so the search carries on to the
+    #  rest of the seed tree. This is how run() resumes from a checkpoint.
+    def search_seed(self, max_degree, child_counts, decisions=(), split_depth=None, resume=False):
+        self.start_seed(max_degree, child_counts)
+
+        # each entry is [pair, INCLUDED or EXCLUDED, pairs excluded along with it]
+        stack = []
+        for pair, state in decisions:
+            if state == BranchAndBound.INCLUDED:
+                self.include(pair)
+                stack.append([pair, state, []])
+            else:
+                excluded_pairs = self.symmetric_exclusions(pair)
+                for excluded_pair in excluded_pairs:
+                    self.exclude(excluded_pair)
+                stack.append([pair, state, excluded_pairs])
+        base = 0 if resume else len(stack)
+
+        subproblems = []
+        while True:
+            if self.checkpoint_path is not None and self.nodes >= self.next_checkpoint_check:
+                self.next_checkpoint_check = self.nodes + self.checkpoint_check_nodes
+                if time() - self.last_checkpoint >= self.checkpoint_interval:
+                    self.write_checkpoint(stack)
+
+            if split_depth is not None and len(stack) - base >= split_depth:
+                subproblems.append([(entry[0], entry[1]) for entry in stack])
+                pair = None
+            else:
+                pair = self.branch_pair()
+            if pair is not None:
+                self.include(pair)
+                stack.append([pair, BranchAndBound.INCLUDED, []])
+                continue
+
+            # backtrack to the most recent include and explore its exclude branch instead
+            while len(stack) > base:
+                pair, state, excluded_pairs = stack.pop()
+                if state == BranchAndBound.INCLUDED:
+                    self.uninclude(pair)
+                    excluded_pairs = self.symmetric_exclusions(pair)
+                    for excluded_pair in excluded_pairs:
+                        self.exclude(excluded_pair)
+                    stack.append([pair, BranchAndBound.EXCLUDED, excluded_pairs])
+                    break
+                for excluded_pair in excluded_pairs:
+                    self.unexclude(excluded_pair)
+            else:
+                return subproblems
+
+    # include()
+    #
+    # Adds an edge to the current graph
+    def include(self, pair):
+        a, b = pair
+        self.graph.push_state()
+        self.graph.add_edge(a, b)
+        self.degrees[a] += 1
+        self.degrees[b] += 1
+        self.edge_count += 1
+
+    # uninclude()
+    #
+    # Removes the edge added by the most recent include()
+    def uninclude(self, pair):
+        a, b = pair
+        self.graph.pop_state()
+        self.degrees[a] -= 1
+        self.degrees[b] -= 1
+        self.edge_count -= 1
+
+    # exclude()
+    #
+    # Forbids a candidate edge for the rest of the current branch
+    def exclude(self, pair):
+        self.excluded.add(pair)
+        self.exclusion_counts[pair[0]] += 1
+        self.exclusion_counts[pair[1]] += 1
+
+    # unexclude()
+    #
+    # Undoes exclude()
+    def unexclude(self, pair):
+        self.excluded.discard(pair)
+        self.exclusion_counts[pair[0]] -= 1
+        self.exclusion_counts[pair[1]] -= 1
+
+    # symmetric_exclusions()
+    #
+    # Returns the pairs to exclude along with pair: pair itself plus its images under swapping either endpoint with an
+    #  interchangeable vertex. See class docs.
+    def symmetric_exclusions(self, pair):
+        pairs = [pair]
+        for keep, swap in (pair, (pair[1], pair[0])):
+            if self.exclusion_counts[swap] != 0:
+                continue
+            for u in self.free_vertices:
+                if u == keep or u == swap or self.exclusion_counts[u] != 0:
+                    continue
+                if self.graph.neighbours[u] == self.graph.neighbours[swap]:
+                    image = (min(keep, u), max(keep, u))
+                    if image not in self.excluded and image not in pairs:
+                        pairs.append(image)
+        return pairs
+
+    # branch_pair()
+    #
+    # Visits the current node of the search: records the graph if it's the best so far, then returns the candidate
+    #  edge to branch on, or None if the node is a leaf or can be pruned. See class docs for the bounds.
+    def branch_pair(self):
+        self.nodes += 1
+        n = self.n
+        max_degree = self.max_degree
+        degrees = self.degrees
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            instrumentation.node()
+
+        if self.edge_count > self.best_edge_count:
+            self.best_edge_count = self.edge_count
+            self.best_edges = self.current_edges()
+            if self.shared_best is not None:
+                with self.shared_best.get_lock():
+                    if self.edge_count > self.shared_best.value:
+                        self.shared_best.value = self.edge_count
+
+        best_edge_count = self.best_edge_count
+        if self.shared_best is not None:
+            best_edge_count = max(best_edge_count, self.shared_best.value)
+        if best_edge_count >= self.bound:
+            if instrumentation is not None:
+                instrumentation.prune('upper_bound')
+            return None
+        target = best_edge_count + 1
+        if instrumentation is not None:
+            started = time()
+
+        # candidate edges that are still allowed, and how many each vertex has; candidate_edges() has already dropped
+        #  the pairs that would close a c3 or c4, so can_add_edge() is only needed to rule out c6s
+        legal = []
+        legal_degrees = [0] * n
+        for pair in self.graph.candidate_edges(self.free_vertices, max_degree, False):
+            a, b = pair
+            if pair not in self.excluded and self.graph.can_add_edge(a, b):
+                legal.append(pair)
+                legal_degrees[a] += 1
+                legal_degrees[b] += 1
+        if instrumentation is not None:
+            started = instrumentation.lap('candidates', started)
+
+        # 1. capacity
+        room = [min(legal_degrees[v], max_degree - degrees[v]) for v in range(0, n)]
+        if self.edge_count + sum(room) // 2 < target:
+            if instrumentation is not None:
+                instrumentation.prune('capacity', 'bounds', started)
+            return None
+
+        # 2. vertex deletion
+        if violates_deletion_bound([degrees[v] + room[v] for v in range(0, n)], target, self.known_sizes):
+            if instrumentation is not None:
+                instrumentation.prune('deletion', 'bounds', started)
+            return None
+
+        # 3. symmetry with vertex 0
+        for v in self.free_vertices:
+            if degrees[v] == max_degree:
+                children = sorted([degrees[x] - 1 for x in self.graph.neighbours[v]], reverse=True)
+                if tuple(children) > self.child_counts:
+                    if instrumentation is not None:
+                        instrumentation.prune('symmetry', 'bounds', started)
+                    return None
+        if instrumentation is not None:
+            started = instrumentation.lap('bounds', started)
+
+        # branch at the vertex with the least room to grow, towards its highest degree candidate neighbour
+        vertex = None
+        for v in self.free_vertices:
+            if room[v] > 0 and (vertex is None or (room[v], -degrees[v]) < (room[vertex], -degrees[vertex])):
+                vertex = v
+        best_pair = None
+        for pair in legal:
+            if vertex in pair and (best_pair is None or
+                                   degrees[pair[0]] + degrees[pair[1]] > degrees[best_pair[0]] + degrees[best_pair[1]]):
+                best_pair = pair
+        if instrumentation is not None:
+            instrumentation.lap('branch', started)
+        return best_pair
+
+    # checkpoint_state()
+    #
+    # Returns everything needed to resume the search at the current node as a JSON serializable dictionary
+    #
+    # stack The decision stack of search_seed(); only the pairs and whether they were included are kept, since the
+    #  rest of the state is rebuilt by replaying them
+    def checkpoint_state(self, stack):
+        return {
+            'version': BranchAndBound.CHECKPOINT_VERSION,
+            'n': self.n,
+            'known_sizes': sorted(self.known_sizes.items()),
+            'seed_index': self.seed_index,
+            'decisions': [[list(entry[0]), entry[1]] for entry in stack],
+            'best_edge_count': self.best_edge_count,
+            'best_edges': [list(pair) for pair in self.best_edges],
+            'nodes': self.nodes,
+        }
+
+    # write_checkpoint()
+    #
+    # Writes checkpoint_state() to checkpoint_path.
+    #
+    # The file is written next to checkpoint_path and renamed over it, so an interruption while writing leaves the
+    #  previous checkpoint intact.
+    def write_checkpoint(self, stack):
+        temporary_path = self.checkpoint_path + '.tmp'
+        with open(temporary_path, 'w') as checkpoint_file:
+            json.dump(self.checkpoint_state(stack), checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.rename(temporary_path, self.checkpoint_path)
+        self.last_checkpoint = time()
+
+    # from_checkpoint_state()
+    #
+    # Builds a BranchAndBound whose run() resumes from a dictionary made by checkpoint_state()
+    @staticmethod
+    def from_checkpoint_state(state, graph_class=OptimizedGraph, checkpoint_path=None, checkpoint_interval=60,
+                              instrumentation=None):
+        if state['version'] != BranchAndBound.CHECKPOINT_VERSION:
+            raise ValueError('Unsupported checkpoint version %s' % state['version'])
+
+        known_sizes = dict((m, size) for m, size in state['known_sizes'])
+        search = BranchAndBound(state['n'], known_sizes, graph_class, checkpoint_path=checkpoint_path,
+                                checkpoint_interval=checkpoint_interval, instrumentation=instrumentation)
+        search.seed_index = state['seed_index']
+        search.resume_decisions = [(tuple(pair), decision) for pair, decision in state['decisions']]
+        search.best_edge_count = state['best_edge_count']
+        search.best_edges = [tuple(pair) for pair in state['best_edges']]
+        search.nodes = state['nodes']
+        search.next_checkpoint_check = search.nodes + search.checkpoint_check_nodes
+        return search
+
+    # load_checkpoint()
+    #
+    # Reads a checkpoint written by write_checkpoint() and returns a BranchAndBound that resumes from it and keeps
+    #  checkpointing to the same file. Checkpoints are plain JSON, so they can be moved between machines.
+    @staticmethod
+    def load_checkpoint(checkpoint_path, graph_class=OptimizedGraph, checkpoint_interval=60, instrumentation=None):
+        with open(checkpoint_path) as checkpoint_file:
+            state = json.load(checkpoint_file)
+        return BranchAndBound.from_checkpoint_state(state, graph_class, checkpoint_path, checkpoint_interval,
+                                                    instrumentation)
+
+    # current_edges()
+    #
+    # Returns the edges of the current graph as a list of pairs
+    def current_edges(self):
+        edges = list(self.seed_edges)
+        for pair in self.candidate_pairs:
+            if self.graph.check_edge_present(pair[0], pair[1]):
+                edges.append(pair)
+        return edges
+
+
+# CanonicalAugmentation
+#
+# Exhaustive search for the size of an extremal graph on n vertices that visits each isomorphism class of graphs
+#  that follow the rules at most once, in the McKay canonical augmentation sense.
+#
+# Starting from the empty graph, a graph G is extended by one legal edge at a time. Two rules stop the search from
+#  ever producing the same graph (up to isomorphism) twice:
+#
+# 1. Only one edge per orbit of Aut(G) is tried, since edges in the same orbit give isomorphic graphs.
+# 2. The extension G + e is only accepted if e is in the same Aut(G + e) orbit as the canonical edge of G + e (see
+#     CanonicalLabelling.canonical_edge()), i.e. if G is the canonical parent of G + e. Any other route to an
+#     isomorphic graph is rejected.
+#
+# Both labellings come from OptimizedGraph.canonical_labelling(), which graph_class must provide.
+#
+# Every graph that follows the rules has a unique chain of canonical parents back to the empty graph, so the search is
+#  still exhaustive. The capacity and vertex-deletion bounds from BranchAndBound prune the tree as usual.
+#
+# known_sizes A dictionary mapping smaller vertex counts m to s(m); see find_extremal_graph_size()
+class CanonicalAugmentation:
+    # __init__()
+    #
+    # constructor
+    #
+    # instrumentation See BranchAndBound
+    def __init__(self, n, known_sizes=None, graph_class=OptimizedGraph, instrumentation=None):
+        self.n = n
+        self.known_sizes = known_sizes or {}
+        self.graph_class = graph_class
+        self.instrumentation = instrumentation
+
+        # see BranchAndBound
+        if n > 2:
+            self.bound = int(upper_bound(n))
+        else:
+            self.bound = n * (n - 1) // 2
+        if n > 2 and (n - 1) in self.known_sizes:
+            self.bound = min(self.bound, n * self.known_sizes[n - 1] // (n - 2))
+
+        self.best_edge_count = 0
+        self.best_edges = []
+        self.nodes = 0
+
+    # run()
+    #
+    # Searches from the empty graph and returns the size of the extremal graph. The graph itself is left in
+    #  best_edges.
+    def run(self):
+        self.graph = self.graph_class(self.n)
+        self.edges = []
+        self.visit()
+        return self.best_edge_count
+
+    # visit()
+    #
+    # Visits the current graph, which is the only representative of its isomorphism class the search will see, then
+    #  recurses into its canonical extensions
+    def visit(self):
+        self.nodes += 1
+        n = self.n
+        graph = self.graph
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            instrumentation.node()
+
+        if len(self.edges) > self.best_edge_count:
+            self.best_edge_count = len(self.edges)
+            self.best_edges = list(self.edges)
+        if self.best_edge_count >= self.bound:
+            if instrumentation is not None:
+                instrumentation.prune('upper_bound')
+            return
+        target = self.best_edge_count + 1
+        if instrumentation is not None:
+            started = time()
+
+        legal = []
+        legal_degrees = [0] * n
+        for a in range(0, n):
+            for b in range(a + 1, n):
+                if graph.can_add_edge(a, b):
+                    legal.append((a, b))
+                    legal_degrees[a] += 1
+                    legal_degrees[b] += 1
+        if instrumentation is not None:
+            started = instrumentation.lap('candidates', started)
+
+        # capacity: every edge of a descendant is legal now
+        if len(self.edges) + len(legal) < target:
+            if instrumentation is not None:
+                instrumentation.prune('capacity', 'bounds', started)
+            return
+        # vertex deletion
+        if violates_deletion_bound([len(graph.neighbours[v]) + legal_degrees[v] for v in range(0, n)],
+                                   target, self.known_sizes):
+            if instrumentation is not None:
+                instrumentation.prune('deletion', 'bounds', started)
+            return
+        if instrumentation is not None:
+            instrumentation.lap('bounds', started)
+
+        extensions = canonical_extensions(graph, self.edges, legal, instrumentation)
+        for pair in extensions:
+            self.visit()
+            if self.best_edge_count >= self.bound:
+                extensions.close()
+                return
+
+
+# canonical_extensions()
+#
+# Generator over the legal edges e of a graph G that pass both rules of CanonicalAugmentation, i.e. such that G is the
+#  canonical parent of G + e. CanonicalAugmentation and frontier.canonical_children() both extend graphs with it.
+#
+# Each accepted edge is yielded while it is added to graph and appended to edges; both are undone before the next one
+#  is tried, and when the generator is closed.
+#
+# graph A graph_class with canonical_labelling(), push_state() and pop_state()
+# edges The edges of graph, as a list
+# legal The edges that can be added to graph
+# instrumentation Counts the rejected edges as rejected_non_canonical, if given
+def canonical_extensions(graph, edges, legal, instrumentation=None):
+    orbits = graph.canonical_labelling().pair_orbits(legal)
+    for pair in legal:
+        if orbits[pair] != pair:
+            continue
+        graph.push_state()
+        graph.add_edge(*pair)
+        edges.append(pair)
+        try:
+            child_labelling = graph.canonical_labelling()
+            edge_orbits = child_labelling.pair_orbits(edges)
+            if edge_orbits[pair] == edge_orbits[child_labelling.canonical_edge()]:
+                yield pair
+            elif instrumentation is not None:
+                instrumentation.count('rejected_non_canonical')
+        finally:
+            edges.pop()
+            graph.pop_state()
+
+
 # find_extremal_graph_size()
 #
 # equivalent to s(n) from the dissertation (2.3) pg. 31
@@ -22,7 +650,16 @@ def upper_bound(n):
 # finds the size of an extremal graph on n vertices that follows the restrictions of this research:
 #
 # A graph follows the rules if it contains no c3, c4, or c6 cycles.
-def find_extremal_graph_size(n):
+#
+# Runs search_class (BranchAndBound or CanonicalAugmentation) for every vertex count up to n so that each search can
+#  prune with the sizes below it.
+#
+# checkpoint_path If given, BranchAndBound checkpoints to this file, and if it already exists the search resumes from
+#  it; see BranchAndBound.load_checkpoint(). Not supported by CanonicalAugmentation.
+# instrumentation An optional Instrumentation (see instrumentation.py) for every search and its graphs to report to.
+#  A last report is made when the searches finish.
+def find_extremal_graph_size(n, graph_class=OptimizedGraph, search_class=BranchAndBound, checkpoint_path=None,
+                             checkpoint_interval=60, instrumentation=None):
     # FOR tree type in tree types
         # make tree with type
             # WHILE there's space in the tree,
@@ -31,29 +668,30 @@ def find_extremal_graph_size(n):
                 # IF the graph has reached one of the following bounds, it is an extremal graph, so return.
                     # 1. E >= 1/2q(q+1)^2 (https://faculty.math.illinois.edu/~z-furedi/PUBS/furedi_C4from1988.pdf)
                     # 2. Bound from Huntington's research
-    # Init an empty graph data structure of size n
-    graph = OptimizedGraph(n)
+    # See BranchAndBound for how the above is carried out exhaustively
+    if instrumentation is not None:
+        graph_class = instrumentation.graph_class(graph_class)
 
-    # calculate the upper bound edge count for a graph of this size that follows the rules
-    upper_bound_n = upper_bound(n)
+    known_sizes = {}
+    resumed = None
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        resumed = BranchAndBound.load_checkpoint(checkpoint_path, graph_class, checkpoint_interval, instrumentation)
+        known_sizes = resumed.known_sizes
 
-    # Naively try to add all the edges
-    for i in range(0, n):
-        for j in range(0, n):
-            if i != j:
-                # Add an edge
-                graph.add_edge(i, j)
-
-                # check if the graph follows the rules
-                #  if not, remove the edge
-                if not graph.does_follow_rules():
-                    graph.remove_edge(i, j)
-
-                # if we reached the bound, we are one of the extremal graphs
-                if graph.size >= upper_bound_n:
-                    return graph.size
-
-    return graph.size
+    for m in range(1, n + 1):
+        if m in known_sizes:
+            continue
+        if resumed is not None and resumed.n == m:
+            search = resumed
+        elif checkpoint_path is not None:
+            search = search_class(m, known_sizes, graph_class, checkpoint_path=checkpoint_path,
+                                  checkpoint_interval=checkpoint_interval, instrumentation=instrumentation)
+        else:
+            search = search_class(m, known_sizes, graph_class, instrumentation=instrumentation)
+        known_sizes[m] = search.run()
+    if instrumentation is not None:
+        instrumentation.report()
+    return known_sizes[n]
 
 
 # test():
@@ -78,19 +716,105 @@ def test():
     print 'Testing find_extremal_graph_size()'
     assert find_extremal_graph_size(6) == 6
     assert find_extremal_graph_size(7) == 7
-    print find_extremal_graph_size(8), 'should be', 9
-    print find_extremal_graph_size(9), 'should be', 10
-    print find_extremal_graph_size(10), 'should be', 12
-    print find_extremal_graph_size(11), 'should be', 13
-    # assert find_extremal_graph_size(8) == 9
-    # assert find_extremal_graph_size(9) == 10
-    # assert find_extremal_graph_size(10) == 12
-    # assert find_extremal_graph_size(11) == 13
-    # assert find_extremal_graph_size(12) == 15
-    # assert find_extremal_graph_size(13) == 17
+    assert find_extremal_graph_size(8) == 9
+    assert find_extremal_graph_size(9) == 10
+    assert find_extremal_graph_size(10) == 12
+    assert find_extremal_graph_size(11) == 13
+    assert find_extremal_graph_size(12) == 15
+    assert find_extremal_graph_size(13) == 17
+    # these take minutes each in pure python
     # assert find_extremal_graph_size(14) == 18
     # assert find_extremal_graph_size(15) == 20
     # assert find_extremal_graph_size(16) == 22
+    print 'Passed.'
+
+    print 'Testing BranchAndBound graphs follow the rules'
+    known_sizes = {}
+    for n in range(1, 12):
+        search = BranchAndBound(n, known_sizes)
+        known_sizes[n] = search.run()
+        graph = OptimizedGraph(n)
+        for a, b in search.best_edges:
+            graph.add_edge(a, b)
+        assert len(search.best_edges) == known_sizes[n]
+        assert graph.does_follow_rules()
+    print 'Passed.'
+
+    print 'Testing CanonicalAugmentation agrees with BranchAndBound'
+    canonical_sizes = {}
+    for n in range(1, 10):
+        canonical_sizes[n] = CanonicalAugmentation(n, canonical_sizes).run()
+        assert canonical_sizes[n] == known_sizes[n]
+    print 'Passed.'
+
+    print 'Testing canonical_extensions() visits every isomorphism class once'
+    import networkx as nx
+    import graph as graph_module
+    # n = 10 has 2-regular graphs (C10, two C5s) with large automorphism groups among its children
+    n = 10
+    # brute force: every legal child of every class, deduplicated with nx.is_isomorphic()
+    level = [nx.empty_graph(n)]
+    classes = []
+    while level:
+        classes.append(len(level))
+        children = []
+        for parent in level:
+            graph = OptimizedGraph(n)
+            for a, b in parent.edges():
+                graph.add_edge(a, b)
+            for a, b in graph.candidate_edges(ordered=False):
+                if graph.can_add_edge(a, b):
+                    child = parent.copy()
+                    child.add_edge(a, b)
+                    children.append(child)
+        level = graph_module.filter_by_isomorphic(children)
+
+    # CanonicalAugmentation.visit() without the bounds
+    visited = []
+    graph = OptimizedGraph(n)
+    edges = []
+
+    def visit():
+        if len(visited) == len(edges):
+            visited.append(0)
+        visited[len(edges)] += 1
+        legal = [pair for pair in graph.candidate_edges(ordered=False) if graph.can_add_edge(*pair)]
+        for pair in canonical_extensions(graph, edges, legal):
+            visit()
+    visit()
+    assert visited == classes
+
+    # with the bounds, the search visits a subset of those classes, still each at most once
+    class RecordingAugmentation(CanonicalAugmentation):
+        def visit(self):
+            seen.append(nx.Graph(self.edges))
+            seen[-1].add_nodes_from(range(0, self.n))
+            CanonicalAugmentation.visit(self)
+    seen = []
+    assert RecordingAugmentation(n, canonical_sizes).run() == known_sizes[n]
+    assert len(graph_module.filter_by_isomorphic(seen)) == len(seen)
+    print 'Passed.'
+
+    print 'Testing BranchAndBound resumes exactly from checkpoints'
+
+    # keeps every checkpoint in memory instead of writing it
+    class RecordingBranchAndBound(BranchAndBound):
+        def write_checkpoint(self, stack):
+            self.checkpoints.append(json.loads(json.dumps(self.checkpoint_state(stack))))
+
+    for n in range(6, 12):
+        search = RecordingBranchAndBound(n, dict((m, known_sizes[m]) for m in range(1, n)),
+                                         checkpoint_path='unused', checkpoint_interval=0, checkpoint_check_nodes=1)
+        search.checkpoints = []
+        search.next_checkpoint_check = 0
+        search.run()
+        assert len(search.checkpoints) == search.nodes + 1
+
+        for state in search.checkpoints[::max(1, len(search.checkpoints) // 20)]:
+            resumed = BranchAndBound.from_checkpoint_state(state)
+            assert resumed.run() == known_sizes[n]
+            assert resumed.nodes == search.nodes
+    print 'Passed.'
 
 
 # if anybody bothers to run this, run the test() function
@@ -0,0 +1,301 @@
+import multiprocessing
+import os
+import shutil
+import struct
+import numpy
+from OptimizedGraph import OptimizedGraph
+from find_extremal_graphs import canonical_extensions
+
+# Level-by-level enumeration of the graphs without c3, c4, or c6 cycles on n vertices
+#
+# Level e holds one graph from every isomorphism class of such graphs with e edges. Level e + 1 is built from level e
+#  alone by adding every legal edge to every graph, so only one level is ever read and one written, like extgraph()
+#  and filter_by_edge_count() in Huntington's dissertation. The last level that isn't empty is at s(n).
+#
+# Isomorphic children are never written twice, without a table of everything seen: a child G + e is only written by
+#  its canonical parent, exactly as in CanonicalAugmentation (one edge per orbit of Aut(G), and e must be in the orbit
+#  of the canonical edge of G + e). Every parent can therefore be extended on its own, in any order, by any process.
+#
+# A level is a file of fixed-width records, each the packed lower triangle of a graph's adjacency matrix: bit
+#  row * (row - 1) / 2 + col, the layout of OptimizedGraph.adjacency_structure, so a record is written straight from
+#  the graph. The file starts with a HEADER_SIZE byte header (see write_header()). open_level() memory-maps the
+#  records as a (count, record size) numpy array, so reading a record is a slice of the page cache; at n = 20 a graph
+#  is 24 bytes instead of a networkx graph of several kilobytes.
+#
+# generate_level() splits the parents into chunks of records; each process maps the parent file itself, writes its
+#  children to a part file, and the parts are joined into the next level.
+
+MAGIC = 'C346'
+VERSION = 1
+# magic, version, n, edges per graph, record size in bytes, padded to 16 bytes
+HEADER = struct.Struct('<4sHHHH4x')
+HEADER_SIZE = HEADER.size
+
+
+# record_size()
+#
+# Returns the number of bytes in a record of a graph on n vertices; at least 1, so that the number of records can be
+#  read off the file size
+def record_size(n):
+    return max((n * (n - 1) // 2 + 7) // 8, 1)
+
+
+# write_header()
+#
+# Writes the header of a level file of graphs on n vertices with edges edges each
+def write_header(output, n, edges):
+    output.write(HEADER.pack(MAGIC, VERSION, n, edges, record_size(n)))
+
+
+# read_header()
+#
+# Returns (n, edges) from the header of a level file
+def read_header(path):
+    with open(path, 'rb') as level:
+        magic, version, n, edges, size = HEADER.unpack(level.read(HEADER_SIZE))
+    if magic != MAGIC or version != VERSION or size != record_size(n):
+        raise ValueError('%s is not a level file this version can read.' % path)
+    return n, edges
+
+
+# open_level()
+#
+# Memory-maps a level file
+#
+# Returns (n, edges, records): records is a read-only numpy array with one row of record_size(n) bytes per graph
+def open_level(path):
+    n, edges = read_header(path)
+    size = record_size(n)
+    count = (os.path.getsize(path) - HEADER_SIZE) // size
+    if count == 0:
+        # numpy can't map an empty range
+        records = numpy.zeros((0, size), dtype=numpy.uint8)
+    else:
+        records = numpy.memmap(path, dtype=numpy.uint8, mode='r', offset=HEADER_SIZE, shape=(count, size))
+    return n, edges, records
+
+
+# triangle_pairs()
+#
+# Returns the list of cells (row, col) of the packed lower triangle of an n x n matrix, in bit order
+def triangle_pairs(n):
+    return [(row, col) for row in range(1, n) for col in range(0, row)]
+
+
+# record_edges()
+#
+# Returns the edges (col, row) of the graph in a record, with col < row
+#
+# pairs triangle_pairs(n)
+def record_edges(record, pairs):
+    edges = []
+    for byte_index, byte in enumerate(bytearray(record)):
+        bit = 0
+        while byte:
+            if byte & 1:
+                row, col = pairs[(byte_index << 3) + bit]
+                edges.append((col, row))
+            byte >>= 1
+            bit += 1
+    return edges
+
+
+# graph_from_record()
+#
+# Builds a graph_class (an OptimizedGraph by default) from a record
+def graph_from_record(record, n, graph_class=OptimizedGraph, pairs=None):
+    graph = graph_class(n)
+    for a, b in record_edges(record, pairs or triangle_pairs(n)):
+        graph.add_edge(a, b)
+    return graph
+
+
+# canonical_children()
+#
+# Returns the records of the children of a graph that it is the canonical parent of; see the module docs and
+#  find_extremal_graphs.canonical_extensions()
+#
+# graph A graph_class with canonical_labelling(), push_state() and pop_state(), left as it was
+# edges The edges of graph
+def canonical_children(graph, edges):
+    n = graph.size
+    legal = [pair for pair in graph.candidate_edges(ordered=False) if graph.can_add_edge(*pair)]
+
+    children = []
+    child_edges = list(edges)
+    for pair in canonical_extensions(graph, child_edges, legal):
+        record = bytearray(record_size(n))
+        for a, b in child_edges:
+            row, col = max(a, b), min(a, b)
+            index = row * (row - 1) // 2 + col
+            record[index >> 3] |= 1 << (index & 7)
+        children.append(bytes(record))
+    return children
+
+
+# extend_records()
+#
+# Writes the canonical children of parent records start..stop - 1 of a level file to output, without a header
+#
+# Returns the number of children written
+def extend_records(parent_path, start, stop, output, graph_class=OptimizedGraph):
+    n, edges, records = open_level(parent_path)
+    pairs = triangle_pairs(n)
+    written = 0
+    for index in range(start, stop):
+        record = records[index]
+        graph = graph_from_record(record, n, graph_class, pairs)
+        children = canonical_children(graph, record_edges(record, pairs))
+        for child in children:
+            output.write(child)
+        written += len(children)
+    return written
+
+
+# extend_chunk()
+#
+# Runs in a worker process: extends one chunk of parents into its own part file
+#
+# task A tuple (parent path, part path, start, stop, graph_class)
+#
+# Returns the number of children written
+def extend_chunk(task):
+    parent_path, part_path, start, stop, graph_class = task
+    with open(part_path, 'wb') as part:
+        return extend_records(parent_path, start, stop, part, graph_class)
+
+
+# write_first_level()
+#
+# Writes level 0 on n vertices: the empty graph
+def write_first_level(path, n):
+    with open(path, 'wb') as level:
+        write_header(level, n, 0)
+        level.write(bytearray(record_size(n)))
+
+
+# generate_level()
+#
+# Writes the level after the one in parent_path to child_path; see the module docs
+#
+# processes How many processes to extend parents in; 1 extends them in this process
+# chunk_size How many parents each process extends at a time
+#
+# Returns the number of graphs in the new level
+def generate_level(parent_path, child_path, processes=1, chunk_size=256, graph_class=OptimizedGraph):
+    n, edges, records = open_level(parent_path)
+    count = len(records)
+    del records
+
+    # the parent file may be open in a memory map, so write the new level under a temporary name and rename it
+    temporary_path = child_path + '.tmp'
+    with open(temporary_path, 'wb') as level:
+        write_header(level, n, edges + 1)
+        if processes == 1:
+            written = extend_records(parent_path, 0, count, level, graph_class)
+        else:
+            tasks = []
+            for start in range(0, count, chunk_size):
+                part_path = '%s.part%d' % (child_path, len(tasks))
+                tasks.append((parent_path, part_path, start, min(start + chunk_size, count), graph_class))
+            pool = multiprocessing.Pool(processes)
+            try:
+                written = sum(pool.map(extend_chunk, tasks, chunksize=1))
+            finally:
+                pool.close()
+                pool.join()
+            for task in tasks:
+                with open(task[1], 'rb') as part:
+                    shutil.copyfileobj(part, level)
+                os.remove(task[1])
+    os.rename(temporary_path, child_path)
+    return written
+
+
+# level_path()
+#
+# Returns the path of the level file of graphs on n vertices with edges edges in directory
+def level_path(directory, n, edges):
+    return os.path.join(directory, 'level_%d_%d.bin' % (n, edges))
+
+
+# enumerate_levels()
+#
+# Writes every level on n vertices to directory, starting from the empty graph, until a level is empty
+#
+# Returns a list of the number of graphs in each level; its length minus 2 is s(n)
+def enumerate_levels(n, directory, processes=1, chunk_size=256, graph_class=OptimizedGraph):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    write_first_level(level_path(directory, n, 0), n)
+    counts = [1]
+    while counts[-1] > 0:
+        edges = len(counts) - 1
+        counts.append(generate_level(level_path(directory, n, edges), level_path(directory, n, edges + 1),
+                                     processes, chunk_size, graph_class))
+    return counts
+
+
+# test()
+#
+# Checks the levels against s(n) and against a brute force count of isomorphism classes
+def test():
+    import tempfile
+    import itertools
+    import canonical
+
+    directory = tempfile.mkdtemp()
+    try:
+        print 'Testing record round trips'
+        for n in range(2, 12):
+            graph = OptimizedGraph(n)
+            for a, b in itertools.combinations(range(0, n), 2):
+                if (a * 7 + b * 3) % 5 == 0:
+                    graph.add_edge(a, b)
+            record = numpy.frombuffer(bytes(graph.adjacency_structure), dtype=numpy.uint8)
+            assert graph_from_record(record, n).get_full_adjacency_matrix() == graph.get_full_adjacency_matrix()
+        print 'Passed.'
+
+        print 'Testing enumerate_levels() against s(n)'
+        # s(n) for n = 1..9
+        for n, size in zip(range(1, 10), (0, 1, 2, 3, 5, 6, 7, 9, 10)):
+            counts = enumerate_levels(n, directory)
+            assert len(counts) - 2 == size
+        print 'Passed.'
+
+        print 'Testing enumerate_levels() against brute force'
+        for n in range(1, 7):
+            pairs = list(itertools.combinations(range(0, n), 2))
+            classes = {}
+            for mask in range(0, 1 << len(pairs)):
+                graph = OptimizedGraph(n)
+                edges = [pairs[i] for i in range(0, len(pairs)) if mask >> i & 1]
+                for a, b in edges:
+                    graph.add_edge(a, b)
+                if graph.does_follow_rules():
+                    certificate = canonical.canonical_form(canonical.neighbourhoods_from_sets(graph.neighbours))
+                    classes.setdefault(len(edges), set()).add(certificate)
+            counts = enumerate_levels(n, directory)
+            assert counts[:-1] == [len(classes[e]) for e in range(0, len(classes))]
+
+            # every record in a level is a different graph
+            for e in range(0, len(classes)):
+                m, edges, records = open_level(level_path(directory, n, e))
+                assert edges == e
+                certificates = set(canonical.canonical_form(canonical.neighbourhoods_from_edges(
+                    n, record_edges(record, triangle_pairs(n)))) for record in records)
+                assert certificates == classes[e]
+        print 'Passed.'
+
+        print 'Testing generate_level() in parallel'
+        sequential = enumerate_levels(9, directory)
+        parallel = enumerate_levels(9, os.path.join(directory, 'parallel'), processes=2, chunk_size=8)
+        assert sequential == parallel
+        print 'Passed.'
+    finally:
+        shutil.rmtree(directory)
+
+
+# If somebody ever runs this file, invoke test()
+if __name__ == '__main__':
+    test()
@@ -1,5 +1,8 @@
+import sys
 import numpy
+from array import array
 import networkx as nx
+import canonical
 import gui
 
 
@@ -47,14 +50,11 @@ def test_triangles(matrix):
 #
 # see c4free() in Huntington's dissertation
 def test_quads(matrix):
-    squared = numpy.dot(matrix, matrix)
-
-    for i in range(1,len(squared)-1):
-        for j in (i+1,len(squared[i])-1):
-            if squared[i, j] > 1:
-                return True
+    squared = numpy.asarray(numpy.dot(matrix, matrix))
 
-    return False
+    # two vertices with more than one common neighbour; the diagonal counts degrees, not quads
+    off_diagonal = ~numpy.eye(len(squared), dtype=bool)
+    return bool(numpy.any((squared > 1) & off_diagonal))
 
 
 # Test for hexes in an adjacency matrix
@@ -67,12 +67,9 @@ def test_hexes(matrix):
     squared = numpy.dot(matrix, matrix)
     cubed = numpy.dot(squared, matrix)
 
-    for i in range(1, len(cubed)-1):
-        for j in (i+1, len(cubed[i])-1):
-            if cubed[i, j] > 1 and matrix[i, j] == 0:
-                return True
-
-    return False
+    # two non-adjacent vertices joined by more than one walk of length 3
+    off_diagonal = ~numpy.eye(len(cubed), dtype=bool)
+    return bool(numpy.any((numpy.asarray(cubed) > 1) & (numpy.asarray(matrix) == 0) & off_diagonal))
 
 
 # A graph follows the rules if it contains no c3, c4, or c6 cycles.
@@ -118,17 +115,258 @@ def does_follow_rules_optimized(matrix):
     if cubed_diagonal_sum > 0:
         return False
 
-    # Test for quads and return false if they exist
-    for i in range(1,len(squared)-1):
-        for j in (i+1,len(squared[i])-1):
-            if squared[i, j] > 1:
-                return False
-            if cubed[i, j] > 1 and matrix[i, j] == 0:
-                return False
+    # Test for quads and hexes and return false if they exist; only cells off the diagonal count
+    off_diagonal = ~numpy.eye(len(squared), dtype=bool)
+    if numpy.any((numpy.asarray(squared) > 1) & off_diagonal):
+        return False
+    if numpy.any((numpy.asarray(cubed) > 1) & (numpy.asarray(matrix) == 0) & off_diagonal):
+        return False
 
     return True
 
 
+# Stacks a list of graphs of the same size into a (k, n, n) uint8 array of adjacency matrices
+#
+# graphs A list of networkx graphs, OptimizedGraphs, BitsetGraphs or adjacency matrices (2D arrays)
+#
+# see does_follow_rules_batch()
+def stack_adjacency_matrices(graphs):
+    if len(graphs) == 0:
+        return numpy.zeros((0, 0, 0), dtype=numpy.uint8)
+
+    first = graphs[0]
+    if isinstance(first, nx.Graph):
+        size = first.number_of_nodes()
+    elif hasattr(first, 'neighbours') or hasattr(first, 'neighbourhoods'):
+        size = first.size
+    else:
+        size = len(first)
+    stacked = numpy.zeros((len(graphs), size, size), dtype=numpy.uint8)
+
+    # OptimizedGraph keeps neighbour sets, so their edges are gathered and written with a single assignment
+    graph_indices = []
+    rows = []
+    cols = []
+    for index, graph in enumerate(graphs):
+        if hasattr(graph, 'neighbours'):
+            for vertex, neighbours in enumerate(graph.neighbours):
+                graph_indices.extend([index] * len(neighbours))
+                rows.extend([vertex] * len(neighbours))
+                cols.extend(neighbours)
+        elif isinstance(graph, nx.Graph):
+            stacked[index] = nx.to_numpy_matrix(graph) != 0
+        elif hasattr(graph, 'get_full_adjacency_matrix'):
+            stacked[index] = graph.get_full_adjacency_matrix()
+        else:
+            stacked[index] = numpy.asarray(graph) != 0
+    stacked[graph_indices, rows, cols] = 1
+    return stacked
+
+
+# Tests many graphs of the same size against the rules at once.
+#
+# A graph follows the rules if it contains no c3, c4, or c6 cycles. This is the same test as
+# does_follow_rules_optimized() on every graph, but the squares and cubes of all k adjacency matrices are computed by
+# two batched matrix multiplications and the three conditions are checked with array operations, so the cost per graph
+# is no longer dominated by Python overhead. Use it to screen many candidate graphs at once.
+#
+# 1. c3: the diagonal of A^3 is nonzero
+# 2. c4: two vertices have more than one common neighbour (A^2 > 1 off the diagonal)
+# 3. c6: two non-adjacent vertices are joined by more than one path of length 3 (A^3 > 1); in a graph without c3 or c4
+#    those two paths form a c6
+#
+# matrices A stacked (k, n, n) array of adjacency matrices (bool or any integer dtype), or a list of graphs; see
+#  stack_adjacency_matrices()
+#
+# Returns a boolean numpy array of length k that is True for the graphs that follow the rules
+def does_follow_rules_batch(matrices):
+    if not isinstance(matrices, numpy.ndarray):
+        matrices = stack_adjacency_matrices(matrices)
+    size = matrices.shape[1]
+
+    # float32 so that matmul goes through BLAS; entries of A^3 are at most n^2, which float32 holds exactly for
+    #  n < 4096
+    adjacency = matrices.astype(numpy.float32)
+    squared = numpy.matmul(adjacency, adjacency)
+    cubed = numpy.matmul(squared, adjacency)
+
+    off_diagonal = ~numpy.eye(size, dtype=bool)
+    non_adjacent = off_diagonal & (adjacency == 0)
+
+    has_c3 = numpy.einsum('kii->k', cubed) > 0
+    has_c4 = ((squared > 1) & off_diagonal).any(axis=(1, 2))
+    has_c6 = ((cubed > 1) & non_adjacent).any(axis=(1, 2))
+
+    return ~(has_c3 | has_c4 | has_c6)
+
+
+# Converts a networkx graph to compressed sparse row (CSR) form
+#
+# The neighbours of the vertex with index v are targets[offsets[v]:offsets[v + 1]]. Vertices are indexed in the order
+# of graph.nodes(), which is also the order nx.to_numpy_matrix() uses. Memory is O(nodes + edges).
+#
+# graph A networkx graph
+#
+# Returns (offsets, targets), both arrays of ints
+def csr_adjacency(graph):
+    nodes = list(graph.nodes())
+    index = dict((node, position) for position, node in enumerate(nodes))
+
+    offsets = array('l', [0] * (len(nodes) + 1))
+    targets = array('l')
+    for position, node in enumerate(nodes):
+        targets.extend([index[neighbour] for neighbour in graph.neighbors(node) if neighbour != node])
+        offsets[position + 1] = len(targets)
+    return offsets, targets
+
+
+# A graph follows the rules if it contains no c3, c4, or c6 cycles.
+#
+# Equivalent to does_follow_rules_batch() on a single graph, but instead of squaring and cubing the dense adjacency
+# matrix, the row of A^2 and A^3 for one vertex at a time is built by counting the walks of length 2 and 3 that leave
+# it. Only vertices within distance 3 are ever touched, so time is O(n * max_degree^3) and memory is O(n + edges). On
+# sparse graphs such as the trees from treex() this scales with the edge count instead of n^2.
+#
+# For a vertex v:
+# 1. c3: a neighbour of v is reached by a walk of length 2
+# 2. c4: another vertex is reached by two walks of length 2
+# 3. c6: a vertex that is not adjacent to v is reached by two walks of length 3
+#
+# graph A networkx graph
+#
+# see does_follow_rules_optimized() for the dense version
+def does_follow_rules_sparse(graph):
+    offsets, targets = csr_adjacency(graph)
+    size = len(offsets) - 1
+
+    # walk counts from the current vertex, reset through the touched lists after every vertex
+    two_walks = [0] * size
+    three_walks = [0] * size
+    adjacent = [False] * size
+
+    for v in range(0, size):
+        neighbours = targets[offsets[v]:offsets[v + 1]]
+        for x in neighbours:
+            adjacent[x] = True
+
+        reached_by_two = []
+        for x in neighbours:
+            for y in targets[offsets[x]:offsets[x + 1]]:
+                if y == v:
+                    continue
+                if adjacent[y] or two_walks[y] == 1:
+                    return False
+                two_walks[y] = 1
+                reached_by_two.append(y)
+
+        reached_by_three = []
+        for y in reached_by_two:
+            for z in targets[offsets[y]:offsets[y + 1]]:
+                if z == v or adjacent[z]:
+                    continue
+                if three_walks[z] == 1:
+                    return False
+                three_walks[z] = 1
+                reached_by_three.append(z)
+
+        for x in neighbours:
+            adjacent[x] = False
+        for y in reached_by_two:
+            two_walks[y] = 0
+        for z in reached_by_three:
+            three_walks[z] = 0
+
+    return True
+
+
+# Returns a shortest c3, c4, or c6 cycle in a graph as a list of its nodes in cycle order, or None if the graph
+# follows the rules.
+#
+# Unlike does_follow_rules() and huntington.check(), which only say that a cycle exists, this returns the cycle itself,
+# so a search can tell which edges are responsible. Each pass runs a breadth first search from every vertex that stops
+# at depth 1, 2 or 3 and returns as soon as it finds a cycle, so time is O(n * max_degree^3) like
+# does_follow_rules_sparse() and a graph that breaks the rules is usually rejected early.
+#
+# 1. c3: a vertex at depth 1 is adjacent to another vertex at depth 1
+# 2. c4: a vertex at depth 2 is reached from two different vertices at depth 1
+# 3. c6: a vertex at depth 3 is reached from two different vertices at depth 2. The graph has no c3 or c4 by now, so
+#    the two paths of length 3 share only their ends and form a c6.
+#
+# The passes run in that order, so a c3 is always reported before any c4 and a c4 before any c6.
+#
+# graph A networkx graph
+def find_forbidden_cycle(graph):
+    nodes = list(graph.nodes())
+    offsets, targets = csr_adjacency(graph)
+    size = len(nodes)
+
+    # c3: two adjacent neighbours
+    adjacent = [False] * size
+    for v in range(0, size):
+        neighbours = targets[offsets[v]:offsets[v + 1]]
+        for x in neighbours:
+            adjacent[x] = True
+        for x in neighbours:
+            for y in targets[offsets[x]:offsets[x + 1]]:
+                if adjacent[y]:
+                    return [nodes[v], nodes[x], nodes[y]]
+        for x in neighbours:
+            adjacent[x] = False
+
+    # c4: two paths of length 2; parent[y] is the depth 1 vertex y was first reached from
+    parent = [-1] * size
+    for v in range(0, size):
+        reached = []
+        for x in targets[offsets[v]:offsets[v + 1]]:
+            for y in targets[offsets[x]:offsets[x + 1]]:
+                if y == v:
+                    continue
+                if parent[y] != -1:
+                    return [nodes[v], nodes[parent[y]], nodes[y], nodes[x]]
+                parent[y] = x
+                reached.append(y)
+        for y in reached:
+            parent[y] = -1
+
+    # c6: two paths of length 3; by now every depth 2 vertex has exactly one parent
+    grandparent = [-1] * size
+    for v in range(0, size):
+        neighbours = targets[offsets[v]:offsets[v + 1]]
+        for x in neighbours:
+            adjacent[x] = True
+
+        reached_by_two = []
+        for x in neighbours:
+            for y in targets[offsets[x]:offsets[x + 1]]:
+                if y != v:
+                    parent[y] = x
+                    reached_by_two.append(y)
+
+        reached_by_three = []
+        cycle = None
+        for y in reached_by_two:
+            for z in targets[offsets[y]:offsets[y + 1]]:
+                if z == v or adjacent[z]:
+                    continue
+                if grandparent[z] != -1:
+                    other = grandparent[z]
+                    cycle = [nodes[v], nodes[parent[other]], nodes[other], nodes[z], nodes[y], nodes[parent[y]]]
+                    break
+                grandparent[z] = y
+                reached_by_three.append(z)
+            if cycle is not None:
+                return cycle
+
+        for x in neighbours:
+            adjacent[x] = False
+        for y in reached_by_two:
+            parent[y] = -1
+        for z in reached_by_three:
+            grandparent[z] = -1
+
+    return None
+
+
 # Recursively generate edges for a tree graph
 # width describes the number of branches to create at each node. width is n where the desired tree is an n tree
 # depth the number of recursions to perform. Depth levels of tree will be generated from the first node.
@@ -173,34 +411,95 @@ def max_edges(graphs):
     return highest_known_edge_count
 
 
+# Returns a cheap isomorphism invariant of a networkx graph
+#
+# Isomorphic graphs always get the same invariant; non-isomorphic graphs usually don't. It's used to bucket graphs
+# so that nx.is_isomorphic() only has to run between graphs that could be isomorphic.
+#
+# Each vertex starts labelled with its degree. Every round relabels each vertex by its label together with the
+# sorted labels of its neighbours (Weisfeiler-Lehman colour refinement). The invariant is the vertex and edge count
+# plus the sorted multiset of final labels.
+#
+# graph A networkx graph
+# rounds The number of relabelling rounds; 3 already separates almost all of the graphs we generate
+def isomorphism_invariant(graph, rounds=3):
+    labels = {}
+    for node in graph.nodes():
+        labels[node] = graph.degree(node)
+
+    for i in range(0, rounds):
+        new_labels = {}
+        for node in graph.nodes():
+            neighbour_labels = tuple(sorted([labels[neighbour] for neighbour in graph.neighbors(node)]))
+            new_labels[node] = hash((labels[node], neighbour_labels))
+        labels = new_labels
+
+    return graph.number_of_nodes(), graph.number_of_edges(), tuple(sorted(labels.values()))
+
+
 # Returns a filtered version of the list of graphs L in which only a single version of each
 # isomorphic graph remains.
 #
 # graphs An array of networkx graphs
 #
+# Graphs are bucketed by isomorphism_invariant() first, so each graph is only compared with nx.is_isomorphic()
+# against the kept graphs in its own bucket. The first graph of each isomorphism class is kept, in the original order.
+#
 # See iso() from Huntington's dissertation
 def filter_by_isomorphic(graphs):
     # Initialize an array to hold the filtered graphs
     filtered_graphs = []
 
+    # Isomorphically unique graphs we intend to return, grouped by invariant
+    buckets = {}
+
     # Iterate over the graphs passed to the function
     for graph in graphs:
+        bucket = buckets.setdefault(isomorphism_invariant(graph), [])
 
-        # Check if the graph is isomorphically unique compared to all other isomorphicallly
-        # unique graphs we intend to return
+        # Check if the graph is isomorphically unique compared to the isomorphically unique graphs with the same
+        # invariant; graphs in other buckets can't be isomorphic to it
         found_isomorphically_identical_graph = False
-        for existing_isomorphically_unique_graph in filtered_graphs:
+        for existing_isomorphically_unique_graph in bucket:
             if nx.is_isomorphic(graph, existing_isomorphically_unique_graph):
                 found_isomorphically_identical_graph = True
+                break
 
         # If the graph is isomorphically unique, add it to the list of isomorphically uniuqe graphs
         if not found_isomorphically_identical_graph:
+            bucket.append(graph)
             filtered_graphs.append(graph)
 
     # Return the list of known isomorphically unique graphs
     return filtered_graphs
 
 
+# Returns a filtered version of a list of graphs in which only a single version of each isomorphic graph remains,
+# using canonical certificates instead of nx.is_isomorphic()
+#
+# graphs An array of networkx graphs or OptimizedGraphs (or anything else with a canonical_form() method)
+#
+# Every graph costs one canonical labelling and one dictionary lookup. The first graph of each isomorphism class is
+# kept, in the original order.
+#
+# See filter_by_isomorphic() and canonical.py
+def filter_by_canonical_form(graphs):
+    filtered_graphs = []
+    seen_certificates = set()
+
+    for graph in graphs:
+        if hasattr(graph, 'canonical_form'):
+            certificate = graph.canonical_form()
+        else:
+            certificate = canonical.canonical_form(canonical.neighbourhoods_from_networkx(graph))
+
+        if certificate not in seen_certificates:
+            seen_certificates.add(certificate)
+            filtered_graphs.append(graph)
+
+    return filtered_graphs
+
+
 # Returns a filtered version of a list of graphs including only graphs of the specified size e
 #
 # "This next function takes a list of graphs and returns a new list of graphs of the given size."
@@ -219,7 +518,10 @@ def filter_by_edge_count(graphs, edge_count):
     return filtered_graphs
 
 
-if __name__ == "__main__":
+# demo()
+#
+# Draws a tree with two of its branches joined, which breaks the rules
+def demo():
     G = treex(3, 2)
 
     G.add_edge(2, 7)
@@ -229,4 +531,164 @@ if __name__ == "__main__":
     print G.edges()
 
     # Draw the graph containing the tree with two connected branches
-    gui.draw_network(G)
\ No newline at end of file
+    gui.draw_network(G)
+
+
+# random_graphs()
+#
+# Returns count random networkx graphs on 1 to max_size vertices for test(), each pair joined with the given
+#  probability
+def random_graphs(rng, count, max_size, probability):
+    graphs = []
+    for i in range(0, count):
+        size = rng.randrange(1, max_size + 1)
+        graph = nx.Graph()
+        graph.add_nodes_from(range(0, size))
+        graph.add_edges_from((a, b) for a in range(0, size) for b in range(0, a) if rng.random() < probability)
+        graphs.append(graph)
+    return graphs
+
+
+# relabelled()
+#
+# Returns a copy of a networkx graph with its nodes renamed by a random permutation and added in a random order
+def relabelled(rng, graph):
+    nodes = list(graph.nodes())
+    labels = list(nodes)
+    rng.shuffle(labels)
+    mapping = dict(zip(nodes, labels))
+    copy = nx.Graph()
+    shuffled = list(nodes)
+    rng.shuffle(shuffled)
+    copy.add_nodes_from(mapping[node] for node in shuffled)
+    copy.add_edges_from((mapping[a], mapping[b]) for a, b in graph.edges())
+    return copy
+
+
+# test()
+#
+# Uses assert keyword to test the functions in this file
+def test():
+    import random
+    rng = random.Random(0)
+
+    print 'Testing isomorphism_invariant() and filter_by_isomorphic()'
+    originals = random_graphs(rng, 120, 8, 0.35)
+    graphs = originals + [relabelled(rng, graph) for graph in originals]
+    rng.shuffle(graphs)
+    for graph in originals:
+        assert isomorphism_invariant(graph) == isomorphism_invariant(relabelled(rng, graph))
+
+    # the filter before bucketing: every graph against every kept graph
+    pairwise = []
+    for graph in graphs:
+        if not any(nx.is_isomorphic(graph, kept) for kept in pairwise):
+            pairwise.append(graph)
+    filtered = filter_by_isomorphic(graphs)
+    assert [id(graph) for graph in filtered] == [id(graph) for graph in pairwise]
+    print 'Passed.'
+
+    print 'Testing filter_by_canonical_form() against filter_by_isomorphic()'
+    from OptimizedGraph import OptimizedGraph
+    assert [id(graph) for graph in filter_by_canonical_form(graphs)] == [id(graph) for graph in filtered]
+    optimized_graphs = []
+    for graph in graphs:
+        optimized = OptimizedGraph(graph.number_of_nodes())
+        for x, y in graph.edges():
+            optimized.add_edge(x, y)
+        optimized_graphs.append(optimized)
+    kept = filter_by_canonical_form(optimized_graphs)
+    assert [optimized_graphs.index(graph) for graph in kept] == [graphs.index(graph) for graph in filtered]
+    print 'Passed.'
+
+    print 'Testing does_follow_rules_batch() against does_follow_rules_optimized()'
+    # sparse enough that many of them follow the rules
+    batch = random_graphs(rng, 300, 12, 0.15) + random_graphs(rng, 100, 12, 0.4)
+    by_size = {}
+    for graph in batch:
+        by_size.setdefault(graph.number_of_nodes(), []).append(graph)
+    outcomes = set()
+    for size, same_size in by_size.items():
+        matrices = [numpy.asarray(nx.to_numpy_matrix(graph, nodelist=range(0, size))) for graph in same_size]
+        expected = [does_follow_rules_optimized(matrix) for matrix in matrices]
+        outcomes.update(expected)
+
+        # the same graphs as networkx graphs, numpy arrays, lists and OptimizedGraphs
+        mixed = []
+        for index, graph in enumerate(same_size):
+            if index % 4 == 0:
+                mixed.append(graph)
+            elif index % 4 == 1:
+                mixed.append(matrices[index])
+            elif index % 4 == 2:
+                mixed.append(matrices[index].astype(int).tolist())
+            else:
+                optimized = OptimizedGraph(size)
+                for x, y in graph.edges():
+                    optimized.add_edge(x, y)
+                assert optimized.does_follow_rules() == expected[index]
+                mixed.append(optimized)
+        assert stack_adjacency_matrices(mixed).tolist() == [matrix.astype(int).tolist() for matrix in matrices]
+        assert does_follow_rules_batch(mixed).tolist() == expected
+        assert does_follow_rules_batch(numpy.array(matrices, dtype=bool)).tolist() == expected
+    assert outcomes == set([True, False])
+    print 'Passed.'
+
+    print 'Testing does_follow_rules_sparse() against does_follow_rules_optimized()'
+    sparse_cases = []
+    for graph in random_graphs(rng, 200, 14, 0.15):
+        # non-contiguous labels, and isolated vertices added at the front and the back of the node order
+        renamed = nx.Graph()
+        renamed.add_node('isolated')
+        renamed.add_nodes_from(node * 7 + 3 for node in graph.nodes())
+        renamed.add_edges_from((a * 7 + 3, b * 7 + 3) for a, b in graph.edges())
+        renamed.add_node(-1)
+        sparse_cases.append(renamed)
+    for width, depth in ((1, 1), (2, 3), (3, 2), (3, 3), (4, 2)):
+        tree_graph = treex(width, depth)
+        sparse_cases.append(tree_graph)
+        # trees follow the rules; joining two of their vertices may not
+        nodes = sorted(tree_graph.nodes())
+        for trial in range(0, 10):
+            joined = tree_graph.copy()
+            a, b = rng.sample(nodes, 2)
+            joined.add_edge(a, b)
+            sparse_cases.append(joined)
+    outcomes = set()
+    for graph in sparse_cases:
+        expected = does_follow_rules_optimized(nx.to_numpy_matrix(graph))
+        outcomes.add(expected)
+        assert does_follow_rules_sparse(graph) == expected
+        offsets, targets = csr_adjacency(graph)
+        assert len(offsets) == graph.number_of_nodes() + 1 and len(targets) == 2 * graph.number_of_edges()
+    assert outcomes == set([True, False])
+    print 'Passed.'
+
+    print 'Testing find_forbidden_cycle()'
+    lengths = set()
+    for graph in sparse_cases + random_graphs(rng, 200, 12, 0.25):
+        matrix = nx.to_numpy_matrix(graph)
+        cycle = find_forbidden_cycle(graph)
+        assert (cycle is None) == does_follow_rules_optimized(matrix)
+        if cycle is None:
+            continue
+        lengths.add(len(cycle))
+        assert len(cycle) in (3, 4, 6)
+        assert len(set(cycle)) == len(cycle)
+        for position in range(0, len(cycle)):
+            assert graph.has_edge(cycle[position], cycle[position - 1])
+        # it's a shortest one
+        if len(cycle) > 3:
+            assert not test_triangles(matrix)
+        if len(cycle) > 4:
+            assert not test_quads(matrix)
+    assert lengths == set([3, 4, 6])
+    print 'Passed.'
+
+
+# If somebody ever runs this file, draw the demo, or invoke test() with --test
+if __name__ == "__main__":
+    if sys.argv[1:] == ['--test']:
+        test()
+    else:
+        demo()
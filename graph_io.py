@@ -0,0 +1,399 @@
+import math
+import networkx as nx
+
+# Reading and writing graphs in nauty's graph6 and sparse6 formats
+#
+# Both formats put one graph per line as printable ASCII, so a file of millions of graphs can be streamed a line at a
+#  time, and the files can be handed to nauty's tools (geng, shortg, labelg, ...) as they are.
+#
+# graph6 stores the upper triangle of the adjacency matrix column by column, six bits per character:
+#  (0, 1), (0, 2), (1, 2), (0, 3), ... That's the bit order of OptimizedGraph.adjacency_structure, so cell (i, j),
+#  i < j, is bit j * (j - 1) / 2 + i of both. A graph on n vertices always takes about n^2 / 12 characters.
+#
+# sparse6 lines start with ':' and store the edge list instead, about (2 + log2 n) / 6 characters per edge, which is
+#  smaller for the sparse graphs this research deals with once n is past 20 or so.
+#
+# Graphs go in as networkx graphs or OptimizedGraphs (anything with a neighbours list of sets); the vertices of a
+#  networkx graph are numbered in the order of graph.nodes(). They come out as networkx graphs or as any graph_class
+#  with add_edge(), such as OptimizedGraph.
+#
+# See http://users.cecs.anu.edu.au/~bdm/data/formats.txt for the formats.
+
+GRAPH6_HEADER = '>>graph6<<'
+SPARSE6_HEADER = '>>sparse6<<'
+
+
+# encode_size()
+#
+# Returns N(n), the graph6/sparse6 encoding of a vertex count
+def encode_size(n):
+    if n < 63:
+        return chr(n + 63)
+    # the three character form stops at 258047 so that its first character can't be mistaken for a second '~'
+    if n <= 258047:
+        return '~' + ''.join(chr(((n >> shift) & 63) + 63) for shift in (12, 6, 0))
+    return '~~' + ''.join(chr(((n >> shift) & 63) + 63) for shift in (30, 24, 18, 12, 6, 0))
+
+
+# decode_size()
+#
+# Reads N(n) from the start of data
+#
+# Returns (n, the position in data after it)
+def decode_size(data):
+    if data[0] != '~':
+        return ord(data[0]) - 63, 1
+    if data[1] != '~':
+        width, start = 3, 1
+    else:
+        width, start = 6, 2
+    n = 0
+    for character in data[start:start + width]:
+        n = (n << 6) | (ord(character) - 63)
+    return n, start + width
+
+
+# triangle_cell()
+#
+# Returns the cell (i, j), i < j, at a graph6 bit index: the inverse of index = j * (j - 1) / 2 + i
+def triangle_cell(index):
+    j = int((1 + math.sqrt(8 * index + 1)) / 2)
+    # correct for rounding in the square root
+    while j * (j - 1) // 2 > index:
+        j -= 1
+    while (j + 1) * j // 2 <= index:
+        j += 1
+    return index - j * (j - 1) // 2, j
+
+
+# graph_edges()
+#
+# Returns (n, edges) of a networkx graph or an OptimizedGraph, with vertices numbered 0..n-1 and each edge (a, b) once
+def graph_edges(graph):
+    if hasattr(graph, 'neighbours'):
+        return graph.size, [(a, b) for a in range(0, graph.size) for b in graph.neighbours[a] if a < b]
+    index = dict((node, position) for position, node in enumerate(graph.nodes()))
+    return len(index), [(index[a], index[b]) for a, b in graph.edges()]
+
+
+# edges_to_graph6()
+#
+# Returns the graph6 line (without the newline) of the graph on n vertices with the given edges
+def edges_to_graph6(n, edges):
+    groups = bytearray((n * (n - 1) // 2 + 5) // 6)
+    for a, b in edges:
+        if a > b:
+            a, b = b, a
+        index = b * (b - 1) // 2 + a
+        groups[index // 6] |= 1 << (5 - index % 6)
+    for position in range(0, len(groups)):
+        groups[position] += 63
+    return encode_size(n) + str(groups)
+
+
+# edges_to_sparse6()
+#
+# Returns the sparse6 line (without the newline) of the graph on n vertices with the given edges
+def edges_to_sparse6(n, edges):
+    # k bits are enough for any vertex
+    k = 1
+    while 1 << k < n:
+        k += 1
+
+    # the bits are built up in an int, most significant first
+    bits = 0
+    length = 0
+    current = 0
+    for b, a in sorted((max(edge), min(edge)) for edge in edges):
+        if b == current:
+            words = ((0, a),)
+        elif b == current + 1:
+            words = ((1, a),)
+        else:
+            words = ((1, b), (0, a))
+        current = b
+        for flag, x in words:
+            bits = (bits << (k + 1)) | (flag << k) | x
+            length += k + 1
+
+    # pad to a multiple of 6 with 1s; in the one case where those would decode as an edge to vertex n - 1, with a
+    #  0 first
+    padding = -length % 6
+    if k < 6 and n == 1 << k and padding >= k and current < n - 1:
+        bits <<= 1
+        length += 1
+        padding -= 1
+    bits = (bits << padding) | ((1 << padding) - 1)
+    length += padding
+
+    characters = bytearray(length // 6)
+    for position in range(0, len(characters)):
+        characters[position] = ((bits >> (length - 6 * (position + 1))) & 63) + 63
+    return ':' + encode_size(n) + str(characters)
+
+
+# graph6_to_edges()
+#
+# Returns (n, edges) of a graph6 line; edges are (i, j) with i < j
+def graph6_to_edges(line):
+    n, position = decode_size(line)
+    edges = []
+    for group, character in enumerate(line[position:position + (n * (n - 1) // 2 + 5) // 6]):
+        value = ord(character) - 63
+        bit = 5
+        while value:
+            if value & (1 << bit):
+                edges.append(triangle_cell(group * 6 + 5 - bit))
+                value ^= 1 << bit
+            bit -= 1
+    return n, edges
+
+
+# sparse6_to_edges()
+#
+# Returns (n, edges) of a sparse6 line (with its leading ':'); edges are (i, j) with i <= j, in the order stored
+def sparse6_to_edges(line):
+    n, position = decode_size(line[1:])
+    data = line[1 + position:]
+    k = 1
+    while 1 << k < n:
+        k += 1
+
+    bits = 0
+    for character in data:
+        bits = (bits << 6) | (ord(character) - 63)
+    length = 6 * len(data)
+
+    edges = []
+    current = 0
+    while length >= k + 1:
+        length -= k + 1
+        word = (bits >> length) & ((1 << (k + 1)) - 1)
+        flag, x = word >> k, word & ((1 << k) - 1)
+        if flag:
+            current += 1
+        # the padding ends up here
+        if x >= n or current >= n:
+            break
+        if x > current:
+            current = x
+        else:
+            edges.append((x, current))
+    return n, edges
+
+
+# line_to_edges()
+#
+# Returns (n, edges) of a graph6 or sparse6 line, telling them apart by the leading ':' of sparse6
+def line_to_edges(line):
+    if line.startswith(':'):
+        return sparse6_to_edges(line)
+    return graph6_to_edges(line)
+
+
+# build_graph()
+#
+# Returns the graph on n vertices with the given edges as a networkx graph, or as a graph_class if one is given
+def build_graph(n, edges, graph_class=None):
+    if graph_class is None:
+        graph = nx.Graph()
+        graph.add_nodes_from(range(0, n))
+        graph.add_edges_from(edges)
+        return graph
+    graph = graph_class(n)
+    for a, b in edges:
+        graph.add_edge(a, b)
+    return graph
+
+
+# read_edges()
+#
+# Generator over (n, edges) for each graph in a graph6 or sparse6 source, a line at a time; formats may be mixed and
+#  headers and blank lines are skipped
+#
+# source A path or an open file (or any iterable of lines)
+def read_edges(source):
+    if isinstance(source, basestring):
+        with open(source, 'rb') as lines:
+            for graph in read_edges(lines):
+                yield graph
+        return
+    for line in source:
+        line = line.strip()
+        if line.startswith(GRAPH6_HEADER):
+            line = line[len(GRAPH6_HEADER):]
+        elif line.startswith(SPARSE6_HEADER):
+            line = line[len(SPARSE6_HEADER):]
+        if line:
+            yield line_to_edges(line)
+
+
+# read_graphs()
+#
+# Generator over the graphs in a graph6 or sparse6 source; see read_edges()
+#
+# graph_class Builds each graph as this class (e.g. OptimizedGraph) instead of a networkx graph
+def read_graphs(source, graph_class=None):
+    for n, edges in read_edges(source):
+        yield build_graph(n, edges, graph_class)
+
+
+# GraphWriter
+#
+# Buffered writer of graph6 or sparse6 lines
+#
+# Lines are collected and written buffer_size at a time. Usable as a context manager, which flushes and (if it
+#  opened the file) closes it at the end.
+#
+# target A path, which is opened for writing (or appending if append is set), or an open file
+# format 'graph6' or 'sparse6'
+# header Whether to start the file with >>graph6<< or >>sparse6<<
+class GraphWriter:
+    # __init__()
+    #
+    # constructor
+    def __init__(self, target, format='graph6', header=False, buffer_size=4096, append=False):
+        if format not in ('graph6', 'sparse6'):
+            raise ValueError('format must be graph6 or sparse6, not %r.' % (format,))
+        self.encode = edges_to_graph6 if format == 'graph6' else edges_to_sparse6
+        if isinstance(target, basestring):
+            self.output = open(target, 'ab' if append else 'wb')
+            self.owns_output = True
+        else:
+            self.output = target
+            self.owns_output = False
+        self.buffer = []
+        self.buffer_size = buffer_size
+        self.count = 0
+        # the header isn't a line of its own; it goes in front of the first graph
+        self.prefix = ''
+        if header:
+            self.prefix = GRAPH6_HEADER if format == 'graph6' else SPARSE6_HEADER
+
+    # write_edges()
+    #
+    # Writes the graph on n vertices with the given edges
+    def write_edges(self, n, edges):
+        self.buffer.append(self.prefix + self.encode(n, edges))
+        self.prefix = ''
+        self.count += 1
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    # write()
+    #
+    # Writes a networkx graph or an OptimizedGraph
+    def write(self, graph):
+        n, edges = graph_edges(graph)
+        self.write_edges(n, edges)
+
+    # write_all()
+    #
+    # Writes every graph from an iterable
+    def write_all(self, graphs):
+        for graph in graphs:
+            self.write(graph)
+
+    # flush()
+    #
+    # Writes out the buffered lines
+    def flush(self):
+        if self.buffer:
+            self.output.write('\n'.join(self.buffer) + '\n')
+            self.buffer = []
+        self.output.flush()
+
+    # close()
+    #
+    # Flushes, and closes the file if the writer opened it
+    def close(self):
+        self.flush()
+        if self.owns_output:
+            self.output.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.close()
+
+
+# write_graphs()
+#
+# Writes every graph from an iterable to a path or open file
+#
+# Returns the number of graphs written
+def write_graphs(target, graphs, format='graph6', header=False):
+    with GraphWriter(target, format, header) as writer:
+        writer.write_all(graphs)
+    return writer.count
+
+
+# test()
+#
+# Round trips random graphs through both formats and checks them against networkx's own graph6/sparse6 code
+def test():
+    import random
+    import tempfile
+    import os
+    from OptimizedGraph import OptimizedGraph
+
+    print 'Testing encode_size() and decode_size()'
+    for n in (0, 1, 62, 63, 258047, 258048, 1 << 20):
+        assert decode_size(encode_size(n)) == (n, len(encode_size(n)))
+    print 'Passed.'
+
+    print 'Testing against networkx'
+    rng = random.Random(0)
+    graphs = []
+    for n in range(0, 70, 3) + [2, 4, 8, 16, 32, 64]:
+        for trial in range(0, 5):
+            probability = rng.choice((0.05, 0.2, 0.5))
+            graph = nx.Graph()
+            graph.add_nodes_from(range(0, n))
+            graph.add_edges_from((a, b) for b in range(0, n) for a in range(0, b) if rng.random() < probability)
+            graphs.append(graph)
+    for graph in graphs:
+        n, edges = graph_edges(graph)
+        for encode, expected in ((edges_to_graph6, nx.to_graph6_bytes), (edges_to_sparse6, nx.to_sparse6_bytes)):
+            line = encode(n, edges)
+            assert line + '\n' == expected(graph, header=False)
+            m, decoded = line_to_edges(line)
+            assert m == n
+            assert sorted(decoded) == sorted((min(edge), max(edge)) for edge in edges)
+    print 'Passed.'
+
+    print 'Testing GraphWriter and read_graphs()'
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'graphs.txt')
+        for format in ('graph6', 'sparse6'):
+            for header in (False, True):
+                assert write_graphs(path, graphs, format, header) == len(graphs)
+                for graph, read in zip(graphs, read_graphs(path)):
+                    assert graph.number_of_nodes() == read.number_of_nodes()
+                    assert sorted(graph.edges()) == sorted(read.edges())
+                assert len(list(read_edges(path))) == len(graphs)
+
+        # OptimizedGraphs both ways, through a small buffer
+        optimized = []
+        for graph in graphs[:40]:
+            converted = OptimizedGraph(graph.number_of_nodes())
+            for a, b in graph.edges():
+                converted.add_edge(a, b)
+            optimized.append(converted)
+        with GraphWriter(path, 'sparse6', buffer_size=7) as writer:
+            writer.write_all(optimized)
+        for graph, read in zip(optimized, read_graphs(path, OptimizedGraph)):
+            assert graph.get_full_adjacency_matrix() == read.get_full_adjacency_matrix()
+            assert graph.does_follow_rules() == read.does_follow_rules()
+    finally:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+    print 'Passed.'
+
+
+# If somebody ever runs this file, invoke test()
+if __name__ == '__main__':
+    test()
@@ -108,6 +108,7 @@ def iso(L):
         for g in H:
             if nx.is_isomorphic(x, g):
                 found_iso = True
+                break
         if not found_iso:
             H.append(x)
     return H
@@ -0,0 +1,314 @@
+import json
+from time import time
+from OptimizedGraph import OptimizedGraph
+
+# Opt-in counters and timers for the graph structures and the searches
+#
+# Nothing here is paid for unless it's asked for. The graph structures are left alone: graph_class() returns a
+#  subclass of any of them (OptimizedGraph, NumpyOptimizedGraph, ...) that counts and times its hot methods before
+#  handing over to the real ones, and a search only uses it if it's passed in as the graph_class. The searches
+#  (BranchAndBound, CanonicalAugmentation) take an instrumentation argument that is None by default, which costs one
+#  comparison per node.
+#
+# Counters (see COUNTERS):
+#
+#  add_edge, remove_edge        calls
+#  undone_writes                writes rolled back by pop_state()
+#  square_cells_recomputed      cells of the square recomputed by OptimizedGraph.write_square_cell(); subclasses that
+#                               update the square another way (NumpyOptimizedGraph, CompiledOptimizedGraph) leave it 0
+#  square_cells_changed         the recomputed cells whose value changed
+#  rule_checks                  can_add_edge() calls
+#  rejected_present             ... that were rejected because the edge is a loop or already there
+#  rejected_c3, _c4, _c6        ... that were rejected for closing a cycle of that length (see edge_cycle_length())
+#  canonical_labellings         canonical labellings computed (not memoized ones)
+#  nodes                        search nodes visited
+#  pruned                       nodes cut off by a bound, also counted by bound in pruned_<bound>
+#  rejected_non_canonical       CanonicalAugmentation children rejected for not being canonical
+#
+# candidate_edges() drops pairs that certainly close a c3 or c4 without a rule check, so the searches' c3 and c4
+#  rejections are only the ones that get past it.
+#
+# Phases are seconds spent in: write (add_edge() and remove_edge()), undo (pop_state()), canonical (labelling),
+#  candidates (building the list of legal edges at a node), bounds (the pruning tests) and branch (picking the edge).
+#
+# Every check_every nodes the clock is read, and if interval seconds have passed a report is appended to reports and
+#  written to output as one line of JSON:
+#
+#  {"elapsed": 10.0, "interval": 10.0, "checks_per_second": ..., "nodes_per_second": ..., "writes_per_second": ...,
+#   "prune_ratio": ..., "counters": {...}, "phases": {...}}
+#
+# The rates are over the interval since the last report; prune_ratio (pruned / nodes) and the rest are totals.
+
+COUNTERS = ('add_edge', 'remove_edge', 'undone_writes', 'square_cells_recomputed', 'square_cells_changed',
+            'rule_checks', 'rejected_present', 'rejected_c3', 'rejected_c4', 'rejected_c6', 'canonical_labellings',
+            'nodes', 'pruned', 'rejected_non_canonical')
+
+
+# Instrumentation
+#
+# Counters, phase timers and periodic reports for one run; see module docs
+#
+# output A file-like object to write the JSON lines reports to, or None to only keep them in reports
+# interval The least number of seconds between periodic reports
+# check_every How many nodes to visit between reading the clock
+class Instrumentation:
+    # __init__()
+    #
+    # constructor
+    def __init__(self, output=None, interval=10, check_every=256):
+        self.output = output
+        self.interval = interval
+        self.check_every = check_every
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.phases = {}
+        self.reports = []
+        self.graph_classes = {}
+
+        self.started = time()
+        self.next_check = check_every
+        self.last_report = self.started
+        self.last_counters = dict(self.counters)
+
+    # count()
+    #
+    # Adds amount to a counter, creating it if it isn't one of COUNTERS
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    # lap()
+    #
+    # Adds the time since started to a phase
+    #
+    # Returns the time now, to start the next phase from
+    def lap(self, phase, started):
+        now = time()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - started
+        return now
+
+    # node()
+    #
+    # Counts a search node, and writes a report if it's time to
+    def node(self):
+        counters = self.counters
+        counters['nodes'] += 1
+        if counters['nodes'] >= self.next_check:
+            self.next_check = counters['nodes'] + self.check_every
+            if time() - self.last_report >= self.interval:
+                self.report()
+
+    # prune()
+    #
+    # Counts a node cut off by the named bound
+    #
+    # phase, started If given, the time since started is added to phase; see lap()
+    def prune(self, bound, phase=None, started=None):
+        self.counters['pruned'] += 1
+        self.count('pruned_' + bound)
+        if phase is not None:
+            self.lap(phase, started)
+
+    # report()
+    #
+    # Appends a report of everything so far to reports and writes it to output; see module docs
+    #
+    # Returns the report
+    def report(self):
+        now = time()
+        counters = self.counters
+        last = self.last_counters
+        interval = now - self.last_report
+
+        # rates are over the interval; a report straight after another has none to speak of
+        def rate(*names):
+            if interval <= 0:
+                return 0.0
+            return sum(counters.get(name, 0) - last.get(name, 0) for name in names) / interval
+
+        report = {
+            'elapsed': now - self.started,
+            'interval': interval,
+            'checks_per_second': rate('rule_checks'),
+            'nodes_per_second': rate('nodes'),
+            'writes_per_second': rate('add_edge', 'remove_edge'),
+            'prune_ratio': float(counters['pruned']) / counters['nodes'] if counters['nodes'] else 0.0,
+            'counters': dict(counters),
+            'phases': dict(self.phases),
+        }
+        self.reports.append(report)
+        if self.output is not None:
+            self.output.write(json.dumps(report, sort_keys=True) + '\n')
+            self.output.flush()
+
+        self.last_report = now
+        self.last_counters = dict(counters)
+        return report
+
+    # graph_class()
+    #
+    # Returns a subclass of base that counts and times its calls into this Instrumentation; see module docs
+    #
+    # The subclass is made once per base and is only defined in this process, so it can't be sent to a
+    #  multiprocessing worker.
+    def graph_class(self, base=OptimizedGraph):
+        if base not in self.graph_classes:
+            self.graph_classes[base] = instrumented_graph_class(base, self)
+        return self.graph_classes[base]
+
+
+# instrumented_graph_class()
+#
+# Returns a subclass of the graph class base whose hot methods report to instrumentation; see
+#  Instrumentation.graph_class()
+def instrumented_graph_class(base, instrumentation):
+    counters = instrumentation.counters
+
+    class InstrumentedGraph(base):
+        # add_edge()
+        #
+        # Same contract as base.add_edge()
+        def add_edge(self, a, b):
+            counters['add_edge'] += 1
+            started = time()
+            result = base.add_edge(self, a, b)
+            instrumentation.lap('write', started)
+            return result
+
+        # remove_edge()
+        #
+        # Same contract as base.remove_edge()
+        def remove_edge(self, a, b):
+            counters['remove_edge'] += 1
+            started = time()
+            result = base.remove_edge(self, a, b)
+            instrumentation.lap('write', started)
+            return result
+
+        # write_square_cell()
+        #
+        # Same contract as OptimizedGraph.write_square_cell()
+        def write_square_cell(self, row, col, total):
+            counters['square_cells_recomputed'] += 1
+            change = base.write_square_cell(self, row, col, total)
+            if change:
+                counters['square_cells_changed'] += 1
+            return change
+
+        # pop_state()
+        #
+        # Same contract as base.pop_state()
+        def pop_state(self):
+            counters['undone_writes'] += len(self.undo_log) - self.undo_marks[-1]
+            started = time()
+            base.pop_state(self)
+            instrumentation.lap('undo', started)
+
+        # can_add_edge()
+        #
+        # Same contract as base.can_add_edge(); a rejection is looked into again to find out why
+        def can_add_edge(self, a, b):
+            counters['rule_checks'] += 1
+            allowed = base.can_add_edge(self, a, b)
+            if not allowed:
+                if a == b or self.check_edge_present(a, b):
+                    counters['rejected_present'] += 1
+                else:
+                    counters['rejected_c%d' % self.edge_cycle_length(a, b)] += 1
+            return allowed
+
+        # canonical_labelling()
+        #
+        # Same contract as base.canonical_labelling()
+        def canonical_labelling(self):
+            if self.canonical_labelling_cache is not None:
+                return self.canonical_labelling_cache
+            counters['canonical_labellings'] += 1
+            started = time()
+            labelling = base.canonical_labelling(self)
+            instrumentation.lap('canonical', started)
+            return labelling
+
+    InstrumentedGraph.__name__ = 'Instrumented' + base.__name__
+    return InstrumentedGraph
+
+
+# test()
+#
+# Checks that instrumented searches find the same graphs the same way, and that the counters add up
+def test():
+    import StringIO
+    from find_extremal_graphs import BranchAndBound, CanonicalAugmentation, find_extremal_graph_size
+    from NumpyOptimizedGraph import NumpyOptimizedGraph
+
+    print 'Testing instrumented BranchAndBound'
+    known_sizes = {}
+    for n in range(1, 12):
+        plain = BranchAndBound(n, dict(known_sizes))
+        size = plain.run()
+
+        output = StringIO.StringIO()
+        instrumentation = Instrumentation(output, interval=0, check_every=16)
+        search = BranchAndBound(n, dict(known_sizes), instrumentation.graph_class(), instrumentation=instrumentation)
+        assert search.run() == size
+        assert search.best_edges == plain.best_edges
+        assert search.nodes == plain.nodes
+        known_sizes[n] = size
+        instrumentation.report()
+
+        counters = instrumentation.counters
+        assert counters['nodes'] == search.nodes
+        assert counters['pruned'] <= counters['nodes']
+        assert counters['pruned'] == sum(counters[name] for name in counters if name.startswith('pruned_'))
+        # every include is undone, and each OptimizedGraph write recomputes a row and a column of the square
+        assert counters['undone_writes'] <= counters['add_edge']
+        assert counters['square_cells_recomputed'] == 2 * n * (counters['add_edge'] + counters['remove_edge'])
+        assert counters['rejected_present'] == 0
+        rejected = counters['rejected_c3'] + counters['rejected_c4'] + counters['rejected_c6']
+        assert rejected <= counters['rule_checks']
+        if n >= 8:
+            assert counters['rejected_c6'] > 0
+            assert set(instrumentation.phases) == set(['write', 'undo', 'candidates', 'bounds', 'branch'])
+
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert len(lines) == len(instrumentation.reports) >= 1
+        assert lines[-1]['counters'] == counters
+        for line in lines:
+            assert 0 <= line['prune_ratio'] <= 1
+            assert line['checks_per_second'] >= 0 and line['nodes_per_second'] >= 0
+    print 'Passed.'
+
+    print 'Testing rejection counts against edge_cycle_length()'
+    instrumentation = Instrumentation()
+    graph = instrumentation.graph_class(NumpyOptimizedGraph)(8)
+    for a, b in ((0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6)):
+        graph.add_edge(a, b)
+    assert not graph.can_add_edge(0, 2)
+    assert not graph.can_add_edge(0, 3)
+    assert graph.can_add_edge(0, 4)
+    assert not graph.can_add_edge(0, 5)
+    assert not graph.can_add_edge(0, 1)
+    counters = instrumentation.counters
+    assert (counters['rejected_c3'], counters['rejected_c4'], counters['rejected_c6']) == (1, 1, 1)
+    assert counters['rejected_present'] == 1 and counters['rule_checks'] == 5
+    assert counters['add_edge'] == 6 and counters['square_cells_recomputed'] == 0
+    print 'Passed.'
+
+    print 'Testing instrumented CanonicalAugmentation and find_extremal_graph_size()'
+    instrumentation = Instrumentation()
+    canonical_sizes = {}
+    for n in range(1, 9):
+        canonical_sizes[n] = CanonicalAugmentation(n, canonical_sizes, instrumentation.graph_class(),
+                                                   instrumentation=instrumentation).run()
+        assert canonical_sizes[n] == known_sizes[n]
+    assert instrumentation.counters['canonical_labellings'] > 0
+    assert instrumentation.counters['rejected_non_canonical'] > 0
+    assert 'canonical' in instrumentation.phases
+
+    instrumentation = Instrumentation()
+    assert find_extremal_graph_size(10, instrumentation=instrumentation) == known_sizes[10]
+    assert instrumentation.reports and instrumentation.counters['nodes'] > 0
+    print 'Passed.'
+
+
+# If somebody ever runs this file, invoke test()
+if __name__ == '__main__':
+    test()
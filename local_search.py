@@ -0,0 +1,294 @@
+import math
+import random
+from time import time
+from OptimizedGraph import OptimizedGraph
+import seeds
+
+# Stochastic local search for dense graphs without c3, c4, or c6 cycles, for lower bounds on s(n) where
+#  BranchAndBound can't finish.
+#
+# Every move removes a random edge and then tries to add pairs near the removed edge; a move that comes out ahead
+#  (two pairs added for one removed) always stands, and one that loses the edge is kept with the simulated annealing
+#  probability exp(-1 / temperature). A removed edge may not be added back, and an added edge may not be removed, for
+#  tabu_tenure moves, which stops the search from undoing its last few moves.
+#
+# Moves must be cheap, so the graph is kept as neighbour sets and adding (a, b) is checked locally: it's legal iff a
+#  and b aren't adjacent and there's no walk of length 2, 3, or 5 between them. In a graph without c3, c4, or c6 this
+#  is exactly OptimizedGraph.can_add_edge() (whose square and cube cells count those walks), but costs a few set
+#  operations instead of an O(n^2) update of the square and cube on every write. The best graph is handed back as an
+#  OptimizedGraph; see best_graph().
+
+
+# LocalSearch
+#
+# Simulated annealing with tabu lists over graphs on n vertices
+#
+# seed Seeds the random number generator; two searches with the same seed and arguments make the same moves
+# start A graph with a neighbours attribute (e.g. an OptimizedGraph) to start from; defaults to seeds.seed_graph(n)
+# tabu_tenure How many moves a removed edge stays out and an added edge stays in; defaults to n
+# temperature The starting annealing temperature
+# cooling The factor the temperature is multiplied by after every move
+# samples How many pairs each move tries to add after removing an edge
+class LocalSearch:
+    # __init__()
+    #
+    # constructor
+    def __init__(self, n, seed=None, start=None, tabu_tenure=None, temperature=0.1, cooling=0.999999, samples=8):
+        self.n = n
+        self.random = random.Random(seed)
+        # Random.randrange() and Random.choice() cost more than the rest of a move, so moves draw from random() instead
+        self.uniform = self.random.random
+        self.tabu_tenure = tabu_tenure if tabu_tenure is not None else n
+        self.temperature = temperature
+        self.cooling = cooling
+        self.samples = samples
+
+        self.neighbours = [set() for i in range(0, n)]
+        # the edges as a list and each edge's position in it, so that a random edge can be picked and removed in
+        #  constant time
+        self.edges = []
+        self.edge_positions = {}
+        # tabu_until[a * n + b] (a < b) is the first move at which the pair may be changed again
+        self.tabu_until = [0] * (n * n)
+
+        if start is None:
+            start = seeds.seed_graph(n)
+        for a in range(0, n):
+            for b in start.neighbours[a]:
+                if a < b:
+                    self.add_edge(a, b)
+
+        self.moves = 0
+        self.best_edge_count = len(self.edges)
+        self.best_edges = list(self.edges)
+        # (seconds, moves, best edge count) every time the best improves; seconds only count time spent in run()
+        self.history = [(0.0, 0, self.best_edge_count)]
+        # seconds spent in earlier run() calls, and when the current one started
+        self.elapsed = 0.0
+        self.start_time = time()
+        self.report = None
+
+    # can_add_edge()
+    #
+    # Returns True iff adding (a, b) leaves the graph without c3, c4, or c6; see the module docs
+    def can_add_edge(self, a, b):
+        if a == b:
+            return False
+        neighbours = self.neighbours
+        near_a = neighbours[a]
+        near_b = neighbours[b]
+        if b in near_a or not near_a.isdisjoint(near_b):
+            return False
+        # the vertices at the end of a walk of length 2 from a, and from b
+        second_a = set()
+        for x in near_a:
+            second_a |= neighbours[x]
+        if not second_a.isdisjoint(near_b):
+            return False
+        second_b = set()
+        for x in near_b:
+            second_b |= neighbours[x]
+        # a walk of length 5 is a walk of length 2 from a, an edge, and a walk of length 2 from b
+        for y in second_a:
+            if not neighbours[y].isdisjoint(second_b):
+                return False
+        return True
+
+    # add_edge()
+    #
+    # Adds the edge (a, b), a < b, without checking it
+    def add_edge(self, a, b):
+        self.neighbours[a].add(b)
+        self.neighbours[b].add(a)
+        self.edge_positions[(a, b)] = len(self.edges)
+        self.edges.append((a, b))
+
+    # remove_edge()
+    #
+    # Removes the edge (a, b), a < b, by moving the last edge into its place in the list
+    def remove_edge(self, a, b):
+        self.neighbours[a].discard(b)
+        self.neighbours[b].discard(a)
+        position = self.edge_positions.pop((a, b))
+        last = self.edges.pop()
+        if last != (a, b):
+            self.edges[position] = last
+            self.edge_positions[last] = position
+
+    # nearby_vertex()
+    #
+    # Returns the end of a random walk of length 0, 1, or 2 from vertex; pairs that removing an edge (u, v) makes legal
+    #  had their only walks of length 2, 3, or 5 through it, so they tend to be near u and v
+    def nearby_vertex(self, vertex):
+        uniform = self.uniform
+        for step in range(0, int(uniform() * 3)):
+            near = self.neighbours[vertex]
+            if not near:
+                break
+            vertex = tuple(near)[int(uniform() * len(near))]
+        return vertex
+
+    # try_add()
+    #
+    # Adds (a, b) if it's legal and not tabu
+    #
+    # Returns True iff the edge was added
+    def try_add(self, a, b):
+        if a > b:
+            a, b = b, a
+        if self.tabu_until[a * self.n + b] > self.moves or not self.can_add_edge(a, b):
+            return False
+        self.add_edge(a, b)
+        return True
+
+    # move()
+    #
+    # Makes one move; see the module docs
+    def move(self):
+        n = self.n
+        uniform = self.uniform
+        self.moves += 1
+        self.temperature *= self.cooling
+
+        # one pair anywhere first, which is all it takes while the graph is far from maximal
+        if self.try_add(int(uniform() * n), int(uniform() * n)):
+            self.record()
+            return
+
+        if not self.edges:
+            return
+        u, v = self.edges[int(uniform() * len(self.edges))]
+        if self.tabu_until[u * n + v] > self.moves:
+            return
+        self.remove_edge(u, v)
+
+        added = []
+        for sample in range(0, self.samples):
+            if sample % 2 == 0:
+                a = self.nearby_vertex(u)
+                b = self.nearby_vertex(v)
+            else:
+                a = self.nearby_vertex(u if uniform() < 0.5 else v)
+                b = int(uniform() * n)
+            if a > b:
+                a, b = b, a
+            if self.try_add(a, b):
+                added.append((a, b))
+
+        change = len(added) - 1
+        if change < 0 and uniform() >= math.exp(change / max(self.temperature, 1e-9)):
+            # rejected; put the graph back
+            for a, b in added:
+                self.remove_edge(a, b)
+            self.add_edge(u, v)
+            return
+
+        self.tabu_until[u * n + v] = self.moves + self.tabu_tenure
+        for a, b in added:
+            self.tabu_until[a * n + b] = self.moves + self.tabu_tenure
+        self.record()
+
+    # record()
+    #
+    # Remembers the current graph if it's the best so far
+    def record(self):
+        if len(self.edges) > self.best_edge_count:
+            self.best_edge_count = len(self.edges)
+            self.best_edges = list(self.edges)
+            self.history.append((self.elapsed + time() - self.start_time, self.moves, self.best_edge_count))
+            if self.report is not None:
+                self.report(*self.history[-1])
+
+    # run()
+    #
+    # Makes moves until either limit is reached; at least one must be given. A search limited only by moves is
+    #  reproducible from its seed.
+    #
+    # moves How many more moves to make
+    # seconds How long to search for
+    # report Called with (seconds, moves, best edge count) every time the best improves
+    #
+    # Returns the best edge count found
+    def run(self, moves=None, seconds=None, report=None):
+        if moves is None and seconds is None:
+            raise ValueError('LocalSearch.run() needs a limit: moves, seconds, or both.')
+        self.report = report
+        self.start_time = time()
+        end_move = self.moves + moves if moves is not None else None
+        end_time = self.start_time + seconds if seconds is not None else None
+        try:
+            while end_move is None or self.moves < end_move:
+                # checking the clock is slower than a move, so only check it every 1024 moves
+                if end_time is not None and self.moves % 1024 == 0 and time() >= end_time:
+                    break
+                self.move()
+        finally:
+            self.elapsed += time() - self.start_time
+        return self.best_edge_count
+
+    # best_graph()
+    #
+    # Returns the best graph found as a graph_class (an OptimizedGraph by default)
+    def best_graph(self, graph_class=OptimizedGraph):
+        best = graph_class(self.n)
+        for a, b in self.best_edges:
+            best.add_edge(a, b)
+        return best
+
+
+# test()
+#
+# Checks the local check against OptimizedGraph, reproducibility, and that the search finds good graphs
+def test():
+    print 'Testing LocalSearch.can_add_edge()'
+    for trial in range(0, 20):
+        search = LocalSearch(12, seed=trial, start=OptimizedGraph(12))
+        search.run(moves=50)
+        graph = OptimizedGraph(12)
+        for a, b in search.edges:
+            graph.add_edge(a, b)
+        for a in range(0, 12):
+            for b in range(0, 12):
+                assert search.can_add_edge(a, b) == (a != b and graph.can_add_edge(a, b))
+    print 'Passed.'
+
+    print 'Testing LocalSearch.run()'
+    # s(n) for n = 10..15
+    for n, size in zip(range(10, 16), (12, 13, 15, 17, 18, 20)):
+        search = LocalSearch(n, seed=1, start=OptimizedGraph(n))
+        assert search.run(moves=20000) == size
+        assert search.best_graph().does_follow_rules()
+        assert [entry[2] for entry in search.history] == sorted(set(entry[2] for entry in search.history))
+
+    first = LocalSearch(30, seed=7, start=OptimizedGraph(30))
+    second = LocalSearch(30, seed=7, start=OptimizedGraph(30))
+    assert first.run(moves=5000) == second.run(moves=5000)
+    assert first.best_edges == second.best_edges
+
+    # history times add up the run() calls, without the time between them
+    from time import sleep
+    search = LocalSearch(40, seed=3, start=OptimizedGraph(40))
+    running = 0.0
+    for call in range(0, 5):
+        started = time()
+        search.run(moves=2000)
+        running += time() - started
+        sleep(0.1)
+    times = [entry[0] for entry in search.history]
+    assert times == sorted(times)
+    assert times[-1] <= search.elapsed <= running
+    assert search.elapsed > running - 0.05
+
+    search = LocalSearch(40, seed=1)
+    start_time = time()
+    search.run(moves=100000)
+    print '%d edges on 40 vertices; %d moves per minute' % (search.best_edge_count,
+                                                            100000 * 60 / (time() - start_time))
+    assert search.best_edge_count >= 70
+    assert search.best_graph().does_follow_rules()
+    print 'Passed.'
+
+
+# If somebody ever runs this file, invoke test()
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,126 @@
+import multiprocessing
+from time import time
+from OptimizedGraph import OptimizedGraph
+from find_extremal_graphs import BranchAndBound
+
+# Parallel driver for BranchAndBound
+#
+# The search tree of every seed tree is cut split_depth decisions below its root (see BranchAndBound.split()). Each
+#  node at that depth is an independent subproblem, so there are usually many more subproblems than processes.
+#
+# The subproblems are handed out one at a time from a shared queue (Pool.imap_unordered with chunksize=1): a
+#  process that finishes a cheap subtree immediately takes the next one, so the load balances itself even though
+#  subtree sizes vary by orders of magnitude. Subproblems are queued most promising seed first, like run().
+#
+# All processes share the best edge count found so far through a multiprocessing.Value. Every BranchAndBound reads it
+#  when pruning, so a good graph found by one process immediately prunes the others.
+
+# The shared best edge count, set in each worker process by init_worker()
+shared_best = None
+
+
+# init_worker()
+#
+# Pool initializer: makes the shared best edge count available to solve_subproblem()
+def init_worker(best):
+    global shared_best
+    shared_best = best
+
+
+# solve_subproblem()
+#
+# Runs in a worker process. Searches the subtree below one subproblem from BranchAndBound.split().
+#
+# task A tuple (n, known_sizes, graph_class, max_degree, child_counts, decisions)
+#
+# Returns (best edge count, best edges, nodes visited) for the subtree
+def solve_subproblem(task):
+    n, known_sizes, graph_class, max_degree, child_counts, decisions = task
+    search = BranchAndBound(n, known_sizes, graph_class, shared_best)
+    search.search_seed(max_degree, child_counts, decisions)
+    return search.best_edge_count, search.best_edges, search.nodes
+
+
+# parallel_search()
+#
+# Runs BranchAndBound for n vertices across a pool of processes.
+#
+# known_sizes A dictionary mapping smaller vertex counts m to s(m)
+# processes The number of worker processes; defaults to the number of CPUs
+# split_depth How many decisions below each seed tree to cut the search; deeper means more, smaller subproblems
+#
+# Returns (best edge count, best edges, nodes visited, number of subproblems)
+def parallel_search(n, known_sizes=None, processes=None, split_depth=4, graph_class=OptimizedGraph):
+    known_sizes = known_sizes or {}
+
+    # the nodes above split_depth are searched here, which also gives the workers a starting best
+    splitter = BranchAndBound(n, known_sizes, graph_class)
+    subproblems = splitter.split(split_depth)
+
+    best_edge_count = splitter.best_edge_count
+    best_edges = splitter.best_edges
+    nodes = splitter.nodes
+
+    if subproblems and best_edge_count < splitter.bound:
+        best = multiprocessing.Value('i', best_edge_count)
+        pool = multiprocessing.Pool(processes, initializer=init_worker, initargs=(best,))
+        tasks = [(n, known_sizes, graph_class, max_degree, child_counts, decisions)
+                 for max_degree, child_counts, decisions in subproblems]
+        try:
+            for edge_count, edges, subproblem_nodes in pool.imap_unordered(solve_subproblem, tasks, 1):
+                nodes += subproblem_nodes
+                if edge_count > best_edge_count:
+                    best_edge_count = edge_count
+                    best_edges = edges
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    return best_edge_count, best_edges, nodes, len(subproblems)
+
+
+# parallel_find_extremal_graph_size()
+#
+# Parallel equivalent of find_extremal_graph_size() in find_extremal_graphs.py
+#
+# Sizes below sequential_below are cheap enough that starting a pool would cost more than it saves, so they are found
+#  sequentially.
+def parallel_find_extremal_graph_size(n, processes=None, split_depth=4, graph_class=OptimizedGraph,
+                                      sequential_below=11):
+    known_sizes = {}
+    for m in range(1, n + 1):
+        if m < sequential_below:
+            known_sizes[m] = BranchAndBound(m, known_sizes, graph_class).run()
+        else:
+            known_sizes[m] = parallel_search(m, known_sizes, processes, split_depth, graph_class)[0]
+    return known_sizes[n]
+
+
+# test()
+#
+# Checks the parallel search against the sequential one
+def test():
+    print 'Testing parallel_search() against BranchAndBound'
+    known_sizes = {}
+    for n in range(1, 13):
+        known_sizes[n] = BranchAndBound(n, dict(known_sizes)).run()
+        start = time()
+        edge_count, edges, nodes, subproblem_count = parallel_search(n, known_sizes, 2, 3)
+        assert edge_count == known_sizes[n]
+        assert len(edges) == edge_count
+
+        graph = OptimizedGraph(n)
+        for a, b in edges:
+            graph.add_edge(a, b)
+        assert graph.does_follow_rules()
+        print 'n=%s: %s edges, %s nodes in %s subproblems, %s seconds' % (n, edge_count, nodes, subproblem_count,
+                                                                         time() - start)
+    print 'Passed.'
+
+
+# If somebody ever runs this file, invoke test()
+if __name__ == '__main__':
+    test()
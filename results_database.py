@@ -0,0 +1,275 @@
+import sqlite3
+import canonical
+import graph_io
+
+# SQLite store of the graphs the searches find
+#
+# Every graph is stored once per isomorphism class. Its certificate is the graph6 line (see graph_io.py) of the graph
+#  relabelled by its canonical labelling (see canonical.py), which is the same string for isomorphic graphs. The
+#  certificate is also how the graph is stored, so it reads back as the canonical representative.
+#
+# The table is indexed on (n, edges), (n, degree sequence) and the certificate, so the questions graph.max_edges(),
+#  graph.filter_by_edge_count() and graph.filter_by_isomorphic() answer by scanning a list are index lookups:
+#
+#  max_edges(23)                   the most edges known on 23 vertices
+#  graphs(n=23, edges=30)          one graph from every known isomorphism class with 30 edges on 23 vertices
+#  known_sizes()                   {n: most edges known}, e.g. for BranchAndBound's known_sizes
+#
+# Inserts are INSERT OR IGNORE on the unique certificate, so any number of workers can record the same graphs
+#  concurrently without duplicating each other; sqlite serialises the writers and timeout is how long one waits for
+#  another. add_many() inserts a whole batch in one transaction.
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS graphs (
+    id INTEGER PRIMARY KEY,
+    n INTEGER NOT NULL,
+    edges INTEGER NOT NULL,
+    degree_sequence TEXT NOT NULL,
+    certificate TEXT NOT NULL UNIQUE,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS graphs_by_size ON graphs (n, edges);
+CREATE INDEX IF NOT EXISTS graphs_by_degrees ON graphs (n, degree_sequence);
+'''
+
+
+# graph_row()
+#
+# Returns (n, edges, degree sequence, certificate) of a networkx graph or an OptimizedGraph
+#
+# The degree sequence is the degrees in non-increasing order, comma separated
+def graph_row(graph):
+    n, edges = graph_io.graph_edges(graph)
+    degrees = [0] * n
+    for a, b in edges:
+        degrees[a] += 1
+        degrees[b] += 1
+    labelling = canonical.CanonicalLabelling(canonical.neighbourhoods_from_edges(n, edges)).labelling
+    label = [0] * n
+    for position, vertex in enumerate(labelling):
+        label[vertex] = position
+    certificate = graph_io.edges_to_graph6(n, [(label[a], label[b]) for a, b in edges])
+    return n, len(edges), ','.join(str(degree) for degree in sorted(degrees, reverse=True)), certificate
+
+
+# ResultsDatabase
+#
+# A connection to a results database file, created if it doesn't exist. Usable as a context manager.
+#
+# path A file path, or ':memory:' for a database that only lasts as long as the connection
+# timeout How many seconds to wait for another process's write to finish
+class ResultsDatabase:
+    # __init__()
+    #
+    # constructor
+    def __init__(self, path, timeout=60):
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        # write-ahead logging lets readers carry on while a worker writes
+        if path != ':memory:':
+            self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+    # add()
+    #
+    # Records a networkx graph or an OptimizedGraph
+    #
+    # source An optional note of where the graph came from, e.g. 'BranchAndBound' or a seed
+    #
+    # Returns True iff the graph's isomorphism class wasn't known yet
+    def add(self, graph, source=None):
+        return self.add_many([graph], source) == 1
+
+    # add_many()
+    #
+    # Records every graph from an iterable in one transaction
+    #
+    # Returns the number of graphs whose isomorphism class wasn't known yet
+    def add_many(self, graphs, source=None):
+        rows = [graph_row(graph) + (source,) for graph in graphs]
+        before = self.connection.total_changes
+        with self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO graphs (n, edges, degree_sequence, certificate, source) '
+                                        'VALUES (?, ?, ?, ?, ?)', rows)
+        return self.connection.total_changes - before
+
+    # max_edges()
+    #
+    # Returns the most edges of any known graph on n vertices, or None if none are known
+    def max_edges(self, n):
+        return self.connection.execute('SELECT MAX(edges) FROM graphs WHERE n = ?', (n,)).fetchone()[0]
+
+    # known_sizes()
+    #
+    # Returns a dictionary mapping each vertex count with known graphs to the most edges known for it
+    def known_sizes(self):
+        return dict(self.connection.execute('SELECT n, MAX(edges) FROM graphs GROUP BY n'))
+
+    # where()
+    #
+    # Returns the WHERE clause and its parameters for the given filters; None means any value
+    @staticmethod
+    def where(n, edges, degree_sequence):
+        conditions = []
+        parameters = []
+        for column, value in (('n', n), ('edges', edges), ('degree_sequence', degree_sequence)):
+            if value is not None:
+                if column == 'degree_sequence' and not isinstance(value, basestring):
+                    value = ','.join(str(degree) for degree in sorted(value, reverse=True))
+                conditions.append('%s = ?' % column)
+                parameters.append(value)
+        if not conditions:
+            return '', parameters
+        return ' WHERE ' + ' AND '.join(conditions), parameters
+
+    # count()
+    #
+    # Returns the number of known isomorphism classes matching the filters; see graphs()
+    def count(self, n=None, edges=None, degree_sequence=None):
+        clause, parameters = self.where(n, edges, degree_sequence)
+        return self.connection.execute('SELECT COUNT(*) FROM graphs' + clause, parameters).fetchone()[0]
+
+    # graphs()
+    #
+    # Generator over one graph from every known isomorphism class matching the filters, in the order they were added
+    #
+    # degree_sequence A list of degrees in any order, or a string as stored (see graph_row())
+    # graph_class Builds each graph as this class (e.g. OptimizedGraph) instead of a networkx graph
+    def graphs(self, n=None, edges=None, degree_sequence=None, graph_class=None):
+        clause, parameters = self.where(n, edges, degree_sequence)
+        for (certificate,) in self.connection.execute('SELECT certificate FROM graphs' + clause + ' ORDER BY id',
+                                                      parameters):
+            vertices, graph_edges = graph_io.graph6_to_edges(str(certificate))
+            yield graph_io.build_graph(vertices, graph_edges, graph_class)
+
+    # contains()
+    #
+    # Returns True iff a graph isomorphic to graph is known
+    def contains(self, graph):
+        certificate = graph_row(graph)[3]
+        return self.connection.execute('SELECT 1 FROM graphs WHERE certificate = ?', (certificate,)).fetchone() \
+            is not None
+
+    # close()
+    #
+    # Closes the connection
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.close()
+
+
+# record_graphs()
+#
+# Runs in a worker process for test(): records graphs in the database at path
+def record_graphs(task):
+    path, graphs = task
+    with ResultsDatabase(path) as database:
+        return database.add_many(graphs, 'worker')
+
+
+# test()
+#
+# Checks that isomorphic graphs are stored once, the queries, and concurrent inserts from several processes
+def test():
+    import multiprocessing
+    import os
+    import random
+    import shutil
+    import tempfile
+    import networkx as nx
+    from OptimizedGraph import OptimizedGraph
+    import graph as graph_module
+
+    rng = random.Random(0)
+    graphs = []
+    for trial in range(0, 120):
+        n = rng.randrange(1, 12)
+        random_graph = nx.Graph()
+        random_graph.add_nodes_from(range(0, n))
+        random_graph.add_edges_from((a, b) for b in range(0, n) for a in range(0, b) if rng.random() < 0.3)
+        graphs.append(random_graph)
+
+    # relabelled copies of the same graphs
+    copies = []
+    for original in graphs:
+        labels = range(0, original.number_of_nodes())
+        rng.shuffle(labels)
+        copies.append(nx.relabel_nodes(original, dict(enumerate(labels))))
+
+    # 30 relabellings each of regular graphs
+    symmetric_graphs = [nx.random_regular_graph(4, 39, seed=39), nx.petersen_graph(), nx.heawood_graph()]
+    symmetric_copies = []
+    for symmetric in symmetric_graphs:
+        relabellings = []
+        for trial in range(0, 30):
+            labels = range(0, symmetric.number_of_nodes())
+            rng.shuffle(labels)
+            relabellings.append(nx.relabel_nodes(symmetric, dict(enumerate(labels))))
+        symmetric_copies.append(relabellings)
+
+    print 'Testing ResultsDatabase against graph.filter_by_isomorphic()'
+    unique = graph_module.filter_by_isomorphic(graphs)
+    with ResultsDatabase(':memory:') as database:
+        assert database.add_many(graphs) == len(unique)
+        assert database.add_many(copies) == 0
+        assert not database.add(copies[0])
+        assert database.count() == len(unique)
+        for n in range(1, 12):
+            same_size = [g for g in unique if g.number_of_nodes() == n]
+            assert database.max_edges(n) == (graph_module.max_edges(same_size) if same_size else None)
+            for edges in range(0, 20):
+                expected = graph_module.filter_by_edge_count(same_size, edges)
+                found = list(database.graphs(n=n, edges=edges))
+                assert len(found) == len(expected) == database.count(n, edges)
+                for g in found:
+                    assert any(nx.is_isomorphic(g, e) for e in expected)
+        assert database.known_sizes() == dict((n, database.max_edges(n)) for n in set(g.number_of_nodes()
+                                                                                       for g in graphs))
+        degrees = [d for node, d in graphs[5].degree()]
+        assert any(nx.is_isomorphic(graphs[5], g) for g in database.graphs(degree_sequence=degrees))
+
+        # relabelled copies of regular graphs, where a labelling that depends on the vertex numbers shows up
+        for symmetric, relabellings in zip(symmetric_graphs, symmetric_copies):
+            size = symmetric.number_of_nodes()
+            assert database.add_many(relabellings) == 1
+            assert len([g for g in database.graphs(n=size, edges=symmetric.number_of_edges())
+                        if nx.is_isomorphic(g, symmetric)]) == 1
+
+        # OptimizedGraphs in and out
+        optimized = OptimizedGraph(6)
+        for a, b in ((0, 1), (1, 2), (2, 3), (3, 4), (4, 5)):
+            optimized.add_edge(a, b)
+        database.add(optimized, 'path')
+        assert database.contains(nx.path_graph(6))
+        path = list(database.graphs(n=6, edges=5, degree_sequence='2,2,2,2,1,1', graph_class=OptimizedGraph))
+        assert len(path) == 1 and path[0].does_follow_rules()
+    print 'Passed.'
+
+    print 'Testing concurrent inserts'
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'results.sqlite')
+        ResultsDatabase(path).close()
+        pool = multiprocessing.Pool(4)
+        # every worker inserts overlapping, relabelled batches
+        tasks = [(path, (graphs + copies)[start:start + 60]) for start in range(0, 240, 20)]
+        tasks += [(path, relabellings[start:start + 10]) for relabellings in symmetric_copies
+                  for start in range(0, 30, 5)]
+        inserted = sum(pool.map(record_graphs, tasks))
+        pool.close()
+        pool.join()
+        with ResultsDatabase(path) as database:
+            assert inserted == database.count() == len(unique) + len(symmetric_graphs)
+    finally:
+        shutil.rmtree(directory)
+    print 'Passed.'
+
+
+# If somebody ever runs this file, invoke test()
+if __name__ == '__main__':
+    test()
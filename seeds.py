@@ -0,0 +1,490 @@
+import networkx as nx
+from OptimizedGraph import OptimizedGraph
+import graph
+
+# Dense graphs without c3, c4, or c6 cycles built directly from finite geometry, to start searches from instead of a
+#  sparse tree (see tree() and treex() in graph.py).
+#
+# A generalized quadrangle of order q has (q + 1)(q^2 + 1) points and as many lines, with q + 1 points on every line
+#  and q + 1 lines through every point, and no triangles of points and lines. Its point-line incidence graph is
+#  bipartite with girth 8, so it has no c3, c4, or c6, and it is (q + 1)-regular on 2(q + 1)(q^2 + 1) vertices.
+#
+# The quadrangle used here is the symplectic quadrangle W(q): the points of the projective space PG(3, q), and the
+#  lines of PG(3, q) on which the symplectic form x0 y1 - x1 y0 + x2 y3 - x3 y2 vanishes. q can be any prime power;
+#  arithmetic is done in GF(q) by FiniteField's tables.
+#
+# A polarity of the quadrangle swaps points and lines while preserving incidence and is its own inverse. Joining each
+#  point to the points on its image line gives the polarity graph on (q + 1)(q^2 + 1) vertices, which is half the size
+#  of the incidence graph with almost the same density (see the notes on ex(40, {C3, C4, C6})). W(q) only has
+#  polarities when q is an odd power of 2: q = 2 gives 20 edges on 15 vertices and q = 8 gives 2600 edges on 585. There
+#  is no polarity graph on 40 vertices, since W(3) has none.
+#
+# Deleting vertices from these graphs can't create a cycle, so densest_subgraph() turns them into seeds for every
+#  smaller vertex count.
+
+
+# is_prime_power()
+#
+# Returns True iff q is p^k for a prime p and k >= 1
+def is_prime_power(q):
+    if q < 2:
+        return False
+    p = [d for d in range(2, q + 1) if q % d == 0][0]
+    while q % p == 0:
+        q //= p
+    return q == 1
+
+
+# FiniteField
+#
+# Addition, negation, multiplication and inverse tables of GF(q) for a prime power q = p^k. Elements are the integers
+#  0..q-1, read as polynomials over GF(p) of degree less than k by their base p digits, so 0 and 1 are the field's 0
+#  and 1 and for prime q the arithmetic is the usual arithmetic mod q.
+#
+# Raises ValueError if q isn't a prime power
+class FiniteField:
+    # __init__()
+    #
+    # constructor
+    def __init__(self, q):
+        if not is_prime_power(q):
+            raise ValueError('%d is not a prime power' % q)
+        p = [d for d in range(2, q + 1) if q % d == 0][0]
+        k = 0
+        while p ** k < q:
+            k += 1
+        self.q = q
+        self.p = p
+        self.k = k
+
+        def digits(a):
+            return [(a // p ** i) % p for i in range(0, k)]
+
+        def number(coefficients):
+            return sum(c * p ** i for i, c in enumerate(coefficients))
+
+        self.add_table = [[number([(x + y) % p for x, y in zip(digits(a), digits(b))]) for b in range(0, q)]
+                          for a in range(0, q)]
+        self.neg_table = [number([-x % p for x in digits(a)]) for a in range(0, q)]
+
+        # multiplication is mod the first monic polynomial of degree k that makes every nonzero element invertible,
+        #  i.e. the first irreducible one
+        for modulus in range(0, q):
+            modulus = digits(modulus) + [1]
+
+            def multiply(a, b):
+                product = [0] * (2 * k - 1)
+                for i, x in enumerate(digits(a)):
+                    for j, y in enumerate(digits(b)):
+                        product[i + j] = (product[i + j] + x * y) % p
+                for degree in range(2 * k - 2, k - 1, -1):
+                    c = product[degree]
+                    for i in range(0, k + 1):
+                        product[degree - k + i] = (product[degree - k + i] - c * modulus[i]) % p
+                return number(product[:k])
+
+            table = [[multiply(a, b) for b in range(0, q)] for a in range(0, q)]
+            if all(1 in table[a] for a in range(1, q)):
+                break
+        self.mul_table = table
+        self.inverse_table = [0] + [table[a].index(1) for a in range(1, q)]
+
+    # frobenius()
+    #
+    # Returns x^p, the field automorphism that generates all the others
+    def frobenius(self, x):
+        power = 1
+        for i in range(0, self.p):
+            power = self.mul_table[power][x]
+        return power
+
+
+# projective_points()
+#
+# Returns the points of PG(dimension, q) as tuples of length dimension + 1 of elements of FiniteField(q), each scaled
+#  so that its first nonzero coordinate is 1
+def projective_points(q, dimension=3):
+    points = []
+    for index in range(1, q ** (dimension + 1)):
+        vector = []
+        for i in range(0, dimension + 1):
+            vector.append(index % q)
+            index //= q
+        vector.reverse()
+        first = [x for x in vector if x != 0][0]
+        if first == 1:
+            points.append(tuple(vector))
+    return points
+
+
+# normalize()
+#
+# Scales a nonzero vector over a FiniteField so that its first nonzero coordinate is 1
+def normalize(vector, field):
+    first = [x for x in vector if x != 0][0]
+    inverse = field.inverse_table[first]
+    return tuple(field.mul_table[x][inverse] for x in vector)
+
+
+# symplectic_form()
+#
+# The alternating form x0 y1 - x1 y0 + x2 y3 - x3 y2 over a FiniteField
+def symplectic_form(x, y, field):
+    add = field.add_table
+    multiply = field.mul_table
+    minus = field.neg_table
+    return add[add[multiply[x[0]][y[1]]][minus[multiply[x[1]][y[0]]]]][
+        add[multiply[x[2]][y[3]]][minus[multiply[x[3]][y[2]]]]]
+
+
+# symplectic_quadrangle()
+#
+# Returns (points, lines) of the generalized quadrangle W(q) for a prime power q: points is a list of vectors (see
+#  projective_points()) and lines is a list of sorted tuples of indices into points
+def symplectic_quadrangle(q):
+    field = FiniteField(q)
+    add = field.add_table
+    multiply = field.mul_table
+    points = projective_points(q)
+    index = dict((point, position) for position, point in enumerate(points))
+
+    lines = []
+    # collinear[i] is every point on a line through point i found so far, so each line is only built once
+    collinear = [set() for point in points]
+    for i in range(0, len(points)):
+        for j in range(i + 1, len(points)):
+            x = points[i]
+            y = points[j]
+            if j in collinear[i] or symplectic_form(x, y, field) != 0:
+                continue
+            line = set([i, j])
+            for a in range(1, q):
+                for b in range(1, q):
+                    line.add(index[normalize([add[multiply[a][x[k]]][multiply[b][y[k]]] for k in range(0, 4)],
+                                             field)])
+            for point in line:
+                collinear[point].update(line)
+            lines.append(tuple(sorted(line)))
+    return points, sorted(lines)
+
+
+# incidence_graph()
+#
+# Returns the point-line incidence graph of an incidence structure as a networkx graph. Points are vertices
+#  0..len(points) - 1 and lines are the vertices after them.
+#
+# lines A list of tuples of point indices; see symplectic_quadrangle()
+def incidence_graph(point_count, lines):
+    incidence = nx.Graph()
+    incidence.add_nodes_from(range(0, point_count + len(lines)))
+    for position, line in enumerate(lines):
+        for point in line:
+            incidence.add_edge(point, point_count + position)
+    return incidence
+
+
+# gq_incidence_graph()
+#
+# Returns the incidence graph of W(q) for a prime power q: (q + 1)-regular on 2(q + 1)(q^2 + 1) vertices. q = 2 gives
+#  45 edges on 30 vertices, q = 3 gives 160 edges on 80 vertices and q = 4 gives 425 edges on 170 vertices.
+def gq_incidence_graph(q):
+    points, lines = symplectic_quadrangle(q)
+    return incidence_graph(len(points), lines)
+
+
+# find_polarity()
+#
+# Searches for a polarity of an incidence structure whose points and lines are equinumerous by backtracking.
+#
+# A polarity maps each point p to a line image[p] such that p is on image[p'] exactly when p' is on image[p]. Each
+#  step assigns the unassigned point with the fewest lines left that are consistent with every assigned point, the
+#  same fail-first rule as BranchAndBound.branch_pair().
+#
+# lines A list of tuples of point indices; see symplectic_quadrangle()
+#
+# Returns the list image, or None if there is no polarity
+def find_polarity(point_count, lines):
+    line_sets = [frozenset(line) for line in lines]
+    image = [None] * point_count
+    used = [False] * len(lines)
+    assigned = []
+
+    def candidates(p):
+        return [line for line in range(0, len(lines)) if not used[line] and
+                all((other in line_sets[line]) == (p in line_sets[image[other]]) for other in assigned)]
+
+    def assign():
+        if len(assigned) == point_count:
+            return True
+        best = None
+        for p in range(0, point_count):
+            if image[p] is None:
+                lines_left = candidates(p)
+                if best is None or len(lines_left) < len(best[1]):
+                    best = (p, lines_left)
+                if not lines_left:
+                    return False
+        p, lines_left = best
+        for line in lines_left:
+            image[p] = line
+            used[line] = True
+            assigned.append(p)
+            if assign():
+                return True
+            assigned.pop()
+            used[line] = False
+        image[p] = None
+        return False
+
+    if point_count != len(lines) or not assign():
+        return None
+    return image
+
+
+# symplectic_polarity()
+#
+# Returns a polarity of W(q) as find_polarity() does, for q an odd power of 2, and None for any other q
+#
+# points, lines W(q); see symplectic_quadrangle()
+#
+# In characteristic 2 the map sending the line through points x and y to the point with Pluecker coordinates
+#  (p02, p13, p03, p12), where pij = xi yj + xj yi, is a duality of W(q): a bijection from lines to points that
+#  preserves incidence. Following its inverse by a power of the Frobenius automorphism (see FiniteField.frobenius())
+#  maps points to lines and preserves incidence too; when q = 2^(2e + 1), raising the coordinates to the power 2^(e + 1)
+#  gives a polarity. Rather than rely on that, every power is tried and checked against the definition.
+def symplectic_polarity(q, points, lines):
+    field = FiniteField(q)
+    if field.p != 2:
+        return None
+    add = field.add_table
+    multiply = field.mul_table
+    index = dict((point, position) for position, point in enumerate(points))
+
+    def pluecker(x, y, i, j):
+        return add[multiply[x[i]][y[j]]][multiply[x[j]][y[i]]]
+
+    dual = {}
+    for position, line in enumerate(lines):
+        x = points[line[0]]
+        y = points[line[1]]
+        coordinates = (pluecker(x, y, 0, 2), pluecker(x, y, 1, 3), pluecker(x, y, 0, 3), pluecker(x, y, 1, 2))
+        dual[index[normalize(coordinates, field)]] = position
+
+    line_sets = [frozenset(line) for line in lines]
+    conjugate = range(0, len(points))
+    for power in range(0, field.k):
+        image = [dual[point] for point in conjugate]
+        if all(p in line_sets[image[other]] for p in range(0, len(points)) for other in lines[image[p]]):
+            return image
+        conjugate = [index[tuple(field.frobenius(x) for x in points[point])] for point in conjugate]
+    return None
+
+
+# gq_polarity_graph()
+#
+# Returns the polarity graph of W(q) as a networkx graph, or None unless q is an odd power of 2 (see
+#  symplectic_polarity()). Points p and p' are adjacent when p is on the image of p'; the absolute points, which lie on
+#  their own image, would get loops, which are dropped, and have degree q instead of q + 1. q = 2 gives 20 edges on 15
+#  vertices and q = 8 gives 2600 edges on 585 vertices.
+def gq_polarity_graph(q):
+    points, lines = symplectic_quadrangle(q)
+    image = symplectic_polarity(q, points, lines)
+    if image is None:
+        return None
+
+    polarity = nx.Graph()
+    polarity.add_nodes_from(range(0, len(points)))
+    for p in range(0, len(points)):
+        for other in lines[image[p]]:
+            if other != p:
+                polarity.add_edge(p, other)
+    return polarity
+
+
+# densest_subgraph()
+#
+# Returns the subgraph on size vertices left after repeatedly deleting a vertex of least degree, relabelled
+#  0..size - 1. Deleting vertices never adds a cycle, so a seed that follows the rules gives one for every smaller size.
+#
+# seed A networkx graph
+def densest_subgraph(seed, size):
+    remaining = seed.copy()
+    while remaining.number_of_nodes() > size:
+        vertex = min(remaining.nodes(), key=lambda node: (remaining.degree(node), node))
+        remaining.remove_node(vertex)
+    return nx.convert_node_labels_to_integers(remaining, ordering='sorted')
+
+
+# grown_subgraph()
+#
+# Returns the subgraph on size vertices grown from start by repeatedly adding the vertex with the most neighbours
+#  already in it, ties going to the vertex of least degree, relabelled 0..size - 1
+#
+# Peeling a large sparse seed down with densest_subgraph() leaves its vertices spread out, so few of their edges
+#  survive; growing keeps them together. From the absolute points of the W(8) polarity graph it keeps 64 edges on 40
+#  vertices where peeling keeps 61.
+#
+# seed A networkx graph
+def grown_subgraph(seed, size, start):
+    chosen = set([start])
+    # inside[v] is how many neighbours v has in chosen, for the vertices outside chosen that have any
+    inside = {}
+    vertex = start
+    while True:
+        inside.pop(vertex, None)
+        for neighbour in seed[vertex]:
+            if neighbour not in chosen:
+                inside[neighbour] = inside.get(neighbour, 0) + 1
+        if len(chosen) == size:
+            break
+        # a vertex with no neighbours in chosen is only taken when every vertex left has none
+        candidates = inside or [node for node in seed.nodes() if node not in chosen]
+        vertex = max(candidates, key=lambda node: (inside.get(node, 0), -seed.degree(node), -node))
+        chosen.add(vertex)
+    return nx.convert_node_labels_to_integers(seed.subgraph(chosen), ordering='sorted')
+
+
+# Constructions built so far by construction(), keyed by (kind, q)
+constructions = {}
+
+
+# construction()
+#
+# Returns gq_polarity_graph(q) if kind is 'polarity' or gq_incidence_graph(q) if it's 'incidence', building it on the
+#  first call only; W(8) takes a few seconds
+def construction(kind, q):
+    if (kind, q) not in constructions:
+        if kind == 'polarity':
+            constructions[kind, q] = gq_polarity_graph(q)
+        else:
+            constructions[kind, q] = gq_incidence_graph(q)
+    return constructions[kind, q]
+
+
+# seed_graph()
+#
+# Returns the densest seed on n vertices these constructions give, as a graph_class (an OptimizedGraph by default):
+#  the polarity graph of W(2), the incidence graphs of W(q) for every prime power q up to the first whose incidence
+#  graph has n vertices, and for n > 15 the polarity graph of W(8), each cut down to n vertices by densest_subgraph()
+#  and by grown_subgraph() from each of its vertices of least degree, whichever keeps the most edges
+#
+# W(2)'s polarity graph is extremal on 15 vertices, and up to there W(8)'s gives nothing denser, so the 585 vertex
+#  graph isn't built or grown from for small n. Past 15 it's the densest for most n; e.g. 64 edges on 40 vertices
+#  against 62 from W(3)'s incidence graph.
+def seed_graph(n, graph_class=OptimizedGraph):
+    seeds = [construction('polarity', 2)]
+    q = 2
+    while len(seeds) == 1 or seeds[-1].number_of_nodes() < n:
+        if is_prime_power(q):
+            seeds.append(construction('incidence', q))
+        q += 1
+    if n > 15:
+        seeds.append(construction('polarity', 8))
+
+    subgraphs = []
+    for seed in seeds:
+        if seed.number_of_nodes() < n:
+            continue
+        subgraphs.append(densest_subgraph(seed, n))
+        least = min(seed.degree(node) for node in seed.nodes())
+        for start in seed.nodes():
+            if seed.degree(start) == least:
+                subgraphs.append(grown_subgraph(seed, n, start))
+    return to_optimized_graph(max(subgraphs, key=lambda subgraph: subgraph.number_of_edges()), graph_class)
+
+
+# to_optimized_graph()
+#
+# Converts a networkx graph to an OptimizedGraph (or another graph_class with the same interface), relabelling its
+#  nodes 0..n-1 in the order of graph.nodes()
+def to_optimized_graph(seed, graph_class=OptimizedGraph):
+    index = dict((node, position) for position, node in enumerate(seed.nodes()))
+    optimized = graph_class(seed.number_of_nodes())
+    for a, b in seed.edges():
+        optimized.add_edge(index[a], index[b])
+    return optimized
+
+
+# test()
+#
+# Checks the sizes of the constructions and that they follow the rules
+def test():
+    print 'Testing FiniteField'
+    for q in (2, 3, 4, 5, 7, 8, 9):
+        field = FiniteField(q)
+        add = field.add_table
+        multiply = field.mul_table
+        for x in range(0, q):
+            assert add[x][field.neg_table[x]] == 0
+            assert multiply[x][1] == x and multiply[x][0] == 0
+            assert x == 0 or multiply[x][field.inverse_table[x]] == 1
+            for y in range(0, q):
+                assert multiply[x][y] == multiply[y][x]
+                for z in range(0, q):
+                    assert multiply[multiply[x][y]][z] == multiply[x][multiply[y][z]]
+                    assert multiply[x][add[y][z]] == add[multiply[x][y]][multiply[x][z]]
+        assert sorted(field.frobenius(x) for x in range(0, q)) == range(0, q)
+    for q in (0, 1, 6, 12):
+        assert not is_prime_power(q)
+        try:
+            FiniteField(q)
+            assert False
+        except ValueError:
+            pass
+    print 'Passed.'
+
+    print 'Testing gq_incidence_graph()'
+    for q, vertices, edges in ((2, 30, 45), (3, 80, 160), (4, 170, 425), (5, 312, 936)):
+        incidence = gq_incidence_graph(q)
+        assert incidence.number_of_nodes() == vertices
+        assert incidence.number_of_edges() == edges
+        assert all(incidence.degree(node) == q + 1 for node in incidence.nodes())
+        assert graph.find_forbidden_cycle(incidence) is None
+    print 'Passed.'
+
+    print 'Testing gq_polarity_graph()'
+    points, lines = symplectic_quadrangle(2)
+    assert find_polarity(len(points), lines) is not None
+    for q, vertices, edges in ((2, 15, 20), (8, 585, 2600)):
+        polarity = construction('polarity', q)
+        assert polarity.number_of_nodes() == vertices
+        assert polarity.number_of_edges() == edges
+        # q^2 + 1 absolute points lose their loop
+        assert sorted(set(polarity.degree(node) for node in polarity.nodes())) == [q, q + 1]
+        assert graph.find_forbidden_cycle(polarity) is None
+    assert to_optimized_graph(construction('polarity', 2)).does_follow_rules()
+    assert gq_polarity_graph(3) is None
+    assert gq_polarity_graph(4) is None
+    print 'Passed.'
+
+    print 'Testing densest_subgraph() and grown_subgraph()'
+    incidence = gq_incidence_graph(2)
+    for size in range(1, 31):
+        for subgraph in (densest_subgraph(incidence, size), grown_subgraph(incidence, size, size - 1)):
+            assert subgraph.number_of_nodes() == size
+            assert sorted(subgraph.nodes()) == range(0, size)
+            assert to_optimized_graph(subgraph).does_follow_rules()
+    print 'Passed.'
+
+    print 'Testing seed_graph()'
+    # s(n) for n = 10..15; the polarity graph is extremal at 15 vertices
+    edge_count = lambda seed: sum(len(neighbours) for neighbours in seed.neighbours) // 2
+    for n, size in zip(range(10, 16), (12, 13, 15, 17, 18, 20)):
+        seed = seed_graph(n)
+        assert seed.does_follow_rules()
+        assert size - 3 <= edge_count(seed) <= size
+    assert edge_count(seed_graph(15)) == 20
+    # small seeds don't need W(8)
+    constructions.clear()
+    seed_graph(15)
+    assert ('polarity', 8) not in constructions
+    # grown from an absolute point of W(8)'s polarity graph; local_search.LocalSearch gets it to 73 in a minute
+    seed = seed_graph(40)
+    assert seed.does_follow_rules()
+    assert edge_count(seed) == 64
+    print 'Passed.'
+
+
+# If somebody ever runs this file, invoke test()
+if __name__ == '__main__':
+    test()